@@ -0,0 +1,91 @@
+"""
+Compare building the drive service per call with the shared DriveClient.
+
+Run from the repository root:
+    python benchmarks/drive_client_benchmark.py --calls 50
+    python benchmarks/drive_client_benchmark.py --calls 20 --live
+
+Without --live a temporary token is used and only the construction cost is measured.
+With --live the credentials from config/ are used and each call lists one file in drive.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=import-error,wrong-import-position
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from drive_client import DriveClient
+
+SCOPES = ['https://www.googleapis.com/auth/drive']
+
+
+def _write_fake_token(directory: str) -> str:
+    token_path = os.path.join(directory, "token.json")
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    with open(token_path, "w", encoding="utf-8") as token:
+        json.dump({
+            "token": "benchmark",
+            "refresh_token": "benchmark",
+            "client_id": "benchmark",
+            "client_secret": "benchmark",
+            "scopes": SCOPES,
+            "expiry": expiry.isoformat() + "Z",
+        }, token)
+    return token_path
+
+
+def _measure(name: str, calls: int, get_service, live: bool):
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        service = get_service()
+        if live:
+            # pylint: disable=maybe-no-member
+            service.files().list(pageSize=1, fields="files(id)").execute()
+        durations.append(time.perf_counter() - start)
+    print(f"{name:10} first {durations[0] * 1000:8.1f} ms  "
+          f"p50 {statistics.median(durations) * 1000:8.1f} ms  "
+          f"mean {statistics.mean(durations) * 1000:8.1f} ms  "
+          f"total {sum(durations):6.2f} s")
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--live", action="store_true",
+        help="use config/ credentials and call the drive api")
+    args = parser.parse_args()
+
+    if args.live:
+        import drive  # pylint: disable=import-outside-toplevel
+        load_credentials = drive._get_credentials  # pylint: disable=protected-access
+        _measure("per call", args.calls,
+            lambda: build('drive', 'v3', credentials=load_credentials()), True)
+        _measure("shared", args.calls, DriveClient(load_credentials).service, True)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        token_path = _write_fake_token(directory)
+
+        def load_credentials():
+            return Credentials.from_authorized_user_file(token_path, SCOPES)
+
+        _measure("per call", args.calls,
+            lambda: build('drive', 'v3', credentials=load_credentials()), False)
+        _measure("shared", args.calls, DriveClient(load_credentials).service, False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Local stand-in for a telegram-bot-api server in local mode.
+
+getFile answers with the local path of a file from a manifest, like the
+telegram-bot-api server does for files on its volume. getMe, sendMessage and
+editMessageText answer with synthetic objects, every other method with true.
+GET /_stats returns the number of calls per method.
+
+Updates posted as json list to /_push are answered by getUpdates with long
+polling, or sent to the webhook registered by setWebhook with its secret token
+and up to max_connections requests at once. GET /_latencies returns the seconds
+from the push of each file to its first getFile call, which is when a handler
+of the bot started on it.
+
+Run from the repository root:
+    python benchmarks/fake_bot_api.py --port 8081 --manifest var/benchmark/manifest.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs
+
+# Seconds the webhook of the bot may take to come up before an update is dropped.
+WEBHOOK_RETRY_SECONDS = 10
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+
+class FakeBotApi:
+    """
+    Bot api methods used by the bot, answered from a manifest of local files.
+    Args: Dictionary of file id to file_unique_id, file_size and file_path, and the latency
+    """
+    def __init__(self, manifest: dict, latency: float = 0):
+        self.manifest = manifest
+        self.latency = latency
+        self.calls = {}
+        self._message_ids = iter(range(1, 2 ** 31))
+        self._lock = threading.Lock()
+        self._updates = []
+        self._update_ids = iter(range(1, 2 ** 31))
+        self._new_updates = threading.Condition(self._lock)
+        self._pushed = {}
+        self.latencies = {}
+        self._webhook = None
+        self._webhook_executor = None
+
+    def push(self, updates: list):
+        """
+        Queue updates for getUpdates or send them to the webhook.
+        """
+        now = time.time()
+        with self._lock:
+            for update in updates:
+                update["update_id"] = next(self._update_ids)
+                message = update.get("message") or {}
+                for kind in ("document", "video"):
+                    if kind in message:
+                        self._pushed[message[kind]["file_id"]] = now
+            if self._webhook is None:
+                self._updates.extend(updates)
+                self._new_updates.notify_all()
+                return
+            webhook, executor = self._webhook, self._webhook_executor
+        for update in updates:
+            executor.submit(self._send, webhook, update)
+
+    @staticmethod
+    def _send(webhook: dict, update: dict):
+        request = urllib.request.Request(
+            webhook["url"], data=json.dumps(update).encode("utf-8"), headers={
+                "Content-Type": "application/json",
+                "X-Telegram-Bot-Api-Secret-Token": webhook["secret_token"],
+            }
+        )
+        deadline = time.time() + WEBHOOK_RETRY_SECONDS
+        while True:
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                return
+            except (urllib.error.URLError, ConnectionError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        deadline = time.time() + float(params.get("timeout") or 0)
+        with self._lock:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates and time.time() < deadline:
+                self._new_updates.wait(deadline - time.time())
+            return self._updates[:int(params.get("limit") or 100)]
+
+    def _set_webhook(self, params: dict):
+        with self._lock:
+            if self._webhook_executor is not None:
+                self._webhook_executor.shutdown(wait=False)
+            self._webhook = None
+            self._webhook_executor = None
+            if params.get("url"):
+                self._webhook = {"url": params["url"], "secret_token": params.get("secret_token", "")}
+                self._webhook_executor = ThreadPoolExecutor(int(params.get("max_connections") or 40))
+
+    def call(self, method: str, params: dict) -> tuple:
+        """
+        Returns: HTTP status and the bot api response
+        """
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            message_id = next(self._message_ids)
+            if method == "getFile" and params.get("file_id") in self._pushed:
+                self.latencies.setdefault(
+                    params["file_id"], time.time() - self._pushed[params["file_id"]]
+                )
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        if method in ("setWebhook", "deleteWebhook"):
+            self._set_webhook(params)
+            return 200, {"ok": True, "result": True}
+        if method == "getFile":
+            file = self.manifest.get(params.get("file_id"))
+            if file is None:
+                return 400, {"ok": False, "error_code": 400,
+                    "description": "Bad Request: invalid file_id"}
+            return 200, {"ok": True, "result": {"file_id": params["file_id"], **file}}
+        if method in ("sendMessage", "editMessageText"):
+            return 200, {"ok": True, "result": {
+                "message_id": int(params.get("message_id", message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0) or 0), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }}
+        return 200, {"ok": True, "result": True}
+
+
+def make_handler(bot_api: FakeBotApi) -> type:
+    """
+    Returns: Request handler class serving the fake bot api
+    """
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Answers /bot<token>/<method> with json or form parameters.
+        """
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+        def _respond(self, status: int, result: dict):
+            payload = json.dumps(result).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            if self.path == "/_stats":
+                self._respond(200, bot_api.calls)
+                return
+            if self.path == "/_latencies":
+                self._respond(200, bot_api.latencies)
+                return
+            if self.path == "/_push":
+                bot_api.push(json.loads(body))
+                self._respond(200, {"ok": True})
+                return
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("application/json"):
+                params = json.loads(body or b"{}")
+            else:
+                params = {key: values[0] for key, values in
+                    parse_qs(body.decode("utf-8")).items()}
+            method = self.path.rstrip("/").rsplit("/", 1)[-1].split("?")[0]
+            self._respond(*bot_api.call(method, params))
+
+        do_GET = do_POST = _handle
+
+    return Handler
+
+
+def serve(bot_api: FakeBotApi, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve the fake bot api in a background thread.
+    Returns: The running server, its port is server.server_address[1]
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(bot_api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """
+    Run the fake bot api until it is interrupted.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    with open(args.manifest, "r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+        make_handler(FakeBotApi(manifest, args.latency_ms / 1000)))
+    print(f"Fake bot api on http://127.0.0.1:{args.port}/bot")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
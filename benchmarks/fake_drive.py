@@ -0,0 +1,402 @@
+"""
+Local stand-in for the Google Drive v3 endpoints used by the bot.
+
+Serves files.list with q and pagination, files.create with metadata or resumable
+media, files.copy, files.get, files.update, files.delete and batch requests.
+GET /_stats returns the number of requests per api method.
+Latency, bandwidth, a request rate limit and random failures are configurable.
+
+Run from the repository root:
+    python benchmarks/fake_drive.py --port 8765 --latency-ms 50 --error-rate 0.01
+
+Point the bot at it with the DRIVE_API_ENDPOINT config, e.g. "http://localhost:8765/".
+"""
+import argparse
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class FakeDrive:
+    """
+    In-memory drive with the request behaviour of the server.
+    """
+    def __init__(
+            self,
+            latency: float = 0,
+            bandwidth: float = 0,
+            requests_per_second: float = 0,
+            error_rate: float = 0,
+            seed: int = None
+        ):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests_per_second = requests_per_second
+        self.error_rate = error_rate
+        self.files = {}
+        self.uploads = {}
+        self.requests = {}
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = (0, 0)
+
+    def _new_id(self, prefix: str = "file") -> str:
+        return f"{prefix}-{next(self._ids)}"
+
+    def _count(self, method: str):
+        self.requests[method] = self.requests.get(method, 0) + 1
+
+    def admit(self, method: str, body_size: int = 0) -> tuple:
+        """
+        Apply latency, bandwidth, rate limit and failure injection to a request.
+        Returns: Error status and body or None if the request is served
+        """
+        time.sleep(self.latency + (body_size / self.bandwidth if self.bandwidth else 0))
+        with self._lock:
+            self._count(method)
+            if self.requests_per_second:
+                second, count = self._window
+                now = int(time.time())
+                count = count + 1 if now == second else 1
+                self._window = (now, count)
+                if count > self.requests_per_second:
+                    return 403, _error(403, "Rate Limit Exceeded", "userRateLimitExceeded")
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 503, _error(503, "Service Unavailable", "backendError")
+        return None
+
+    @staticmethod
+    def _unescape(value: str) -> str:
+        return value.replace("\\'", "'").replace("\\\\", "\\")
+
+    def _matches(self, file: dict, query: str) -> bool:
+        if "trashed=false" in query.replace(" ", "") and file.get("trashed"):
+            return False
+        for mime_type in re.findall(r"mimeType\s*=\s*'([^']*)'", query):
+            if file["mimeType"] != mime_type:
+                return False
+        parents = re.findall(r"'([^']*)' in parents", query)
+        if parents and not set(parents) & set(file.get("parents", [])):
+            return False
+        for name in re.findall(r"name = '((?:[^'\\]|\\.)*)'", query):
+            if file["name"] != self._unescape(name):
+                return False
+        for part in re.findall(r"name contains '((?:[^'\\]|\\.)*)'", query):
+            if self._unescape(part) not in file["name"]:
+                return False
+        for key, value in re.findall(r"appProperties has \{ key='([^']*)' and value='([^']*)' \}", query):
+            if file.get("appProperties", {}).get(key) != value:
+                return False
+        return True
+
+    def list(self, params: dict) -> tuple:
+        """
+        Returns: Status and body of files.list
+        """
+        query = params.get("q", "")
+        page_size = int(params.get("pageSize", 100))
+        start = int(params.get("pageToken", 0))
+        with self._lock:
+            matches = [file for file in self.files.values() if self._matches(file, query)]
+        result = {"files": matches[start:start + page_size]}
+        if start + page_size < len(matches):
+            result["nextPageToken"] = str(start + page_size)
+        return 200, result
+
+    def _add(self, metadata: dict, md5: str = None, size: int = None) -> dict:
+        file = {
+            "id": self._new_id("folder" if metadata.get("mimeType") == FOLDER_MIME_TYPE else "file"),
+            "name": metadata.get("name", "Untitled"),
+            "mimeType": metadata.get("mimeType", "application/octet-stream"),
+            "parents": metadata.get("parents", []),
+            "appProperties": metadata.get("appProperties", {}),
+            "createdTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "trashed": False,
+        }
+        if "shortcutDetails" in metadata:
+            file["shortcutDetails"] = metadata["shortcutDetails"]
+        if md5 is not None:
+            file["md5Checksum"] = md5
+            file["size"] = str(size)
+        with self._lock:
+            self.files[file["id"]] = file
+        return file
+
+    def create(self, body: dict) -> tuple:
+        """
+        Returns: Status and body of files.create without media
+        """
+        return 200, self._add(body)
+
+    def start_upload(self, body: dict, size: int) -> str:
+        """
+        Start a resumable upload session. Only the hash of the content is kept.
+        Returns: ID of the upload session
+        """
+        upload_id = self._new_id("upload")
+        with self._lock:
+            self.uploads[upload_id] = {
+                "metadata": body, "size": size, "md5": hashlib.md5(), "received": 0
+            }
+        return upload_id
+
+    def upload_chunk(self, upload_id: str, content_range: str, chunk: bytes) -> tuple:
+        """
+        Store a chunk of a resumable upload.
+        Returns: Status, body and the committed range header
+        """
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            return 404, _error(404, "Upload session not found", "notFound"), None
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range or "")
+        if match and int(match.group(1)) == upload["received"]:
+            upload["md5"].update(chunk)
+            upload["received"] += len(chunk)
+        received = upload["received"]
+        if upload["size"] is not None and received >= upload["size"] \
+                or match and match.group(3) != "*" and received >= int(match.group(3)):
+            with self._lock:
+                del self.uploads[upload_id]
+            return 200, self._add(upload["metadata"], upload["md5"].hexdigest(), received), None
+        committed = f"bytes=0-{received - 1}" if received else None
+        return 308, None, committed
+
+    def get(self, file_id: str) -> tuple:
+        """
+        Returns: Status and body of files.get
+        """
+        with self._lock:
+            file = self.files.get(file_id)
+        if file is None:
+            return 404, _error(404, f"File not found: {file_id}.", "notFound")
+        return 200, file
+
+    def copy(self, file_id: str, body: dict) -> tuple:
+        """
+        Returns: Status and body of files.copy
+        """
+        status, source = self.get(file_id)
+        if status != 200:
+            return status, source
+        copied = self._add({**source, **body, "appProperties": body.get("appProperties", {})})
+        for key in ("md5Checksum", "size"):
+            if key in source:
+                copied[key] = source[key]
+        return 200, copied
+
+    def update(self, file_id: str, params: dict, body: dict) -> tuple:
+        """
+        Returns: Status and body of files.update
+        """
+        with self._lock:
+            file = self.files.get(file_id)
+            if file is None:
+                return 404, _error(404, f"File not found: {file_id}.", "notFound")
+            parents = [parent for parent in file["parents"]
+                if parent not in params.get("removeParents", "").split(",")]
+            parents += [parent for parent in params.get("addParents", "").split(",") if parent]
+            file.update(body or {})
+            file["parents"] = parents
+        return 200, file
+
+    def delete(self, file_id: str) -> tuple:
+        """
+        Returns: Status and body of files.delete
+        """
+        with self._lock:
+            if self.files.pop(file_id, None) is None:
+                return 404, _error(404, f"File not found: {file_id}.", "notFound")
+        return 204, None
+
+
+def _error(status: int, message: str, reason: str) -> dict:
+    return {"error": {"code": status, "message": message,
+        "errors": [{"message": message, "domain": "usageLimits", "reason": reason}]}}
+
+
+def _dispatch(drive: FakeDrive, method: str, url: str, headers: dict, body: bytes) -> tuple:
+    """
+    Route one request to the fake drive.
+    Returns: Status, response body and extra response headers
+    """
+    parts = urlsplit(url)
+    params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+    path = parts.path
+    json_body = json.loads(body) if body and headers.get("content-type", "").startswith(
+        "application/json") else {}
+
+    if path.endswith("/upload/drive/v3/files") and method == "POST":
+        rejected = drive.admit("drive.files.create")
+        if rejected:
+            return (*rejected, {})
+        size = headers.get("x-upload-content-length")
+        upload_id = drive.start_upload(json_body, int(size) if size else None)
+        host = headers.get("host", "localhost")
+        return 200, None, {"Location": f"http://{host}/upload/drive/v3/files?upload_id={upload_id}"}
+    if path.endswith("/upload/drive/v3/files") and method == "PUT":
+        rejected = drive.admit("drive.files.create", len(body))
+        if rejected:
+            return (*rejected, {})
+        status, result, committed = drive.upload_chunk(
+            params.get("upload_id"), headers.get("content-range"), body
+        )
+        return status, result, {"Range": committed} if committed else {}
+
+    match = re.match(r".*/drive/v3/files(?:/([^/]+))?(/copy)?$", path)
+    if match is None:
+        return 404, _error(404, f"Unknown path {path}", "notFound"), {}
+    file_id, copy = match.groups()
+    if file_id is None and method == "GET":
+        name = "drive.files.list"
+    elif file_id is None and method == "POST":
+        name = "drive.files.create"
+    elif copy:
+        name = "drive.files.copy"
+    else:
+        name = {"GET": "drive.files.get", "PATCH": "drive.files.update",
+            "DELETE": "drive.files.delete"}.get(method, method)
+    rejected = drive.admit(name)
+    if rejected:
+        return (*rejected, {})
+    if name == "drive.files.list":
+        return (*drive.list(params), {})
+    if name == "drive.files.create":
+        return (*drive.create(json_body), {})
+    if name == "drive.files.copy":
+        return (*drive.copy(file_id, json_body), {})
+    if name == "drive.files.get":
+        return (*drive.get(file_id), {})
+    if name == "drive.files.update":
+        return (*drive.update(file_id, params, json_body), {})
+    if name == "drive.files.delete":
+        return (*drive.delete(file_id), {})
+    return 405, _error(405, f"Method {method} not allowed", "badRequest"), {}
+
+
+def _dispatch_batch(drive: FakeDrive, content_type: str, body: bytes) -> tuple:
+    """
+    Answer a multipart/mixed batch request part by part.
+    Returns: Response body and its content type
+    """
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1)
+    responses = []
+    for part in body.decode("utf-8").split(f"--{boundary}")[1:]:
+        if part.startswith("--"):
+            break
+        part_headers, _, request = part.lstrip("\r\n").partition("\r\n\r\n")
+        if not request:
+            part_headers, _, request = part.lstrip("\n").partition("\n\n")
+        content_id = re.search(r"Content-ID: <(.*)>", part_headers, re.IGNORECASE).group(1)
+        request_head, _, request_body = request.replace("\r\n", "\n").partition("\n\n")
+        request_line, *header_lines = request_head.split("\n")
+        method, url, _ = request_line.split(" ")
+        headers = {}
+        for line in header_lines:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        status, result, _ = _dispatch(
+            drive, method, url, headers, request_body.strip().encode("utf-8")
+        )
+        payload = json.dumps(result) if result is not None else ""
+        responses.append(
+            f"--batch_response\r\nContent-Type: application/http\r\n"
+            f"Content-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+            f"Content-Type: application/json; charset=UTF-8\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n{payload}\r\n"
+        )
+    responses.append("--batch_response--\r\n")
+    return "".join(responses).encode("utf-8"), "multipart/mixed; boundary=batch_response"
+
+
+def make_handler(drive: FakeDrive) -> type:
+    """
+    Returns: Request handler class serving the fake drive
+    """
+    class Handler(BaseHTTPRequestHandler):
+        """
+        HTTP/1.1 handler, so the httplib2 connections of the bot are kept alive.
+        """
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+        def _respond(self, status: int, body: bytes, content_type: str, headers: dict):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            if self.path.startswith("/batch/"):
+                drive.admit("batch")
+                payload, content_type = _dispatch_batch(
+                    drive, self.headers.get("Content-Type", ""), body
+                )
+                self._respond(200, payload, content_type, {})
+                return
+            if self.path == "/_stats":
+                payload = json.dumps({"requests": drive.requests, "files": len(drive.files)})
+                self._respond(200, payload.encode("utf-8"), "application/json", {})
+                return
+            headers = {key.lower(): value for key, value in self.headers.items()}
+            status, result, extra_headers = _dispatch(drive, self.command, self.path, headers, body)
+            payload = json.dumps(result).encode("utf-8") if result is not None else b""
+            self._respond(status, payload, "application/json; charset=UTF-8", extra_headers)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    return Handler
+
+
+def serve(drive: FakeDrive, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve the fake drive in a background thread.
+    Returns: The running server, its port is server.server_address[1]
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(drive))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """
+    Run the fake drive until it is interrupted.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--bandwidth-mbit", type=float, default=0)
+    parser.add_argument("--requests-per-second", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(FakeDrive(
+        args.latency_ms / 1000, args.bandwidth_mbit * 1000 * 1000 / 8,
+        args.requests_per_second, args.error_rate, args.seed
+    )))
+    print(f"Fake drive on http://127.0.0.1:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
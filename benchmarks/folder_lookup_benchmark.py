@@ -0,0 +1,165 @@
+"""
+Compare the protest folder lookup of manage_folder with listing every folder.
+
+Run from the repository root:
+    python benchmarks/folder_lookup_benchmark.py --folders 1000 5000 10000
+
+A synthetic archive with one folder per day and channel is served by an
+in-process fake of files.list. Each page costs a fixed round trip latency
+plus a latency per returned file.
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.makedirs("var", exist_ok=True)
+
+# pylint: disable=import-error,wrong-import-position
+import drive
+from ratelimit import TokenBucket
+
+PROTEST_FOLDER_ID = "protest"
+CHANNELS = ["Wien", "Graz", "Linz", "Salzburg", "Innsbruck"]
+QUERY_ALL = f"mimeType='application/vnd.google-apps.folder' and \
+    ('{PROTEST_FOLDER_ID}' in parents) and trashed=false"
+
+
+class _Request:
+    def __init__(self, result: dict, latency: float):
+        self._result = result
+        self._latency = latency
+
+    def execute(self):
+        """
+        Returns: The response after the simulated latency
+        """
+        time.sleep(self._latency)
+        return self._result
+
+
+class FakeFiles:
+    """
+    files resource answering list requests from an in-memory folder list.
+    Supports the name =, name contains and in parents terms used by the bot.
+    """
+    def __init__(self, folders: list, round_trip: float, per_file: float):
+        self.folders = folders
+        self.round_trip = round_trip
+        self.per_file = per_file
+        self.requests = 0
+
+    @staticmethod
+    def _unescape(value: str) -> str:
+        return value.replace("\\'", "'").replace("\\\\", "\\")
+
+    def _matches(self, query: str) -> list:
+        folders = self.folders
+        for parent_id in re.findall(r"'([^']*)' in parents", query):
+            folders = [folder for folder in folders if parent_id in folder["parents"]]
+        for name in re.findall(r"name = '((?:[^'\\]|\\.)*)'", query):
+            name = self._unescape(name)
+            folders = [folder for folder in folders if folder["name"] == name]
+        for prefix in re.findall(r"name contains '((?:[^'\\]|\\.)*)'", query):
+            prefix = self._unescape(prefix)
+            folders = [folder for folder in folders if folder["name"].startswith(prefix)]
+        return folders
+
+    # pylint: disable=invalid-name,unused-argument
+    def list(self, q: str, pageSize: int = 100, pageToken: str = None, **kwargs):
+        """
+        Returns: Request for one page of the matching folders
+        """
+        self.requests += 1
+        matches = self._matches(q)
+        start = int(pageToken or 0)
+        page = matches[start:start + pageSize]
+        result = {"files": [{"id": folder["id"], "name": folder["name"]} for folder in page]}
+        if start + pageSize < len(matches):
+            result["nextPageToken"] = str(start + pageSize)
+        return _Request(result, self.round_trip + self.per_file * len(page))
+
+
+class FakeService:
+    """
+    Drive service with only the files resource.
+    """
+    def __init__(self, files: FakeFiles):
+        self._files = files
+
+    def files(self):
+        """
+        Returns: The fake files resource
+        """
+        return self._files
+
+
+def _archive(size: int) -> list:
+    folders = []
+    day = date(2026, 10, 18)
+    while len(folders) < size:
+        for channel in CHANNELS:
+            folders.append({
+                "id": f"folder-{len(folders)}",
+                "name": f"{day.isoformat()} Bot {channel}",
+                "parents": [PROTEST_FOLDER_ID],
+            })
+        day -= timedelta(days=1)
+    return folders[:size]
+
+
+def _list_all(message_date: datetime, channel: str) -> str:
+    """
+    The lookup before the targeted query: list every folder and compare the names.
+    """
+    folders = drive._loop_query(QUERY_ALL, page_size=100)  # pylint: disable=protected-access
+    wanted = f"{message_date.date().isoformat()} Bot {channel}"
+    for folder in folders:
+        if folder["name"] == wanted:
+            return folder["id"]
+    return None
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folders", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--round-trip-ms", type=float, default=50)
+    parser.add_argument("--per-file-ms", type=float, default=0.05)
+    args = parser.parse_args()
+
+    drive.config["PROTEST_FOLDER_ID"] = PROTEST_FOLDER_ID
+    # Measure the lookup, not the client side rate limit.
+    drive.retry.request_limit = TokenBucket(1e9, 1e9)
+    drive.folder_cache.get = lambda *key: None
+    drive.folder_cache.put = lambda *key: None
+    drive.search_protest_folder = lambda parent_id, username: drive.ProtestFolder(parent_id)
+    message_date = datetime(2026, 10, 18, 9, 0, tzinfo=timezone.utc)
+
+    print(f"{'folders':>8} {'list all':>20} {'targeted':>20}")
+    for size in args.folders:
+        files = FakeFiles(_archive(size), args.round_trip_ms / 1000, args.per_file_ms / 1000)
+        drive.drive_client.service = lambda files=files: FakeService(files)
+
+        start = time.perf_counter()
+        _list_all(message_date, CHANNELS[0])
+        list_all = (files.requests, time.perf_counter() - start)
+
+        files.requests = 0
+        start = time.perf_counter()
+        drive.manage_folder(message_date, "benchmark", CHANNELS[0])
+        targeted = (files.requests, time.perf_counter() - start)
+
+        print(f"{size:>8} "
+              f"{list_all[0]:>4} pages {list_all[1] * 1000:7.0f} ms "
+              f"{targeted[0]:>4} pages {targeted[1] * 1000:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
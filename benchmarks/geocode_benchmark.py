@@ -0,0 +1,127 @@
+"""
+Count the reverse geocoding lookups of a protest's worth of photos.
+
+The photos of a protest are scattered along a few streets. Their positions are
+reverse geocoded concurrently through maps.Geocoder against a local stub of the
+LocationIQ API, which counts its requests. The benchmark reports the lookups of
+the provider, the cache hits and the time of the whole batch.
+
+Run from the repository root:
+    python benchmarks/geocode_benchmark.py --photos 500 --streets 3
+"""
+import argparse
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.makedirs("var", exist_ok=True)
+
+# pylint: disable=import-error,wrong-import-position
+from geocode_cache import GeocodeCache
+from ratelimit import TokenBucket
+import maps
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320
+
+
+def _serve_stub(latency: float, stats: dict) -> ThreadingHTTPServer:
+    """
+    Serve /v1/reverse like LocationIQ, the road is named after the rounded position.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Answer reverse geocoding requests.
+        """
+        def log_message(self, *_):
+            pass
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            stats["requests"] += 1
+            time.sleep(latency)
+            query = parse_qs(urlsplit(self.path).query)
+            road = f"Straße {float(query['lat'][0]):.3f} {float(query['lon'][0]):.3f}"
+            payload = json.dumps({"address": {"city": "Wien", "road": road}}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _positions(photos: int, streets: int, street_metres: float, seed: int) -> list:
+    """
+    Returns: Positions of the photos along the streets, with a few metres of GPS noise
+    """
+    rng = random.Random(seed)
+    starts = [(48.2082 + rng.uniform(-0.01, 0.01), 16.3738 + rng.uniform(-0.01, 0.01))
+        for _ in range(streets)]
+    metres_per_longitude = METRES_PER_DEGREE * math.cos(math.radians(48.2))
+    positions = []
+    for _ in range(photos):
+        latitude, longitude = rng.choice(starts)
+        along = rng.uniform(0, street_metres)
+        positions.append((
+            latitude + rng.gauss(0, 5) / METRES_PER_DEGREE,
+            longitude + (along + rng.gauss(0, 5)) / metres_per_longitude
+        ))
+    return positions
+
+async def _geocode(geocoder: maps.Geocoder, positions: list) -> list:
+    return await asyncio.gather(*(geocoder.reverse(*position) for position in positions))
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=500)
+    parser.add_argument("--streets", type=int, default=3)
+    parser.add_argument("--street-metres", type=float, default=300)
+    parser.add_argument("--precision", type=int, default=7)
+    parser.add_argument("--requests-per-second", type=float, default=2)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stats = {"requests": 0}
+    server = _serve_stub(args.latency_ms / 1000, stats)
+    with tempfile.TemporaryDirectory() as directory:
+        geocoder = maps.Geocoder(
+            maps.LocationIqProvider("benchmark", f"http://127.0.0.1:{server.server_address[1]}/"),
+            GeocodeCache(os.path.join(directory, "geocode_cache.db"), 10000),
+            args.precision,
+            TokenBucket(args.requests_per_second, 1)
+        )
+        positions = _positions(args.photos, args.streets, args.street_metres, args.seed)
+        start = time.perf_counter()
+        names = asyncio.run(_geocode(geocoder, positions))
+        duration = time.perf_counter() - start
+        start = time.perf_counter()
+        asyncio.run(_geocode(geocoder, positions))
+        cached_duration = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"photos           {len(positions)} on {args.streets} streets of "
+          f"{args.street_metres:.0f} m, {len(set(names))} places")
+    print(f"lookups          {stats['requests']} provider requests for {len(positions)} photos")
+    print(f"first batch      {duration:.2f} s at {args.requests_per_second} requests/s")
+    print(f"cached batch     {cached_duration * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmark of a large file from the telegram-bot-api to the fake drive.
+
+A file of several GB is served over HTTP with range requests. The server drops
+the connection every --disconnect-mb MB, so the download has to resume. The
+downloaded file is then uploaded to the fake drive in resumable chunks. The
+benchmark reports the throughput of both phases, the number of resumed
+downloads and the peak RSS, which should stay flat independent of the file size.
+
+Run from the repository root:
+    python benchmarks/large_file_benchmark.py --size-mb 4096 --disconnect-mb 512
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=import-error,wrong-import-position
+import pipeline_benchmark
+import synthetic_updates
+
+
+def make_handler(file_path: str, disconnect_after: int, stats: dict):
+    """
+    Build the handler class serving the file with range requests.
+    Every response is cut off after disconnect_after bytes, 0 never cuts off.
+    """
+    file_size = os.path.getsize(file_path)
+
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Serve GET requests of the file, honouring the Range header.
+        """
+        def log_message(self, *_):
+            pass
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            stats["requests"] += 1
+            start = 0
+            match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                if start >= file_size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{file_size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{file_size - 1}/{file_size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(file_size - start))
+            self.end_headers()
+            limit = disconnect_after or file_size
+            sent = 0
+            with open(file_path, "rb") as file:
+                file.seek(start)
+                while sent < limit:
+                    chunk = file.read(min(1024 * 1024, limit - sent))
+                    if not chunk:
+                        return
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+            if start + sent < file_size:
+                # Drop the connection in the middle of the body.
+                stats["disconnects"] += 1
+                self.close_connection = True
+
+    return Handler
+
+def _serve_file(file_path: str, disconnect_after: int, stats: dict) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(file_path, disconnect_after, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _md5(file_path: str) -> str:
+    digest = hashlib.md5()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _rate(size: int, duration: float) -> str:
+    return f"{size / 1024 / 1024 / duration:.0f} MB/s in {duration:.1f} s"
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=4096)
+    parser.add_argument("--disconnect-mb", type=int, default=512,
+        help="drop the download connection after this many MB, 0 never drops it")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--bandwidth-mbit", type=float, default=0)
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+        help="override a config value of the bot, e.g. UPLOAD_CHUNK_SIZE_MB=32")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bot-large-file-")
+    source_path = os.path.join(workdir, "source.mp4")
+    synthetic_updates._write_file(  # pylint: disable=protected-access
+        source_path, args.size_mb * 1024 * 1024, os.urandom(64)
+    )
+    stats = {"requests": 0, "disconnects": 0}
+    file_server = _serve_file(source_path, args.disconnect_mb * 1024 * 1024, stats)
+    drive_process, (drive_port, root_folder_id) = pipeline_benchmark._start(  # pylint: disable=protected-access
+        pipeline_benchmark._run_fake_drive, {  # pylint: disable=protected-access
+            "latency": args.latency_ms / 1000,
+            "bandwidth": args.bandwidth_mbit * 1000 * 1000 / 8,
+        }
+    )
+    settings = {
+        "PROTEST_FOLDER_ID": root_folder_id,
+        "DRIVE_API_ENDPOINT": f"http://127.0.0.1:{drive_port}/",
+        "METRICS_PORT": 0,
+    }
+    settings.update(pipeline_benchmark._parse_setting(setting) for setting in args.config)  # pylint: disable=protected-access
+    pipeline_benchmark._prepare_workdir(workdir, settings)  # pylint: disable=protected-access
+
+    os.chdir(workdir)
+    try:
+        # pylint: disable=import-outside-toplevel
+        from google.oauth2.credentials import Credentials
+        import downloader
+        import drive
+        from drive_client import DriveClient
+        drive.drive_client = DriveClient(
+            lambda: Credentials(token="benchmark"), api_endpoint=settings["DRIVE_API_ENDPOINT"]
+        )
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        file_size = os.path.getsize(source_path)
+        target_path = os.path.join(workdir, "var", "downloaded.mp4")
+
+        start = time.perf_counter()
+        asyncio.run(downloader.download(
+            f"http://127.0.0.1:{file_server.server_address[1]}/file/source.mp4",
+            target_path, file_size
+        ))
+        download_duration = time.perf_counter() - start
+        source_md5 = _md5(source_path)
+        intact = _md5(target_path) == source_md5
+
+        start = time.perf_counter()
+        file_id = drive._upload_stream(  # pylint: disable=protected-access
+            drive.drive_client.service(),
+            {"name": "large.mp4", "parents": [root_folder_id]}, target_path, "video/mp4"
+        )
+        upload_duration = time.perf_counter() - start
+        uploaded = drive.drive_client.service().files().get(
+            fileId=file_id, fields="md5Checksum,size", supportsAllDrives=True
+        ).execute()
+    finally:
+        os.chdir(ROOT)
+        file_server.shutdown()
+        drive_process.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"file             {file_size / 1024 / 1024:.0f} MB")
+    print(f"download         {_rate(file_size, download_duration)}, "
+          f"{stats['requests']} requests, {stats['disconnects']} disconnects, "
+          f"{'intact' if intact else 'CORRUPT'}")
+    print(f"upload           {_rate(file_size, upload_duration)}, "
+          f"{'intact' if uploaded.get('md5Checksum') == source_md5 else 'CORRUPT'}")
+    print(f"peak rss         {peak_rss / 1024:.0f} MB ({rss_before / 1024:.0f} MB before)")
+
+
+if __name__ == '__main__':
+    main()
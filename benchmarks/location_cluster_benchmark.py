@@ -0,0 +1,68 @@
+"""
+Measure the cost of assigning files to location clusters as a day grows.
+
+The files of a day are spread over simultaneous blockades a few kilometres apart,
+each with some metres of GPS noise and people walking up to a few hundred metres.
+The benchmark reports the time per assignment and the number of clusters found,
+which should not grow with the number of files.
+
+Run from the repository root:
+    python benchmarks/location_cluster_benchmark.py --files 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=import-error,wrong-import-position
+from location_clusters import METRES_PER_DEGREE, LocationClusters
+
+DAY_SECONDS = 12 * 60 * 60
+
+
+def _files(count: int, blockades: int, spread_metres: float, seed: int) -> list:
+    """
+    Returns: Timestamp, latitude and longitude of the files of a day in time order
+    """
+    rng = random.Random(seed)
+    centres = [(48.2082 + rng.uniform(-0.05, 0.05), 16.3738 + rng.uniform(-0.05, 0.05))
+        for _ in range(blockades)]
+    files = []
+    for index in range(count):
+        latitude, longitude = rng.choice(centres)
+        files.append((
+            index * DAY_SECONDS / count,
+            latitude + rng.gauss(0, spread_metres) / METRES_PER_DEGREE,
+            longitude + rng.gauss(0, spread_metres) / METRES_PER_DEGREE * 1.5
+        ))
+    return files
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--blockades", type=int, default=3)
+    parser.add_argument("--spread-metres", type=float, default=100)
+    parser.add_argument("--cell-metres", type=float, default=500)
+    parser.add_argument("--window-hours", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'files':>8} {'us/file':>8} {'clusters':>9}")
+    for count in args.files:
+        files = _files(count, args.blockades, args.spread_metres, args.seed)
+        clusters = LocationClusters(args.cell_metres, args.window_hours * 60 * 60)
+        start = time.perf_counter()
+        found = {id(clusters.assign("2024-02-14", *file)) for file in files}
+        duration = time.perf_counter() - start
+        print(f"{count:>8} {duration * 1e6 / count:>8.2f} {len(found):>9}")
+
+
+if __name__ == '__main__':
+    main()
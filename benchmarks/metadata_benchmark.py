@@ -0,0 +1,176 @@
+"""
+Measure how many file headers per second the metadata stage of the uploader parses.
+
+A corpus of real-size JPEG, PNG, HEIC and MP4 files with known capture time and
+GPS position is written first. JPEG, PNG and HEIC files carry an EXIF block, the
+MP4 files have their movie box at the end like most phone videos, after the
+media data. The header parser of src/exif.py is timed serially and in a process
+pool, and compared with Pillow reading the EXIF of the images. Every parsed
+result is checked against the values written into the file.
+
+Run from the repository root:
+    python benchmarks/metadata_benchmark.py --files 200 --workers 2
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import io
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=import-error,wrong-import-position
+import PIL.Image
+import exif
+
+KINDS = ("jpeg", "png", "heic", "mp4")
+SIZES_MB = {"jpeg": 4, "png": 8, "heic": 2, "mp4": 40}
+
+
+def _gps_exif(captured: datetime, latitude: float, longitude: float) -> PIL.Image.Exif:
+    image_exif = PIL.Image.Exif()
+    image_exif[exif.DATE_TIME] = captured.strftime("%Y:%m:%d %H:%M:%S")
+    image_exif.get_ifd(exif.EXIF_IFD)[exif.DATE_TIME_ORIGINAL] = \
+        captured.strftime("%Y:%m:%d %H:%M:%S")
+    gps = image_exif.get_ifd(exif.GPS_IFD)
+    for ref_tag, value_tag, value, refs in (
+            (exif.GPS_LATITUDE_REF, exif.GPS_LATITUDE, latitude, "NS"),
+            (exif.GPS_LONGITUDE_REF, exif.GPS_LONGITUDE, longitude, "EW")):
+        degrees = abs(value)
+        minutes = (degrees - int(degrees)) * 60
+        seconds = (minutes - int(minutes)) * 60
+        gps[ref_tag] = refs[0] if value >= 0 else refs[1]
+        gps[value_tag] = (float(int(degrees)), float(int(minutes)), seconds)
+    return image_exif
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def _full_box(kind: bytes, payload: bytes, version: int = 0) -> bytes:
+    return _box(kind, bytes([version, 0, 0, 0]) + payload)
+
+def _heic(exif_block: bytes, size: int) -> bytes:
+    """
+    Returns: Header of a HEIC file with an EXIF item, followed by the item data
+    """
+    ftyp = _box(b"ftyp", b"heic" + b"\0\0\0\0" + b"mif1heic")
+    infe = _full_box(b"infe", struct.pack(">HH4s", 1, 0, b"Exif") + b"\0", version=2)
+    iinf = _full_box(b"iinf", struct.pack(">H", 1) + infe)
+    # The item starts with the offset of the TIFF header behind the Exif\0\0 marker.
+    item = struct.pack(">I", 6) + exif_block
+
+    def meta_box(item_offset: int) -> bytes:
+        iloc = _full_box(b"iloc", bytes([0x44, 0x00]) + struct.pack(
+            ">HHHHII", 1, 1, 0, 1, item_offset, len(item)), version=0)
+        hdlr = _full_box(b"hdlr", b"\0\0\0\0pict" + b"\0" * 13)
+        return _full_box(b"meta", hdlr + iinf + iloc)
+
+    header_size = len(ftyp) + len(meta_box(0)) + 8
+    mdat_payload = item + b"\0" * max(size - header_size - len(item), 0)
+    return ftyp + meta_box(header_size) + struct.pack(">I4s", 8 + len(mdat_payload), b"mdat") \
+        + mdat_payload
+
+def _mp4_moov(captured: datetime, latitude: float, longitude: float) -> bytes:
+    seconds = int((captured - datetime(1904, 1, 1)).total_seconds())
+    mvhd = _full_box(b"mvhd", struct.pack(">IIII", seconds, seconds, 1000, 0) + b"\0" * 80)
+    location = f"{latitude:+08.4f}{longitude:+09.4f}/".encode("ascii")
+    udta = _box(b"udta", _box(b"\xa9xyz", struct.pack(">HH", len(location), 0x15c7) + location))
+    return _box(b"moov", mvhd + udta)
+
+def _write_corpus(directory: str, count: int, seed: int) -> list:
+    """
+    Write the files of the corpus.
+    Returns: List of the path and the expected metadata of each file
+    """
+    rng = random.Random(seed)
+    corpus = []
+    pixels = PIL.Image.new("RGB", (64, 48), (120, 160, 200))
+    for index in range(count):
+        kind = KINDS[index % len(KINDS)]
+        captured = datetime(2024, 2, 14, 7, 0) + timedelta(seconds=rng.randrange(86400))
+        latitude = round(rng.uniform(46.4, 49.0), 4)
+        longitude = round(rng.uniform(9.5, 17.2), 4)
+        image_exif = _gps_exif(captured, latitude, longitude)
+        size = SIZES_MB[kind] * 1024 * 1024
+        path = os.path.join(directory, f"{index}.{kind}")
+        with open(path, "wb") as file:
+            if kind in ("jpeg", "png"):
+                header = io.BytesIO()
+                pixels.save(header, format=kind.upper(), exif=image_exif)
+                file.write(header.getvalue())
+            elif kind == "heic":
+                file.write(_heic(image_exif.tobytes(), size))
+            else:
+                file.write(_box(b"ftyp", b"isom\0\0\0\0isommp42"))
+                file.write(struct.pack(">I4s", 8 + size, b"mdat"))
+                file.seek(size, os.SEEK_CUR)
+                file.write(_mp4_moov(captured, latitude, longitude))
+            # Real-size files, the padding stands for the image or video data.
+            if file.tell() < size:
+                file.seek(size - 1)
+                file.write(b"\0")
+        corpus.append((path, {
+            "captured": captured.isoformat(), "latitude": latitude, "longitude": longitude
+        }))
+    return corpus
+
+def _matches(metadata: dict, expected: dict) -> bool:
+    return metadata.get("captured", "").startswith(expected["captured"]) \
+        and abs(metadata.get("latitude", 0) - expected["latitude"]) < 0.0001 \
+        and abs(metadata.get("longitude", 0) - expected["longitude"]) < 0.0001
+
+def _pillow_exif(path: str) -> int:
+    with PIL.Image.open(path) as image:
+        return len(image.getexif())
+
+def _report(name: str, count: int, duration: float):
+    print(f"{name:<26} {count / duration:8.0f} headers/s ({duration * 1000 / count:.3f} ms each)")
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bot-metadata-")
+    try:
+        corpus = _write_corpus(directory, args.files, args.seed)
+        paths = [path for path, _ in corpus]
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f"corpus                     {len(paths)} files, {total / 1024 / 1024:.0f} MB")
+
+        start = time.perf_counter()
+        results = [exif.read_metadata(path) for path in paths]
+        _report("header parser", len(paths), time.perf_counter() - start)
+        correct = sum(_matches(result, expected) for result, (_, expected) in zip(results, corpus))
+
+        with ProcessPoolExecutor(args.workers) as pool:
+            list(pool.map(int, range(args.workers)))
+            start = time.perf_counter()
+            list(pool.map(exif.read_metadata, paths, chunksize=1))
+            _report(f"header parser, {args.workers} processes", len(paths),
+                time.perf_counter() - start)
+
+        images = [path for path in paths if path.endswith((".jpeg", ".png"))]
+        start = time.perf_counter()
+        for path in images:
+            _pillow_exif(path)
+        _report("pillow getexif (jpeg, png)", len(images), time.perf_counter() - start)
+        print(f"correct                    {correct} of {len(paths)}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+End-to-end load test of the bot against a fake drive and a fake telegram-bot-api.
+
+A seeded workload of document image, document video and video updates is fed
+into the handlers of the bot. The files are downloaded from the fake bot api,
+queued and uploaded to the fake drive by the upload workers. The benchmark
+reports the throughput, the percentiles of the time from update to finished
+upload and the peak RSS of the bot process.
+
+Run from the repository root:
+    python benchmarks/pipeline_benchmark.py --updates 100 --latency-ms 50
+    python benchmarks/pipeline_benchmark.py --config UPLOAD_WORKERS=4 --error-rate 0.05
+
+The bot runs in a temporary working directory with its own config and var folder,
+so the queue and caches in var are not touched.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=import-error,wrong-import-position
+import fake_bot_api
+import fake_drive
+import synthetic_updates
+
+BOT_TOKEN = "123456:benchmark"
+
+
+def _run_fake_drive(options: dict, ready: multiprocessing.Queue):
+    drive = fake_drive.FakeDrive(**options)
+    root = drive.create({"name": "Protest", "mimeType": fake_drive.FOLDER_MIME_TYPE})[1]
+    server = fake_drive.serve(drive)
+    ready.put((server.server_address[1], root["id"]))
+    while True:
+        time.sleep(3600)
+
+def _run_fake_bot_api(manifest: dict, latency: float, ready: multiprocessing.Queue):
+    server = fake_bot_api.serve(fake_bot_api.FakeBotApi(manifest, latency))
+    ready.put(server.server_address[1])
+    while True:
+        time.sleep(3600)
+
+def _start(target, *args) -> tuple:
+    """
+    Start a fake server in its own process, so it does not count to the RSS of the bot.
+    Returns: The process and what the server reported when it was ready
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(*args, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+def _stats(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+def _prepare_workdir(workdir: str, settings: dict):
+    """
+    Copy the config into the working directory and apply the benchmark settings.
+    """
+    os.makedirs(os.path.join(workdir, "config"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "var"), exist_ok=True)
+    with open(os.path.join(ROOT, "config", "config.json"), "r", encoding="utf-8") as file:
+        config = json.load(file)
+    config.update(settings)
+    for name in ("config.json", "config.local.json"):
+        with open(os.path.join(workdir, "config", name), "w", encoding="utf-8") as file:
+            json.dump(config, file, indent=4)
+
+def _parse_setting(setting: str) -> tuple:
+    key, _, value = setting.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+def _percentile(values: list, percent: float) -> float:
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+def _finished_jobs(job_keys: set) -> dict:
+    connection = sqlite3.connect("var/upload_queue.db")
+    try:
+        rows = connection.execute("SELECT job_key, status, updated FROM jobs").fetchall()
+    finally:
+        connection.close()
+    return {
+        job_key: (status, updated) for job_key, status, updated in rows
+        if job_key in job_keys and status in ("done", "failed")
+    }
+
+async def _replay(updates: list, rate: float, timeout: float) -> tuple:
+    """
+    Feed the updates into the bot and wait until every upload job finished.
+    Returns: Send time per job key and status and finish time per job key
+    """
+    # pylint: disable=import-outside-toplevel
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    import bot
+
+    base_url = f"http://127.0.0.1:{os.environ['FAKE_BOT_API_PORT']}/bot"
+    app = ApplicationBuilder().token(BOT_TOKEN).local_mode(True)\
+        .base_url(base_url).base_file_url(base_url).build()
+    bot.add_handlers(app)
+    sent = {}
+    async with app:
+        await app.start()
+        await bot._start_upload_workers(app)  # pylint: disable=protected-access
+        for update_data in updates:
+            update = Update.de_json(update_data, app.bot)
+            sent[f"{update.effective_chat.id}:{update.effective_message.message_id}"] = time.time()
+            await app.update_queue.put(update)
+            if rate:
+                await asyncio.sleep(1 / rate)
+        deadline = time.time() + timeout
+        finished = {}
+        while time.time() < deadline:
+            finished = _finished_jobs(set(sent))
+            if len(finished) == len(sent):
+                break
+            await asyncio.sleep(0.1)
+        await bot._stop_upload_workers(app)  # pylint: disable=protected-access
+        await app.stop()
+    return sent, finished
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--image-mb", type=float, default=4)
+    parser.add_argument("--video-mb", type=float, default=40)
+    parser.add_argument("--video-share", type=float, default=0.3)
+    parser.add_argument("--album-share", type=float, default=0,
+        help="share of images which start an album of document images")
+    parser.add_argument("--rate", type=float, default=0,
+        help="updates per second, 0 sends all updates at once")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--bandwidth-mbit", type=float, default=0)
+    parser.add_argument("--requests-per-second", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--bot-api-latency-ms", type=float, default=5)
+    parser.add_argument("--files", default=None,
+        help="directory of the workload files, kept between runs")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+        help="override a config value of the bot")
+    parser.add_argument("--timeout", type=float, default=3600)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bot-benchmark-")
+    files_directory = os.path.abspath(args.files or os.path.join(workdir, "files"))
+    updates, manifest = synthetic_updates.generate(
+        files_directory, args.updates, args.seed, args.image_mb, args.video_mb, args.video_share,
+        album_share=args.album_share
+    )
+    total_bytes = sum(file["file_size"] for file in manifest.values())
+
+    drive_process, (drive_port, root_folder_id) = _start(_run_fake_drive, {
+        "latency": args.latency_ms / 1000,
+        "bandwidth": args.bandwidth_mbit * 1000 * 1000 / 8,
+        "requests_per_second": args.requests_per_second,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+    })
+    bot_api_process, bot_api_port = _start(
+        _run_fake_bot_api, manifest, args.bot_api_latency_ms / 1000
+    )
+    os.environ["FAKE_BOT_API_PORT"] = str(bot_api_port)
+    settings = {
+        "PROTEST_FOLDER_ID": root_folder_id,
+        "ERROR_MESSAGE_CHAT_ID": "1",
+        "DRIVE_API_ENDPOINT": f"http://127.0.0.1:{drive_port}/",
+        "METRICS_PORT": 0,
+        # The workload files may be reused by the next run.
+        "BOT_API_FILE_CLEANUP": "keep",
+    }
+    settings.update(_parse_setting(setting) for setting in args.config)
+    _prepare_workdir(workdir, settings)
+
+    os.chdir(workdir)
+    try:
+        # pylint: disable=import-outside-toplevel
+        from google.oauth2.credentials import Credentials
+        import drive
+        from drive_client import DriveClient
+        drive.drive_client = DriveClient(
+            lambda: Credentials(token="benchmark"), api_endpoint=settings["DRIVE_API_ENDPOINT"]
+        )
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        sent, finished = asyncio.run(_replay(updates, args.rate, args.timeout))
+        drive_stats = _stats(f"http://127.0.0.1:{drive_port}/_stats")
+        bot_api_stats = _stats(f"http://127.0.0.1:{bot_api_port}/_stats")
+    finally:
+        os.chdir(ROOT)
+        drive_process.terminate()
+        bot_api_process.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = sorted(updated - sent[job_key] for job_key, (_, updated) in finished.items())
+    failed = sum(1 for status, _ in finished.values() if status == "failed")
+    duration = max((updated for _, updated in finished.values()), default=start) - start
+
+    print(f"updates          {len(sent)} ({total_bytes / 1024 / 1024:.0f} MB), "
+          f"{len(finished) - failed} uploaded, {failed} failed, "
+          f"{len(sent) - len(finished)} unfinished")
+    if latencies:
+        print(f"throughput       {len(finished) / duration:.2f} files/s, "
+              f"{total_bytes * 8 / duration / 1000 / 1000:.1f} Mbit/s")
+        print(f"latency          p50 {_percentile(latencies, 50):.2f} s, "
+              f"p95 {_percentile(latencies, 95):.2f} s, "
+              f"p99 {_percentile(latencies, 99):.2f} s, max {latencies[-1]:.2f} s")
+    print(f"peak rss         {peak_rss / 1024:.0f} MB ({rss_before / 1024:.0f} MB before replay)")
+    print(f"drive requests   {drive_stats['requests']}")
+    print(f"bot api calls    {bot_api_stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Measure the bytes saved and the CPU time of the Tickerbiene renditions.
+
+Real-size phone photos, gradients with texture and sensor noise, are written
+as JPEG first, and, if ffmpeg is installed, phone videos from ffmpeg's test
+source. The renditions are rendered with src/renditions.py in a process pool
+of --cpus processes, like the uploader does. The benchmark reports the size of
+the original and the rendition, the bytes saved and the CPU seconds per file,
+and the files per second of the pool.
+
+Run from the repository root:
+    python benchmarks/rendition_benchmark.py --photos 20 --videos 2 --cpus 2
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=import-error,wrong-import-position
+import PIL.Image
+from enums import Media
+import renditions
+
+
+def _write_photo(path: str, width: int, height: int, seed: int):
+    """
+    Write a photo, gradients of the colour channels blended with coarse texture,
+    which survives the downscaling, and fine sensor noise, which does not.
+    """
+    bands = []
+    for band in range(3):
+        gradient = PIL.Image.linear_gradient("L").rotate(seed * 40 + band * 120)
+        texture = PIL.Image.effect_noise((width // 6, height // 6), 60 + band * 10)
+        bands.append(PIL.Image.blend(
+            gradient.resize((width, height)),
+            texture.resize((width, height), PIL.Image.Resampling.BICUBIC),
+            0.5
+        ))
+    noise = PIL.Image.effect_noise((width, height), 12 + seed % 8)
+    bands = [PIL.Image.blend(band, noise, 0.1) for band in bands]
+    PIL.Image.merge("RGB", bands).save(path, "JPEG", quality=92)
+
+def _write_video(path: str, seconds: int, seed: int):
+    """
+    Write a 1080x1920 portrait video with H.264 and AAC like a phone.
+    """
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=1080x1920:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency={440 + seed * 110}:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-b:v", "12M",
+        "-c:a", "aac", "-b:a", "128k", path
+    ], check=True)
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=20)
+    parser.add_argument("--videos", type=int, default=2)
+    parser.add_argument("--video-seconds", type=int, default=10)
+    parser.add_argument("--cpus", type=int, default=2)
+    parser.add_argument("--max-size", type=int, default=1280)
+    parser.add_argument("--image-quality", type=int, default=80)
+    parser.add_argument("--video-crf", type=int, default=28)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        files = []
+        for index in range(args.photos):
+            path = os.path.join(directory, f"photo_{index}.jpg")
+            _write_photo(path, 4000, 3000, index)
+            files.append((path, Media.IMAGE))
+        if args.videos and shutil.which("ffmpeg") is None:
+            print("ffmpeg not found, skip videos")
+        elif args.videos:
+            for index in range(args.videos):
+                path = os.path.join(directory, f"video_{index}.mp4")
+                _write_video(path, args.video_seconds, index)
+                files.append((path, Media.VIDEO))
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(args.cpus) as executor:
+            results = list(executor.map(
+                renditions.render, *zip(*(
+                    (path, media_type.value, directory, args.max_size,
+                        args.image_quality, args.video_crf)
+                    for path, media_type in files
+                ))
+            ))
+        duration = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"{'file':<12} {'original MB':>11} {'rendition MB':>12} {'saved':>6} {'cpu s':>6}")
+    for (path, _), result in zip(files, results):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if result is None:
+            print(f"{name:<12} {'not rendered, copied':>37}")
+            continue
+        print(f"{name:<12} {result['original_size'] / 2**20:>11.2f} "
+              f"{result['size'] / 2**20:>12.2f} "
+              f"{1 - result['size'] / result['original_size']:>6.0%} "
+              f"{result['cpu_seconds']:>6.2f}")
+    rendered = [result for result in results if result is not None]
+    original = sum(result["original_size"] for result in rendered)
+    saved = original - sum(result["size"] for result in rendered)
+    cpu_seconds = sum(result["cpu_seconds"] for result in rendered)
+    print(f"saved            {saved / 2**20:.1f} of {original / 2**20:.1f} MB")
+    print(f"cpu time         {cpu_seconds:.2f} s, "
+          f"{cpu_seconds / max(len(rendered), 1):.3f} s per file")
+    print(f"throughput       {len(files) / duration:.1f} files/s with {args.cpus} processes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Generate a replayable workload of telegram updates with local files.
+
+The same seed gives the same updates, file names and file sizes, so a workload
+can be replayed against different versions of the bot. Each file has unique
+content, so the deduplication of the bot does not skip it.
+
+Run from the repository root:
+    python benchmarks/synthetic_updates.py --updates 100 --directory var/benchmark
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+KINDS = ("document_image", "document_video", "video")
+CHANNELS = ["Wien", "Graz", "Linz", "Salzburg", "Innsbruck"]
+BLOCK_SIZE = 1024 * 1024
+
+
+def _write_file(path: str, size: int, header: bytes):
+    """
+    Write a file of the size. The random header makes the content unique,
+    the rest repeats one block, so large files are written quickly.
+    """
+    block = (header * (BLOCK_SIZE // len(header) + 1))[:BLOCK_SIZE]
+    with open(path, "wb") as file:
+        file.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            file.write(block[:remaining])
+            remaining -= len(block)
+
+def _size(rng: random.Random, mean_mb: float) -> int:
+    # File sizes of phone photos and videos are roughly log-normal.
+    size = rng.lognormvariate(math.log(mean_mb * 1024 * 1024), 0.5)
+    return max(int(size), 1024)
+
+def generate(
+        directory: str,
+        updates: int,
+        seed: int = 1,
+        image_mb: float = 4,
+        video_mb: float = 40,
+        video_share: float = 0.3,
+        users: int = 20,
+        channels: int = 3,
+        album_share: float = 0
+    ) -> tuple:
+    """
+    Write the files of a workload and build its updates.
+    Args: The directory of the files, the number of updates, the seed, the mean image and
+    video size, the share of videos, the number of Tickerbienen and channels and the share
+    of images which start an album of 2 to 10 document images
+    Returns: List of update dictionaries and the getFile manifest of the fake bot api
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    now = int(time.time())
+    update_list = []
+    manifest = {}
+    album = None
+    for index in range(1, updates + 1):
+        if album is not None and album["remaining"] > 0:
+            album["remaining"] -= 1
+            is_video = False
+            user, channel = album["user"], album["channel"]
+        else:
+            album = None
+            is_video = rng.random() < video_share
+            user = rng.randrange(users)
+            channel = rng.randrange(channels)
+            if not is_video and rng.random() < album_share:
+                album = {"id": f"album-{seed}-{index}", "remaining": rng.randint(1, 9),
+                    "user": user, "channel": channel}
+        kind = rng.choice(KINDS[1:]) if is_video else KINDS[0]
+        size = _size(rng, video_mb if is_video else image_mb)
+        extension = "mp4" if is_video else "jpg"
+        file_name = f"{kind}_{index}.{extension}"
+        file_path = os.path.abspath(os.path.join(directory, f"{seed}_{file_name}"))
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != size:
+            _write_file(file_path, size, rng.randbytes(64))
+        file_id = f"file-{seed}-{index}"
+        attachment = {
+            "file_id": file_id,
+            "file_unique_id": f"unique-{seed}-{index}",
+            "file_size": size,
+            "file_name": file_name,
+            "mime_type": "video/mp4" if is_video else "image/jpeg",
+        }
+        manifest[file_id] = {
+            "file_unique_id": attachment["file_unique_id"],
+            "file_size": size,
+            "file_path": file_path,
+        }
+        message = {
+            "message_id": index,
+            "date": now,
+            "chat": {
+                "id": -1000000000000 - channel,
+                "type": "supergroup",
+                "title": CHANNELS[channel % len(CHANNELS)],
+            },
+            "from": {
+                "id": 1000 + user,
+                "is_bot": False,
+                "first_name": f"Biene{user}",
+                "username": f"biene{user}",
+            },
+        }
+        if album is not None:
+            message["media_group_id"] = album["id"]
+        if kind == "video":
+            message["video"] = {**attachment, "width": 1920, "height": 1080, "duration": 30}
+        else:
+            message["document"] = attachment
+        update_list.append({"update_id": index, "message": message})
+    return update_list, manifest
+
+def main():
+    """
+    Write a workload to the directory with its updates.json and manifest.json.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", default="var/benchmark")
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--image-mb", type=float, default=4)
+    parser.add_argument("--video-mb", type=float, default=40)
+    parser.add_argument("--video-share", type=float, default=0.3)
+    parser.add_argument("--album-share", type=float, default=0)
+    args = parser.parse_args()
+
+    update_list, manifest = generate(args.directory, args.updates, args.seed,
+        args.image_mb, args.video_mb, args.video_share, album_share=args.album_share)
+    for name, content in (("updates.json", update_list), ("manifest.json", manifest)):
+        with open(os.path.join(args.directory, name), "w", encoding="utf-8") as file:
+            json.dump(content, file, indent=2)
+    total = sum(file["file_size"] for file in manifest.values())
+    print(f"Wrote {len(update_list)} updates with {total / 1024 / 1024:.0f} MB to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Compare the ingestion latency of long polling and the webhook.
+
+The bot runs with src/bot.py's main() in its own process against the fake
+telegram-bot-api and the fake drive, once per mode. A seeded workload of
+updates is pushed into the fake bot api at a steady rate. With polling the bot
+fetches them with getUpdates, with the webhook the fake bot api sends them
+with the secret token. The latency of an update is the time from its push to
+the first getFile call of its handler. The uploads run at the same time, so
+the handlers compete with them like in production.
+
+Run from the repository root:
+    python benchmarks/webhook_benchmark.py --updates 200 --rate 20
+    python benchmarks/webhook_benchmark.py --modes polling --concurrent-updates 1 16
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=import-error,wrong-import-position,protected-access
+import pipeline_benchmark
+import synthetic_updates
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def _run_bot(workdir: str, environment: dict, drive_endpoint: str):
+    """
+    Run the bot like src/bot.py with the credentials of the fake drive.
+    """
+    os.chdir(workdir)
+    os.environ.update(environment)
+    # pylint: disable=import-outside-toplevel
+    from google.oauth2.credentials import Credentials
+    import drive
+    from drive_client import DriveClient
+    drive.drive_client = DriveClient(
+        lambda: Credentials(token="benchmark"), api_endpoint=drive_endpoint
+    )
+    import bot
+    bot.main()
+
+def _post(url: str, payload) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+def _wait_for(condition, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def _measure(args, mode: str, concurrent_updates: int, updates: list, manifest: dict) -> list:
+    """
+    Run the bot in the mode and push the updates.
+    Returns: Sorted latencies in seconds of the updates which were handled
+    """
+    workdir = tempfile.mkdtemp(prefix="bot-webhook-benchmark-")
+    drive_process, (drive_port, root_folder_id) = pipeline_benchmark._start(
+        pipeline_benchmark._run_fake_drive,
+        {"latency": args.latency_ms / 1000, "seed": args.seed}
+    )
+    bot_api_process, bot_api_port = pipeline_benchmark._start(
+        pipeline_benchmark._run_fake_bot_api,
+        manifest, args.bot_api_latency_ms / 1000
+    )
+    bot_api = f"http://127.0.0.1:{bot_api_port}"
+    drive_endpoint = f"http://127.0.0.1:{drive_port}/"
+    webhook_port = _free_port()
+    pipeline_benchmark._prepare_workdir(workdir, {
+        "PROTEST_FOLDER_ID": root_folder_id,
+        "ERROR_MESSAGE_CHAT_ID": "1",
+        "DRIVE_API_ENDPOINT": drive_endpoint,
+        "METRICS_PORT": 0,
+        "TRACING": False,
+        "BOT_API_FILE_CLEANUP": "keep",
+        "PRECREATE_FOLDERS_DAYS": 0,
+        "CONCURRENT_UPDATES": concurrent_updates,
+        "WEBHOOK_LISTEN": "127.0.0.1",
+        "WEBHOOK_PORT": webhook_port,
+        "WEBHOOK_MAX_CONNECTIONS": args.max_connections,
+    })
+    # Not a daemon, the bot starts the processes of the uploader.
+    bot_process = multiprocessing.Process(target=_run_bot, args=(workdir, {
+        "TELEGRAM_API_TOKEN": pipeline_benchmark.BOT_TOKEN,
+        "BASE_URL": f"127.0.0.1:{bot_api_port}",
+        "UPDATE_MODE": mode,
+        "WEBHOOK_URL": f"http://127.0.0.1:{webhook_port}/telegram",
+    }, drive_endpoint))
+    bot_process.start()
+    try:
+        # The bot is ready once it polls or has registered its webhook.
+        ready_method = "setWebhook" if mode == "webhook" else "getUpdates"
+        if not _wait_for(lambda: ready_method in pipeline_benchmark._stats(
+                f"{bot_api}/_stats"), 60):
+            raise RuntimeError(f"The bot did not start in {mode} mode")
+        for update in updates:
+            _post(f"{bot_api}/_push", [update])
+            time.sleep(1 / args.rate)
+        _wait_for(lambda: len(pipeline_benchmark._stats(
+            f"{bot_api}/_latencies")) == len(updates), args.timeout)
+        latencies = pipeline_benchmark._stats(f"{bot_api}/_latencies")
+    finally:
+        bot_process.terminate()
+        bot_process.join(30)
+        drive_process.terminate()
+        bot_api_process.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return sorted(latencies.values())
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="updates per second")
+    parser.add_argument("--modes", nargs="+", default=["polling", "webhook"],
+        choices=["polling", "webhook"])
+    parser.add_argument("--concurrent-updates", type=int, nargs="+", default=[16])
+    parser.add_argument("--max-connections", type=int, default=40)
+    parser.add_argument("--image-mb", type=float, default=1)
+    parser.add_argument("--video-mb", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--bot-api-latency-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    files_directory = tempfile.mkdtemp(prefix="bot-webhook-files-")
+    try:
+        updates, manifest = synthetic_updates.generate(
+            files_directory, args.updates, args.seed, args.image_mb, args.video_mb
+        )
+        results = [
+            (mode, concurrent_updates,
+                _measure(args, mode, concurrent_updates, updates, manifest))
+            for mode in args.modes for concurrent_updates in args.concurrent_updates
+        ]
+    finally:
+        shutil.rmtree(files_directory, ignore_errors=True)
+
+    print(f"{args.updates} updates at {args.rate:g}/s, "
+          f"bot api latency {args.bot_api_latency_ms:g} ms")
+    print(f"{'mode':<8} {'concurrent':>10} {'handled':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode, concurrent_updates, latencies in results:
+        if not latencies:
+            print(f"{mode:<8} {concurrent_updates:>10} {0:>8}")
+            continue
+        print(f"{mode:<8} {concurrent_updates:>10} {len(latencies):>8} "
+              f"{pipeline_benchmark._percentile(latencies, 50) * 1000:>8.1f} "
+              f"{pipeline_benchmark._percentile(latencies, 95) * 1000:>8.1f} "
+              f"{pipeline_benchmark._percentile(latencies, 99) * 1000:>8.1f} "
+              f"{latencies[-1] * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Asynchronous facade of the drive module for the telegram handlers.
+The blocking drive calls run in a bounded thread pool, so the event loop
+keeps processing updates while folders are searched and files are uploaded.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime
+import functools
+from typing import Callable
+
+# pylint: disable=import-error
+from enums import Media
+import drive
+
+executor = ThreadPoolExecutor(
+    max_workers=drive.config.get("DRIVE_WORKERS", 4),
+    thread_name_prefix="drive"
+)
+
+async def _run(function: Callable, *args, **kwargs):
+    """
+    Run a blocking function in the drive thread pool and await its result.
+    Exceptions of the function are raised in the awaiting coroutine.
+    The function runs in a copy of the context, so its spans belong to the running trace.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, function, *args, **kwargs)
+    )
+
+async def manage_folder(
+        date: datetime, username: str, channel_name: str = None, location: str = None
+    ) -> drive.ProtestFolder:
+    """
+    Search or create the protest folder, see drive.manage_folder.
+    :raises:
+    HttpError: if a connection error occured.
+    """
+    return await _run(drive.manage_folder, date, username, channel_name, location)
+
+async def upload_file_to_folder(
+        name: str, file_path: str,
+        protest_folders: drive.ProtestFolder,
+        media_type: Media,
+        progress: Callable[[int, int], None] = None,
+        job_key: str = None,
+        check_uploaded: bool = False,
+        file_unique_id: str = None,
+        app_properties: dict = None,
+        rendition: Callable[[], dict] = None
+    ):
+    """
+    Upload a file to the protest folder, see drive.upload_file_to_folder.
+    Returns: IDs of the files uploaded
+    :raises:
+    HttpError: if a connection error occured.
+    TypeError: if media type is not found.
+    """
+    return await _run(
+        drive.upload_file_to_folder, name, file_path, protest_folders, media_type, progress,
+        job_key, check_uploaded, file_unique_id, app_properties, rendition
+    )
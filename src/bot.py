@@ -1,25 +1,36 @@
 """
 Telegram bot to automatically upload files from a telegram group to google drive
 """
+import asyncio
+import functools
 import logging
 import os
+import time
 from datetime import datetime
 from datetime import timedelta
 import json
 import re
+import secrets
+from typing import Callable
+from urllib.parse import urlsplit
 
-from googleapiclient.errors import HttpError
-
-from telegram import Update
-from telegram.ext import filters, MessageHandler, ApplicationBuilder, ContextTypes
-from telegram.error import BadRequest
+from telegram import Bot, Update
+from telegram.ext import filters, MessageHandler, Application, ApplicationBuilder, ContextTypes
+from telegram.error import BadRequest, NetworkError
 
 # pylint: disable=import-error
+import httpx
 import pytz
 import helper
-from enums import Media
+from enums import Media, UpdateMode
+import async_drive
+import downloader
 import drive
 import maps
+import metrics
+from progress_message import ProgressMessage
+import tracing
+import uploader
 
 
 with open(drive.CONFIG_FILE_PATH, "r", encoding="utf-8") as config_file:
@@ -33,6 +44,31 @@ logging.basicConfig(
 
 logging.info('Bot started')
 
+# Files of an album arriving within this many seconds of each other are uploaded together.
+ALBUM_WINDOW = drive.config.get("ALBUM_WINDOW_SECONDS", 2)
+_albums = {}
+# Files which are not on the shared telegram-bot-api volume are downloaded to this folder.
+DOWNLOAD_PATH = drive.config.get("DOWNLOAD_PATH", "var/downloads")
+# Files of at least this size get a status message with their progress.
+PROGRESS_MESSAGE_MIN_SIZE = drive.config.get("PROGRESS_MESSAGE_MIN_SIZE_MB", 100) * 1024 * 1024
+_progress_messages = {}
+# The folder trees of the day are created at this time in TIMEZONE for the channels
+# and Tickerbienen seen within PRECREATE_FOLDERS_DAYS, 0 days turns it off.
+PRECREATE_FOLDERS_TIME = drive.config.get("PRECREATE_FOLDERS_TIME", "00:05")
+PRECREATE_FOLDERS_DAYS = drive.config.get("PRECREATE_FOLDERS_DAYS", 7)
+# Updates are fetched by long polling or sent by the telegram-bot-api server to a webhook.
+UPDATE_MODE = UpdateMode(
+    os.environ.get("UPDATE_MODE") or drive.config.get("UPDATE_MODE", UpdateMode.POLLING.value)
+)
+# Updates handled at the same time, so a slow handler does not hold up unrelated messages.
+CONCURRENT_UPDATES = drive.config.get("CONCURRENT_UPDATES", 16)
+WEBHOOK_LISTEN = drive.config.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = drive.config.get("WEBHOOK_PORT", 8443)
+# URL under which the telegram-bot-api server reaches the webhook, e.g. http://bot:8443/telegram
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL") or drive.config.get("WEBHOOK_URL", "")
+# Connections the telegram-bot-api server opens at most to send updates.
+WEBHOOK_MAX_CONNECTIONS = drive.config.get("WEBHOOK_MAX_CONNECTIONS", 40)
+
 def _escape(string_to_update:str) -> None:
     if string_to_update is None:
         logging.warning("Could not update not exisitng username.")
@@ -61,7 +97,7 @@ async def _send_cloud_not_download(
 from https://t\.me/{_escape(update.effective_user.username)} \
 \({_escape(update.effective_user.first_name)} \
 {_escape(update.effective_user.last_name)}\) \
-    because {ex}\.",
+    because {_escape(str(ex))}\.",
             parse_mode="MarkdownV2"
             )
     except BadRequest as error:
@@ -69,39 +105,56 @@ from https://t\.me/{_escape(update.effective_user.username)} \
         await context.bot.send_message(
                 chat_id=config["ERROR_MESSAGE_CHAT_ID"],
                 text=fr"Cloud not *download* {media_type} \
-because {ex}\.",
+because {_escape(str(ex))}\.",
             parse_mode="MarkdownV2"
             )
 
-async def _send_could_not_save(
-        update: Update, context: ContextTypes.DEFAULT_TYPE, 
-        ex: Exception, media_type: Media
-    ) -> None:
+async def _send_could_not_save(bot: Bot, job: dict, ex: Exception) -> None:
+    media_type = Media(job["media_type"])
+    progress = _get_job_progress_message(bot, job)
+    if progress is not None:
+        _progress_messages.pop(job["job_key"], None)
+        await progress.show("could not save")
     try:
-        await context.bot.send_message(
+        await bot.send_message(
                 chat_id=config["ERROR_MESSAGE_CHAT_ID"],
                 text=fr"Cloud not *save* {media_type} \
-from https://t\.me/{_escape(update.effective_user.username)} \
-\({_escape(update.effective_user.first_name)} \
-{_escape(update.effective_user.last_name)}\) \
-because {ex}\.",
+from https://t\.me/{_escape(job['username'])} \
+\({_escape(job['first_name'])} \
+{_escape(job['last_name'])}\) \
+because {_escape(str(ex))}\.",
             parse_mode="MarkdownV2"
         )
     except BadRequest as error:
         logging.exception(error)
-        await context.bot.send_message(
+        await bot.send_message(
                 chat_id=config["ERROR_MESSAGE_CHAT_ID"],
                 text=fr"Cloud not *save* {media_type} \
-because {ex}\.",
+because {_escape(str(ex))}\.",
             parse_mode="MarkdownV2"
             )
-    
 
-async def _send_no_protest_folder(context: ContextTypes.DEFAULT_TYPE) -> None:
-    await context.bot.send_message(
-        chat_id=config["ERROR_MESSAGE_CHAT_ID"],
-        text="Bot received document file but could not create protest folders."
-    )
+async def _send_could_not_save_album(bot: Bot, album: list, failed: list) -> None:
+    job = album[0]
+    failed_names = ", ".join(failed_job["file_name"] for failed_job in failed)
+    try:
+        await bot.send_message(
+                chat_id=config["ERROR_MESSAGE_CHAT_ID"],
+                text=fr"Cloud not *save* {len(failed)} of {len(album)} files of an album \
+from https://t\.me/{_escape(job['username'])} \
+\({_escape(job['first_name'])} \
+{_escape(job['last_name'])}\): {_escape(failed_names)} \
+because {_escape(failed[0]['error'])}\.",
+            parse_mode="MarkdownV2"
+        )
+    except BadRequest as error:
+        logging.exception(error)
+        await bot.send_message(
+                chat_id=config["ERROR_MESSAGE_CHAT_ID"],
+                text=fr"Cloud not *save* {len(failed)} of {len(album)} files of an album \
+because {_escape(failed[0]['error'])}\.",
+            parse_mode="MarkdownV2"
+            )
 
 def _get_username(update: Update)-> str:
     username = update.effective_message.from_user.username
@@ -109,100 +162,240 @@ def _get_username(update: Update)-> str:
         username = update.effective_message.from_user.first_name
     return username
 
-async def _download_video(update: Update, _: ContextTypes.DEFAULT_TYPE) -> bytes:
+def _get_progress_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> ProgressMessage:
+    """
+    Returns: The status message of a large attachment or None for small attachments
+    """
+    attachment = update.effective_message.effective_attachment
+    if (attachment.file_size or 0) < PROGRESS_MESSAGE_MIN_SIZE:
+        return None
+    progress = ProgressMessage(
+        context.bot, config["ERROR_MESSAGE_CHAT_ID"],
+        f"{attachment.file_name} from {_get_username(update)}"
+    )
+    _progress_messages[_get_job_key(update)] = progress
+    return progress
+
+def _get_job_progress_message(bot: Bot, job: dict) -> ProgressMessage:
+    """
+    Returns: The status message of a job, also of a job recovered after a restart,
+    or None if the job has no status message
+    """
+    if job["job_key"] in _progress_messages:
+        return _progress_messages[job["job_key"]]
+    if job.get("status_message_id") is None:
+        return None
+    progress = ProgressMessage(
+        bot, config["ERROR_MESSAGE_CHAT_ID"],
+        f"{job['file_name']} from {job['username']}", job["status_message_id"]
+    )
+    _progress_messages[job["job_key"]] = progress
+    return progress
+
+def _show_upload_progress(bot: Bot, job: dict, bytes_sent: int, total_bytes: int) -> None:
+    progress = _get_job_progress_message(bot, job)
+    if progress is None:
+        return
+    progress.report("uploading", bytes_sent, total_bytes)
+
+async def _show_saved(bot: Bot, job: dict) -> None:
+    progress = _get_job_progress_message(bot, job)
+    if progress is None:
+        return
+    _progress_messages.pop(job["job_key"], None)
+    await progress.show("saved")
+
+async def _download_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """
+    Get the file of the attachment on local disk.
+    In local mode the file is already on the shared telegram-bot-api volume.
+    Only the path is passed on, the upload streams the file from disk.
+    Otherwise the file is downloaded in chunks to DOWNLOAD_PATH.
+    Returns: The local path of the file
+    :raises:
+    NetworkError: if telegram does not hand out the file, e.g. BadRequest because it
+    is too big, or TimedOut while the telegram-bot-api server still fetches a large file.
+    httpx.HTTPError: if the download failed.
+    OSError: if the file cannot be written, e.g. because the disk is full.
+    """
+    attachment = update.effective_message.effective_attachment
+    progress = _get_progress_message(update, context)
+    if progress is not None:
+        await progress.show("downloading", 0, attachment.file_size)
+    with tracing.span("download") as download_span:
+        telegram_file = await attachment.get_file(read_timeout=600)
+        if download_span is not None:
+            download_span.set(file_size=telegram_file.file_size)
+        if os.path.isfile(telegram_file.file_path):
+            return telegram_file.file_path
+        file_name = os.path.basename(urlsplit(telegram_file.file_path).path)
+        file_path = os.path.join(DOWNLOAD_PATH, f"{telegram_file.file_unique_id}_{file_name}")
+        os.makedirs(DOWNLOAD_PATH, exist_ok=True)
+        return await downloader.download(
+            telegram_file.file_path, file_path, telegram_file.file_size,
+            progress=functools.partial(progress.report, "downloading") if progress else None
+        )
+
+async def _download_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     logging.info("Start downloading video %s", update.effective_message.video.file_name)
-    video_file = await update.effective_message.video.get_file(read_timeout=600)
-    with open(video_file.file_path, "rb") as video_stream:
-        downloaded_file = video_stream.read()
+    file_path = await _download_attachment(update, context)
     logging.info("Downloaded video")
-    return downloaded_file
+    return file_path
 
-async def _download_document_file(update: Update) -> bytes:
+async def _download_document_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     logging.info("Start downloading document %s", update.effective_message.document.file_name)
-    document_file = await update.effective_message.document.get_file(read_timeout=600)
-    with open(document_file.file_path, "rb") as document_stream:
-        downloaded_file = document_stream.read()
+    file_path = await _download_attachment(update, context)
     logging.info("Downloaded document")
-    return downloaded_file
+    return file_path
 
-
-async def _upload_video(
-        protest_folders,
-        file_bytes: bytes,
+async def _report_download_failure(
         update: Update,
-        context: ContextTypes.DEFAULT_TYPE,
-    ):
-    logging.info("Start uploading video.")
+        context: ContextTypes.DEFAULT_TYPE, error: Exception, media_type: Media
+    ) -> None:
+    """
+    Report a file which could not be downloaded. NetworkError covers BadRequest
+    "File is too big" and TimedOut of the telegram-bot-api server, OSError a full
+    or read-only download folder.
+    """
+    logging.exception(error)
+    metrics.FILES_FAILED.labels(**_metric_labels(update, media_type)).inc()
+    progress = _progress_messages.pop(_get_job_key(update), None)
+    if progress is not None:
+        await progress.show("could not download")
+    await _send_cloud_not_download(update, context, error, media_type)
+
+
+def _get_channel_name(update: Update) -> str:
     try:
-        # Handle error while creating or searching protest folder.
-        if protest_folders is None:
-            logging.error("Could not find or create protest folders.")
-            await _send_no_protest_folder(context)
-        else:
-            date = _get_date(update)
-            username = _get_username(update)
-            video_filename = update.effective_message.video.file_name
-            file_name = f"{date.isoformat()}_{username}_{video_filename}_COMPRESSED"
-            drive.upload_file_to_folder(file_name, file_bytes, protest_folders, Media.VIDEO)
-            logging.info("Finished upload video %s process", file_name)
-    except HttpError as error:
-        logging.exception(error)
-        await _send_could_not_save(update, context, error, Media.VIDEO)
+        return update.effective_message.chat.title
+    except AttributeError:
+        return None
 
-async def _upload_document_file(
-        protest_folders,
-        file_bytes: bytes,
-        update: Update,
-        context: ContextTypes.DEFAULT_TYPE,
-        media_type: Media
-    ):
-    logging.info("Start uploading document.")
+def _metric_labels(update: Update, media_type: Media) -> dict:
+    return metrics.labels(media_type, _get_channel_name(update))
+
+def _get_job_key(update: Update) -> str:
+    return f"{update.effective_chat.id}:{update.effective_message.message_id}"
+
+def _traced_update(handler: Callable) -> Callable:
+    """
+    Record a handled update as root span of the trace of its upload job.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        with tracing.span(
+                "update", trace_key=_get_job_key(update),
+                job_key=_get_job_key(update), handler=handler.__name__,
+                channel=_get_channel_name(update)
+            ):
+            await handler(update, context)
+    return wrapper
+
+def _enqueue_upload(update: Update, file_path: str, file_name: str, media_type: Media) -> None:
+    """
+    Persist the upload job, the upload workers upload it to google drive.
+    Files of an album are held back until the album is complete.
+    """
+    channel_name = _get_channel_name(update)
+    job = {
+        "job_key": _get_job_key(update),
+        "file_path": file_path,
+        "file_name": file_name,
+        "file_size": os.path.getsize(file_path),
+        "media_type": media_type.value,
+        "date": update.effective_message.date.isoformat(),
+        "username": _get_username(update),
+        "first_name": update.effective_user.first_name,
+        "last_name": update.effective_user.last_name,
+        "channel": channel_name,
+        "file_unique_id": update.effective_message.effective_attachment.file_unique_id,
+        "media_group_id": update.effective_message.media_group_id,
+        "status_message_id": None,
+    }
+    progress = _progress_messages.get(job["job_key"])
+    if progress is not None:
+        job["status_message_id"] = progress.message_id
+        progress.report("waiting for upload")
+    if job["media_group_id"] is not None:
+        # The job is stored right away, a crash in the window does not lose it.
+        job["next_attempt"] = time.time() + ALBUM_WINDOW
+    uploader.upload_queue.enqueue(job)
+    if job["media_group_id"] is not None:
+        _add_to_album(job)
+    uploader.wake()
+
+def _add_to_album(job: dict) -> None:
+    """
+    Hold back the jobs of an album until no further file of the album arrived for
+    ALBUM_WINDOW, so the upload workers start on the whole album together.
+    """
+    uploader.upload_queue.hold_album(job["media_group_id"], job["next_attempt"])
+    album = _albums.setdefault(job["media_group_id"], {})
+    if "flush" in album:
+        album["flush"].cancel()
+    album["flush"] = asyncio.create_task(_flush_album(job, ALBUM_WINDOW))
+
+async def _flush_album(job: dict, delay: float) -> None:
+    """
+    Resolve the protest folder once for the album at the end of its window, so the
+    upload workers find the folder in the cache and upload the files in parallel.
+    This is only an optimisation, the jobs are due at the end of the window anyway
+    and the upload workers resolve the folder themselves.
+    """
+    await asyncio.sleep(delay)
+    media_group_id = job["media_group_id"]
+    _albums.pop(media_group_id, None)
+    logging.info("Album %s is complete", media_group_id)
+    uploader.wake()
+    # With location routing the folder depends on the position of each file.
+    if uploader.LOCATION_ROUTING:
+        return
     try:
-        # Handle error while creating or searching protest folder.
-        if protest_folders is None:
-            logging.error("Could not find or create protest folders.")
-            await _send_no_protest_folder(context)
-        else:
-            date = _get_date(update)
-            username = _get_username(update)
-            document_filename = update.effective_message.document.file_name
-            file_name = f"{date.isoformat()}_{username}_{document_filename}"
-            drive.upload_file_to_folder(file_name, file_bytes, protest_folders, media_type)
-            logging.info("Finished upload document %s process", file_name)
-    except HttpError as ex:
-        logging.debug(ex)
-        logging.error("An connection error occurred: %s", ex)
-        await _send_could_not_save(update, context, ex, media_type)
-    except TypeError as ex:
-        logging.debug(ex)
-        logging.error("An type error occurred: %s", ex)
-        await _send_could_not_save(update, context, ex, media_type)
+        await async_drive.manage_folder(
+            datetime.fromisoformat(job["date"]), job["username"], job["channel"]
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        logging.warning("Could not resolve the folder of album %s: %s", media_group_id, error)
+
+def _cancel_album_flushes() -> None:
+    """
+    Stop resolving the folders of buffered albums, e.g. before the bot stops.
+    Their jobs are already in the queue.
+    """
+    for album in _albums.values():
+        album["flush"].cancel()
+    _albums.clear()
 
+def _get_video_file_name(update: Update) -> str:
+    date = _get_date(update)
+    username = _get_username(update)
+    video_filename = update.effective_message.video.file_name
+    return f"{date.isoformat()}_{username}_{video_filename}_COMPRESSED"
+
+def _get_document_file_name(update: Update) -> str:
+    date = _get_date(update)
+    username = _get_username(update)
+    document_filename = update.effective_message.document.file_name
+    return f"{date.isoformat()}_{username}_{document_filename}"
+
+@_traced_update
 async def document_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """An uncompressed image is received as attachment. Upload the image to google drive."""
     username = _get_username(update)
     logging.info("Received document image from %s", username)
+    labels = _metric_labels(update, Media.IMAGE)
+    metrics.FILES_RECEIVED.labels(**labels).inc()
     try:
-        file_bytes = await _download_document_file(update)
-    except TimeoutError as error:
-        logging.exception(error)
-        await _send_cloud_not_download(update, context, error, Media.IMAGE)
+        with metrics.DOWNLOAD_SECONDS.labels(labels["media"]).time():
+            file_path = await _download_document_file(update, context)
+    except (NetworkError, httpx.HTTPError, OSError) as error:
+        await _report_download_failure(update, context, error, Media.IMAGE)
         return
-    date = update.effective_message.date
-    try:
-        channel_name = update.effective_message.chat.title
-    except AttributeError:
-        channel_name = None
-    try:
-        protest_folders = drive.manage_folder(date, username, channel_name)
-    except HttpError as error:
-        logging.debug(error)
-        logging.error("A connection error occured %s", error)
-        await _send_no_protest_folder(context)
-    else:
-        # Upload image to drive
-        await _upload_document_file(protest_folders, file_bytes, update, context, Media.IMAGE)
+    metrics.FILES_DOWNLOADED.labels(**labels).inc()
+    # Upload image to drive
+    _enqueue_upload(update, file_path, _get_document_file_name(update), Media.IMAGE)
 
+@_traced_update
 async def document_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     An uncompressed video is received as attachment. 
@@ -210,27 +403,19 @@ async def document_video(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     username = _get_username(update)
     logging.info("Received document video from %s", username)
+    labels = _metric_labels(update, Media.VIDEO)
+    metrics.FILES_RECEIVED.labels(**labels).inc()
     try:
-        file_bytes = await _download_document_file(update)
-    except TimeoutError as error:
-        logging.exception(error)
-        await _send_cloud_not_download(update, context, error, Media.VIDEO)
+        with metrics.DOWNLOAD_SECONDS.labels(labels["media"]).time():
+            file_path = await _download_document_file(update, context)
+    except (NetworkError, httpx.HTTPError, OSError) as error:
+        await _report_download_failure(update, context, error, Media.VIDEO)
         return
-    date = update.effective_message.date
-    try:
-        channel_name = update.effective_message.chat.title
-    except AttributeError:
-        channel_name = None
-    try:
-        protest_folders = drive.manage_folder(date, username, channel_name)
-    except HttpError as ex:
-        logging.debug(ex)
-        logging.error("A connection error occured %s", ex)
-        await _send_no_protest_folder(context)
-    else:
+    metrics.FILES_DOWNLOADED.labels(**labels).inc()
     # Upload video to drive
-        await _upload_document_file(protest_folders, file_bytes, update, context, Media.VIDEO)
+    _enqueue_upload(update, file_path, _get_document_file_name(update), Media.VIDEO)
 
+@_traced_update
 async def photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     A compressed photo is received. 
@@ -238,6 +423,10 @@ async def photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     username = _get_username(update)
     logging.info("Received photo from %s", username)
+    # Compressed photos are not saved.
+    labels = _metric_labels(update, Media.IMAGE)
+    metrics.FILES_RECEIVED.labels(**labels).inc()
+    metrics.FILES_FAILED.labels(**labels).inc()
     try:
         await context.bot.send_message(
             chat_id=config["ERROR_MESSAGE_CHAT_ID"],
@@ -257,6 +446,7 @@ because it is compressed\.",
             parse_mode="MarkdownV2"
         )
 
+@_traced_update
 async def video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     A compressed video is received as attachment. 
@@ -264,56 +454,84 @@ async def video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     username = _get_username(update)
     logging.info("Received video from %s", username)
+    labels = _metric_labels(update, Media.VIDEO)
+    metrics.FILES_RECEIVED.labels(**labels).inc()
     try:
-        file_bytes = await _download_video(update, context)
-    except TimeoutError as error:
-        logging.exception(error)
-        if error == "File is too big":
-            await context.bot.send_message(
-                chat_id=config["ERROR_MESSAGE_CHAT_ID"],
-                text="bot received video file but could not save the video \
-                    because the file is too big."
-            )
+        with metrics.DOWNLOAD_SECONDS.labels(labels["media"]).time():
+            file_path = await _download_video(update, context)
+    except (NetworkError, httpx.HTTPError, OSError) as error:
+        await _report_download_failure(update, context, error, Media.VIDEO)
         return
-    date = update.effective_message.date
-    try:
-        channel_name = update.effective_message.chat.title
-    except AttributeError:
-        channel_name = None
-    try:
-        protest_folders = drive.manage_folder(date, username, channel_name)
-    except HttpError as ex:
-        logging.debug(ex)
-        logging.error("A connection error occured %s", ex)
-        await _send_no_protest_folder(context)
-    else:
-        # Upload video to drive
-        await _upload_video(protest_folders, file_bytes, update, context)
+    metrics.FILES_DOWNLOADED.labels(**labels).inc()
+    # Upload video to drive
+    _enqueue_upload(update, file_path, _get_video_file_name(update), Media.VIDEO)
 
 
 async def location(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Demo for locaiton service.
     """
-    message_location = maps.get_location(
+    message_location = await maps.geocoder.reverse(
         update.effective_message.location.latitude,
         update.effective_message.location.longitude
     )
     print(message_location)
 
-def main():
+async def precreate_folders(_: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Create Telegram bot, add handler and run polling.
+    Create the folder trees of the day for recently seen channels and Tickerbienen
+    and put them into the folder cache, so the first upload of the day does not wait
+    for the folders to be created.
     """
-    app = ApplicationBuilder()\
-        .token(os.environ['TELEGRAM_API_TOKEN'])\
-            .local_mode(True).base_url(f"http://{os.environ['BASE_URL']}/bot")\
-                .base_file_url(f"http://{os.environ['BASE_URL']}/bot").build()
+    senders = uploader.upload_queue.recent_senders(
+        time.time() - PRECREATE_FOLDERS_DAYS * 24 * 60 * 60
+    )
+    today = datetime.now(pytz.timezone(config["TIMEZONE"])).date()
+    # Noon, so the time zone conversion of manage_folder stays on the same day.
+    date = datetime.combine(today, datetime.min.time()) + timedelta(hours=12)
+    logging.info("Create the folders of %s for %d Tickerbienen", today, len(senders))
+    results = await asyncio.gather(*(
+        async_drive.manage_folder(date, username, channel) for channel, username in senders
+    ), return_exceptions=True)
+    for (channel, username), result in zip(senders, results):
+        if isinstance(result, Exception):
+            # The first upload of the Tickerbiene creates the folders instead.
+            logging.warning("Could not create the folders of %s in %s: %s",
+                username, channel, result)
+
+def _schedule_folder_precreation(app: Application) -> None:
+    if not PRECREATE_FOLDERS_DAYS:
+        return
+    if app.job_queue is None:
+        logging.warning("Folders are not created in advance, install python-telegram-bot[job-queue]")
+        return
+    run_time = datetime.strptime(PRECREATE_FOLDERS_TIME, "%H:%M").time()
+    app.job_queue.run_daily(
+        precreate_folders, run_time.replace(tzinfo=pytz.timezone(config["TIMEZONE"])),
+        name="precreate_folders"
+    )
 
-    document_image_handler = MessageHandler(filters.Document.IMAGE, document_image)
-    document_video_handler = MessageHandler(filters.Document.VIDEO, document_video)
+async def _start_upload_workers(app: Application) -> None:
+    uploader.start(
+        functools.partial(_send_could_not_save, app.bot),
+        functools.partial(_send_could_not_save_album, app.bot),
+        functools.partial(_show_upload_progress, app.bot),
+        functools.partial(_show_saved, app.bot)
+    )
+
+async def _stop_upload_workers(_: Application) -> None:
+    _cancel_album_flushes()
+    await uploader.stop()
+
+def add_handlers(app: Application) -> None:
+    """
+    Add the message handlers of the bot to the application.
+    """
+    # Uploads run as tasks, so polling continues while they are in flight.
+    document_image_handler = MessageHandler(filters.Document.IMAGE, document_image, block=False)
+    document_video_handler = MessageHandler(filters.Document.VIDEO, document_video, block=False)
     photo_handler = MessageHandler(filters.PHOTO, photo)
-    video_hanlder = MessageHandler(filters.VIDEO, video)
+    video_hanlder = MessageHandler(filters.VIDEO, video, block=False)
     #location_hanlder = MessageHandler(filters.LOCATION, location)
 
     app.add_handler(document_image_handler)
@@ -321,14 +539,62 @@ def main():
     app.add_handler(photo_handler)
     app.add_handler(video_hanlder)
 
-    app.run_polling(
-        allowed_updates=Update.ALL_TYPES, 
-        timeout=600, 
-        read_timeout=600, 
-        connect_timeout=600, 
-        write_timeout=600, 
-        pool_timeout=600
+def _run_webhook(app: Application) -> None:
+    """
+    Register the webhook with the telegram-bot-api server and receive the updates
+    as they arrive, without the round trips of polling. Requests without the secret
+    token are rejected. The bot registers the webhook at every start, so a new
+    token is generated unless WEBHOOK_SECRET_TOKEN is set.
+    :raises:
+    ValueError: if WEBHOOK_URL is not set.
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL is required in webhook mode")
+    app.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=urlsplit(WEBHOOK_URL).path.lstrip("/"),
+        webhook_url=WEBHOOK_URL,
+        secret_token=os.environ.get("WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(32),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES
     )
 
+def main():
+    """
+    Create Telegram bot, add handler and run polling or the webhook.
+    """
+    # Load the drive credentials and client once before the first update arrives.
+    drive.drive_client.start()
+    if drive.config.get("TRACING", False):
+        tracing.configure(
+            tracing.TRACES_FILE_PATH, drive.config.get("TRACING_OTLP_ENDPOINT"),
+            drive.config.get("TRACING_MAX_FILE_MB", 100) * 1024 * 1024
+        )
+    if drive.config.get("METRICS_PORT"):
+        metrics.start(
+            drive.config["METRICS_PORT"], drive.config.get("METRICS_ADDRESS", "127.0.0.1")
+        )
+
+    app = ApplicationBuilder()\
+        .token(os.environ['TELEGRAM_API_TOKEN'])\
+            .local_mode(True).base_url(f"http://{os.environ['BASE_URL']}/bot")\
+                .base_file_url(f"http://{os.environ['BASE_URL']}/bot")\
+                    .concurrent_updates(CONCURRENT_UPDATES)\
+                    .get_updates_read_timeout(600)\
+                    .get_updates_connect_timeout(600)\
+                    .get_updates_write_timeout(600)\
+                    .get_updates_pool_timeout(600)\
+                    .post_init(_start_upload_workers)\
+                        .post_shutdown(_stop_upload_workers).build()
+
+    add_handlers(app)
+    _schedule_folder_precreation(app)
+
+    if UPDATE_MODE is UpdateMode.WEBHOOK:
+        _run_webhook(app)
+        return
+    app.run_polling(allowed_updates=Update.ALL_TYPES, timeout=600)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,92 @@
+"""
+Index of uploaded file contents to avoid uploading the same file twice.
+"""
+import hashlib
+import sqlite3
+import threading
+
+from media_upload import read_chunks
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_md5(file_path: str) -> str:
+    """
+    Hash a file in chunks. Drive reports the same hash as md5Checksum.
+    Returns: MD5 hex digest of the file
+    """
+    md5 = hashlib.md5()
+    for chunk in read_chunks(file_path, HASH_CHUNK_SIZE):
+        md5.update(chunk)
+    return md5.hexdigest()
+
+
+class DedupIndex:
+    """
+    Map the MD5 hash of uploaded files to their drive file ids and folders.
+    Telegram's file_unique_id is mapped to the hash as well, so a file
+    forwarded again does not need to be hashed.
+    """
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS unique_ids (
+                    file_unique_id TEXT PRIMARY KEY,
+                    md5 TEXT NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    md5 TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    PRIMARY KEY (md5, folder_id)
+                )"""
+            )
+
+    def content_hash(self, file_path: str, file_unique_id: str = None) -> str:
+        """
+        Look up the hash of a telegram file or hash the file.
+        Returns: MD5 hex digest of the file
+        """
+        if file_unique_id is not None:
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT md5 FROM unique_ids WHERE file_unique_id=?", (file_unique_id,)
+                ).fetchone()
+            if row is not None:
+                return row[0]
+        md5 = file_md5(file_path)
+        if file_unique_id is not None:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO unique_ids VALUES (?, ?)", (file_unique_id, md5)
+                )
+        return md5
+
+    def find(self, md5: str) -> list:
+        """
+        Returns: List of (file id, folder id) tuples of files with this content
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT file_id, folder_id FROM files WHERE md5=?", (md5,)
+            ).fetchall()
+
+    def add(self, md5: str, folder_id: str, file_id: str):
+        """
+        Remember that a file with this content is stored in the folder.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (md5, folder_id, file_id)
+            )
+
+    def remove(self, file_id: str):
+        """
+        Forget a file which no longer exists in drive.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files WHERE file_id=?", (file_id,))
@@ -0,0 +1,98 @@
+"""
+Download files which are not on the shared telegram-bot-api volume to local disk.
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import Callable
+
+# pylint: disable=import-error
+import httpx
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _wait_for_retry(
+        error: httpx.HTTPError,
+        file_path: str,
+        offset: int,
+        attempt: int,
+        max_attempts: int
+    ):
+    """
+    Wait before the next attempt of an interrupted download. Only attempts without
+    any progress count, so a long download survives any number of dropped connections.
+    :raises:
+    httpx.HTTPError: the error of the download, if it made no progress in max_attempts attempts.
+    """
+    if attempt >= max_attempts:
+        raise error
+    delay = random.uniform(0, min(2 ** attempt, 60))
+    logging.warning("Download of %s interrupted at %d bytes, retry in %.1f seconds: %s",
+        file_path, offset, delay, error)
+    await asyncio.sleep(delay)
+
+async def download(
+        url: str,
+        file_path: str,
+        total_bytes: int = None,
+        progress: Callable[[int, int], None] = None,
+        max_attempts: int = 5,
+        timeout: float = 600
+    ) -> str:
+    """
+    Download a file in chunks with HTTP range requests. The file is written to
+    file_path.part first, so an interrupted download resumes from the bytes on disk,
+    also after a restart of the bot.
+    Args: The url, the local path, the file size if known, a function called with the
+    downloaded and total bytes, the number of attempts without progress and the timeout
+    of a request
+    Returns: The local path of the file
+    :raises:
+    httpx.HTTPError: if the download made no progress in max_attempts attempts.
+    OSError: if the file cannot be written.
+    """
+    part_path = f"{file_path}.part"
+    attempt = 0
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        while True:
+            attempt += 1
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            start_offset = offset
+            if offset and total_bytes is not None and offset >= total_bytes:
+                break
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 416:
+                        # The part file already holds the whole file.
+                        break
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        # The server ignored the range, start again.
+                        offset = 0
+                    length = response.headers.get("content-length")
+                    if total_bytes is None and length is not None:
+                        total_bytes = offset + int(length)
+                    with open(part_path, "r+b" if offset else "wb") as part_file:
+                        part_file.seek(offset)
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            part_file.write(chunk)
+                            offset += len(chunk)
+                            if progress is not None:
+                                progress(offset, total_bytes)
+            except httpx.HTTPStatusError as error:
+                # Client errors, e.g. a missing file, do not go away with a retry.
+                if error.response.status_code < 500:
+                    raise
+                attempt = 1 if offset > start_offset else attempt
+                await _wait_for_retry(error, file_path, offset, attempt, max_attempts)
+            except httpx.HTTPError as error:
+                attempt = 1 if offset > start_offset else attempt
+                await _wait_for_retry(error, file_path, offset, attempt, max_attempts)
+            else:
+                break
+    os.replace(part_path, file_path)
+    logging.info("Downloaded %s", file_path)
+    return file_path
@@ -8,22 +8,28 @@ import os.path
 import datetime
 from datetime import timedelta
 import json
-
-# pylint: disable=import-error
-from worker import process
+import threading
+from typing import Callable
 
 from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials as SaCredentials
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaInMemoryUpload
 
 # pylint: disable=import-error
 import pytz
-from enums import Media
+from enums import Media, TickerbieneMode
+from folder_cache import FolderCache
+from drive_client import DriveClient
+from dedup import DedupIndex
+from media_upload import FileMediaUpload
+from drive_retry import DRIVE_ERRORS, Retry
+from ratelimit import TokenBucket
+from singleflight import SingleFlight
 import helper
+import metrics
+import tracing
 
 
 
@@ -46,6 +52,39 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 BILDER = "Bilder"
 VIDEOS = "Videos"
 TICKERBIENEN = "Tickerbienen"
+# Largest page size drive allows for files.list.
+PAGE_SIZE = 1000
+# App property holding the key of the upload job which created a file.
+UPLOAD_JOB_PROPERTY = "upload_job"
+# Resumable uploads are sent in chunks of this size. Must be a multiple of 256 KiB.
+UPLOAD_CHUNK_SIZE = config.get("UPLOAD_CHUNK_SIZE_MB", 10) * 1024 * 1024
+# Bytes per second shared by all uploads, 0 disables the limit.
+UPLOAD_BANDWIDTH_LIMIT = config.get("UPLOAD_BANDWIDTH_LIMIT_MBIT", 0) * 1000 * 1000 / 8
+bandwidth_limit = None
+if UPLOAD_BANDWIDTH_LIMIT:
+    bandwidth_limit = TokenBucket(
+        UPLOAD_BANDWIDTH_LIMIT, max(UPLOAD_BANDWIDTH_LIMIT, UPLOAD_CHUNK_SIZE)
+    )
+# Upload the file a second time or place it server side into the Tickerbiene folder.
+TICKERBIENE_MODE = TickerbieneMode(config.get("TICKERBIENE_MODE", TickerbieneMode.COPY.value))
+
+FOLDER_CACHE_FILE_PATH = "var/folder_cache.db"
+folder_cache = FolderCache(
+    FOLDER_CACHE_FILE_PATH,
+    config.get("FOLDER_CACHE_TTL_HOURS", 24) * 60 * 60
+)
+
+# Reuse or copy content which was uploaded before instead of uploading it again.
+DEDUPLICATE = config.get("DEDUPLICATE", True)
+DEDUP_FILE_PATH = "var/dedup.db"
+dedup_index = DedupIndex(DEDUP_FILE_PATH)
+
+# Coalesces concurrent lookups and creations of the same protest folders.
+folder_flight = SingleFlight()
+
+# Bytes sent to drive and bytes not sent because of server side copies or reused content.
+transfer_stats = {"uploaded_bytes": 0, "saved_bytes": 0}
+_transfer_stats_lock = threading.Lock()
 
 class ProtestFolder:
     """
@@ -96,49 +135,266 @@ def _get_credentials() -> Credentials:
                 token.write(creds.to_json())
     return creds
 
-def _loop_query(query: str) -> any:
-    creds = _get_credentials()
+drive_client = DriveClient(
+    _get_credentials,
+    api_endpoint=config.get("DRIVE_API_ENDPOINT") or None
+)
+retry = Retry(
+    max_retries=config.get("DRIVE_MAX_RETRIES", 5),
+    base_delay=1,
+    max_delay=64,
+    requests_per_second=config.get("DRIVE_REQUESTS_PER_SECOND", 10)
+)
+
+def _escape_query(value: str) -> str:
+    """
+    Escape a string value for the q parameter of a drive query.
+    """
+    return value.replace('\\', '\\\\').replace("'", "\\'")
 
-    service = build('drive', 'v3', credentials=creds)
+@tracing.traced("list_query")
+def _loop_query(query: str, page_size: int = PAGE_SIZE, fields: str = "id, name") -> any:
+    service = drive_client.service()
 
     # pylint: disable=maybe-no-member
-    results = service.files().list(
+    results = retry.execute(service.files().list(
         q=query,
-        pageSize=100, fields="nextPageToken, files(id, name)",
+        pageSize=page_size, fields=f"nextPageToken, files({fields})",
         includeItemsFromAllDrives=True,
         supportsAllDrives=True,
-    ).execute()
+    ))
     next_page_token = results.get("nextPageToken", None)
     logging.debug(next_page_token)
     folders = results.get('files', [])
 
     while next_page_token is not None:
-        results = service.files().list(
+        results = retry.execute(service.files().list(
             q=query,
-            pageToken=next_page_token, fields="nextPageToken, files(id, name)",
+            pageSize=page_size,
+            pageToken=next_page_token, fields=f"nextPageToken, files({fields})",
             includeItemsFromAllDrives=True,
             supportsAllDrives=True
-        ).execute()
+        ))
         next_page_token = results.get("nextPageToken", None)
         folders.extend(results.get('files', []))
     return folders
 
-@process
+def _count_transfer(uploaded_bytes: int = 0, saved_bytes: int = 0):
+    with _transfer_stats_lock:
+        transfer_stats["uploaded_bytes"] += uploaded_bytes
+        transfer_stats["saved_bytes"] += saved_bytes
+        logging.info("Uploaded %d bytes in total, saved %d bytes by server side copies and reused content.",
+            transfer_stats["uploaded_bytes"], transfer_stats["saved_bytes"])
+
+def _create_shortcut(service, file_id: str, file_metadata: dict) -> str:
+    """Link an already uploaded file into a second folder.
+    Returns: ID of the shortcut
+    """
+    file_metadata = dict(file_metadata)
+    file_metadata['mimeType'] = 'application/vnd.google-apps.shortcut'
+    file_metadata['shortcutDetails'] = {'targetId': file_id}
+    # pylint: disable=maybe-no-member
+    shortcut = retry.execute(service.files().create(
+        body=file_metadata,
+        fields='id',
+        supportsAllDrives=True
+    ))
+    return shortcut.get('id')
+
+def _copy_file(service, file_id: str, file_metadata: dict) -> str:
+    """Copy an already uploaded file server side without sending its bytes again.
+    Returns: ID of the copy
+    """
+    # pylint: disable=maybe-no-member
+    copied_file = retry.execute(service.files().copy(
+        fileId=file_id,
+        body=file_metadata,
+        fields='id',
+        supportsAllDrives=True
+    ))
+    return copied_file.get('id')
+
+def _is_stored(service, file_id: str, md5: str) -> bool:
+    """Check that a file of the dedup index still exists in drive with the same content.
+    """
+    try:
+        # pylint: disable=maybe-no-member
+        stored_file = retry.execute(service.files().get(
+            fileId=file_id,
+            fields='md5Checksum, trashed',
+            supportsAllDrives=True
+        ))
+    except HttpError as error:
+        if error.resp.status == 404:
+            return False
+        raise
+    return not stored_file.get('trashed') and stored_file.get('md5Checksum') == md5
+
+def _find_stored(service, md5: str, folder_id: str, in_folder_only: bool = False) -> tuple:
+    """Find a file with the same content in the dedup index.
+    Entries of files which were deleted or changed in drive are removed.
+    Returns: ID of a file in the folder or None, ID of a file in another folder or None
+    """
+    entries = dedup_index.find(md5)
+    if in_folder_only:
+        entries = [entry for entry in entries if entry[1] == folder_id]
+    # Check a file in the folder itself first.
+    entries.sort(key=lambda entry: entry[1] != folder_id)
+    for file_id, stored_folder_id in entries:
+        if _is_stored(service, file_id, md5):
+            if stored_folder_id == folder_id:
+                return file_id, None
+            return None, file_id
+        dedup_index.remove(file_id)
+    return None, None
+
+def _store_content(
+        service,
+        file_metadata: dict,
+        file_path: str,
+        mimetype: str,
+        progress: Callable[[int, int], None],
+        md5: str,
+        source_file_id: str = None
+    ) -> str:
+    """Store a file in the folder of the file metadata. The file is only uploaded
+    if drive does not have its content yet, otherwise the content is reused or
+    copied server side. The source file id is a file with known equal content.
+    Returns: ID of the file
+    """
+    folder_id = file_metadata['parents'][0]
+    file_size = os.path.getsize(file_path)
+    if md5 is not None:
+        stored_file_id, found_file_id = _find_stored(
+            service, md5, folder_id, in_folder_only=source_file_id is not None)
+        if stored_file_id is not None:
+            logging.info("Content of %s is already stored as %s",
+                file_metadata['name'], stored_file_id)
+            _count_transfer(saved_bytes=file_size)
+            return stored_file_id
+        source_file_id = source_file_id or found_file_id
+    if source_file_id is not None:
+        file_id = _copy_file(service, source_file_id, file_metadata)
+        _count_transfer(saved_bytes=file_size)
+    else:
+        file_id = _upload_stream(service, file_metadata, file_path, mimetype, progress)
+        _count_transfer(uploaded_bytes=file_size)
+    if md5 is not None:
+        dedup_index.add(md5, folder_id, file_id)
+    return file_id
+
+def _store_rendition(
+        service,
+        file_metadata: dict,
+        rendition: dict,
+        file_path: str,
+        mimetype: str,
+        md5: str,
+        source_file_id: str
+    ) -> str:
+    """Store the rendition of a file in the Tickerbiene folder of the file metadata.
+    The name keeps the name of the original with the extension of the rendition.
+    Without a rendition the original is copied server side.
+    Returns: ID of the file
+    """
+    if rendition is None:
+        return _store_content(
+            service, file_metadata, file_path, mimetype, None, md5, source_file_id=source_file_id)
+    file_metadata = dict(file_metadata)
+    file_metadata['name'] = os.path.splitext(file_metadata['name'])[0] + \
+        os.path.splitext(rendition['file_path'])[1]
+    file_id = _store_content(
+        service, file_metadata, rendition['file_path'], rendition['mimetype'], None, None)
+    _count_transfer(saved_bytes=rendition['original_size'] - rendition['size'])
+    return file_id
+
+def _find_job_file(job_key: str, folder_id: str) -> str:
+    """Find a file which an earlier attempt of an upload job already created.
+    Returns: ID of the file or None
+    """
+    query = f"appProperties has {{ key='{UPLOAD_JOB_PROPERTY}' and value='{job_key}' }} and \
+        ('{folder_id}' in parents) and \
+        trashed=false"
+    files = _loop_query(query)
+    if files:
+        logging.info("Upload job %s already created file %s", job_key, files[0]['id'])
+        return files[0]['id']
+    return None
+
+@tracing.traced("upload_stream")
+def _upload_stream(
+        service,
+        file_metadata: dict,
+        file_path: str,
+        mimetype: str,
+        progress: Callable[[int, int], None] = None
+    ) -> str:
+    """Stream a local file to drive in resumable chunks of UPLOAD_CHUNK_SIZE.
+    Every chunk is read into the same buffer, only one chunk is held in memory
+    at a time, independent of the file size.
+    Returns: ID of the file uploaded
+    """
+    with open(file_path, "rb", buffering=0) as stream:
+        media = FileMediaUpload(stream, mimetype, UPLOAD_CHUNK_SIZE)
+        # pylint: disable=maybe-no-member
+        request = service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id',
+            supportsAllDrives=True
+            )
+        total_bytes = media.size()
+        if tracing.current_span() is not None:
+            tracing.current_span().set(file_size=total_bytes)
+        uploaded_file = None
+        bytes_sent = 0
+        while uploaded_file is None:
+            if bandwidth_limit is not None:
+                bandwidth_limit.acquire(min(UPLOAD_CHUNK_SIZE, total_bytes - bytes_sent))
+            # After an error next_chunk asks drive for the last committed offset
+            # and resumes the session from there.
+            status, uploaded_file = retry.call(request.next_chunk)
+            if status:
+                bytes_sent = status.resumable_progress
+            else:
+                bytes_sent = total_bytes
+            logging.debug("Sent %d of %d bytes of %s",
+                bytes_sent, total_bytes, file_metadata['name'])
+            if progress is not None:
+                progress(bytes_sent, total_bytes)
+    return uploaded_file.get('id')
+
+@tracing.traced("upload_file_to_folder")
 def upload_file_to_folder(
-        name: str, file_bytes: bytes,
+        name: str, file_path: str,
         protest_folders: ProtestFolder,
-        media_type: Media
+        media_type: Media,
+        progress: Callable[[int, int], None] = None,
+        job_key: str = None,
+        check_uploaded: bool = False,
+        file_unique_id: str = None,
+        app_properties: dict = None,
+        rendition: Callable[[], dict] = None
     ):
     """Upload a file to the specified folder and prints file ID, folder ID
-    Args: Id of the folder
+    The file is streamed from disk, so memory usage does not grow with the file size.
+    Args: Name of the file in drive, path of the local file, the protest folders,
+    the media type and an optional callback receiving the bytes sent and the total bytes.
+    The job key of an upload job is stored on the files. If check_uploaded is set,
+    files already created by an earlier attempt of the job are not uploaded again.
+    Content which was uploaded before is reused or copied server side. Telegram's
+    file_unique_id saves hashing the file if the same telegram file was seen before.
+    The app properties, e.g. the capture time, are set in the same request which
+    creates the file. In the rendition mode the rendition function is called once the
+    file is stored and returns the reduced-size rendition for the Tickerbiene folder,
+    see renditions.render. Without a rendition the file is copied.
     Returns: ID of the file uploaded
     :raises:
     HttpError: if a connection error occured.
     TypeError: if media type is not found.
     """
-    creds = _get_credentials()
-    # create drive api client
-    service = build('drive', 'v3', credentials=creds)
+    # get the shared drive api client
+    service = drive_client.service()
 
     if media_type is Media.IMAGE:
         # Upload to Bilder
@@ -150,8 +406,7 @@ def upload_file_to_folder(
             'name': name,
             'parents': [protest_folders.bilder_folder_id]
         }
-        media = MediaInMemoryUpload(file_bytes,
-                                mimetype=f'image/{file_format}', resumable=True)
+        mimetype = f'image/{file_format}'
     elif media_type is Media.VIDEO:
         # Upload to Videos
         file_format = name.rsplit('.',1)[-1]
@@ -162,183 +417,189 @@ def upload_file_to_folder(
             'name': name,
             'parents': [protest_folders.videos_folder_id]
         }
-        media = MediaInMemoryUpload(file_bytes,
-                    mimetype=f'video/{file_format}', resumable=True)
+        mimetype = f'video/{file_format}'
     else: raise TypeError('Cloud not find Media type', media_type)
 
-    # pylint: disable=maybe-no-member
-    uploaded_file = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-        ).execute()
-    uploaded_file_id = uploaded_file.get('id')
-    logging.debug('File ID: "%s".' , uploaded_file_id)
-
     # Upload to Tickerbienen
     if media_type is Media.IMAGE:
         # Upload to Bilder
-        file_metadata['parents'] = [protest_folders.tickerbiene_bilder_folder_id]
-        media = MediaInMemoryUpload(file_bytes,
-            mimetype=f'image/{file_format}', resumable=True)
+        ticker_folder_id = protest_folders.tickerbiene_bilder_folder_id
     elif media_type is Media.VIDEO:
         # Upload to Videos
-        file_metadata['parents'] = [protest_folders.tickerbiene_videos_folder_id]
-        media = MediaInMemoryUpload(file_bytes,
-            mimetype=f'video/{file_format}', resumable=True)
+        ticker_folder_id = protest_folders.tickerbiene_videos_folder_id
     else: raise TypeError('Cloud not find Media type', media_type)
 
-    # pylint: disable=maybe-no-member
-    uploaded_ticker_file = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-        ).execute()
-    uploaded_ticker_file_id = uploaded_ticker_file.get('id')
+    if app_properties:
+        file_metadata['appProperties'] = dict(app_properties)
+    if job_key is not None:
+        file_metadata.setdefault('appProperties', {})[UPLOAD_JOB_PROPERTY] = job_key
+
+    md5 = None
+    if DEDUPLICATE:
+        md5 = dedup_index.content_hash(file_path, file_unique_id)
+
+    try:
+        uploaded_file_id = None
+        if check_uploaded:
+            uploaded_file_id = _find_job_file(job_key, file_metadata['parents'][0])
+        if uploaded_file_id is None:
+            uploaded_file_id = _store_content(
+                service, file_metadata, file_path, mimetype, progress, md5)
+        logging.debug('File ID: "%s".' , uploaded_file_id)
+
+        file_metadata['parents'] = [ticker_folder_id]
+        uploaded_ticker_file_id = None
+        if check_uploaded:
+            uploaded_ticker_file_id = _find_job_file(job_key, ticker_folder_id)
+        if uploaded_ticker_file_id is None:
+            if TICKERBIENE_MODE is TickerbieneMode.SHORTCUT:
+                uploaded_ticker_file_id = _create_shortcut(
+                    service, uploaded_file_id, file_metadata)
+                _count_transfer(saved_bytes=os.path.getsize(file_path))
+            elif TICKERBIENE_MODE is TickerbieneMode.RENDITION and rendition is not None:
+                uploaded_ticker_file_id = _store_rendition(service, file_metadata, rendition(),
+                    file_path, mimetype, md5, uploaded_file_id)
+            elif TICKERBIENE_MODE in (TickerbieneMode.COPY, TickerbieneMode.RENDITION):
+                uploaded_ticker_file_id = _store_content(
+                    service, file_metadata, file_path, mimetype, progress, md5,
+                    source_file_id=uploaded_file_id)
+            else:
+                uploaded_ticker_file_id = _store_content(
+                    service, file_metadata, file_path, mimetype, progress, md5)
+    except HttpError as error:
+        # The cached folder was deleted in drive, search or create it again next time.
+        if error.resp.status == 404:
+            folder_cache.invalidate(protest_folders.parent_folder_id)
+        raise
 
     logging.debug('File ID: "%s".' , uploaded_ticker_file_id)
     logging.info("Finished upload  %s ", name)
 
     return uploaded_file_id, uploaded_ticker_file_id
 
-def _create_tickerbiene_folder(username: str, ticker_folder_id):
-    #create subfolder for Tickerbiene
-    file_metadata = {
-        'name': username,
-        'parents': [ticker_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
+def _delete_folders(service, folder_ids: list):
+    """Delete folders with one batch request to roll back a partially created tree.
+    Errors are logged, so they do not hide the error which caused the roll back.
+    """
+    def callback(request_id, _, exception):
+        if exception is not None:
+            logging.error("Could not roll back folder %s: %s", request_id, exception)
 
-    creds = _get_credentials()
-    service = build('drive', 'v3', credentials=creds)
+    batch = service.new_batch_http_request(callback=callback)
+    for folder_id in folder_ids:
+        logging.info("Roll back folder %s", folder_id)
+        # pylint: disable=maybe-no-member
+        batch.add(
+            service.files().delete(fileId=folder_id, supportsAllDrives=True),
+            request_id=folder_id
+        )
+    try:
+        retry.call(batch.execute, cost=len(folder_ids), method="batch.drive.files.delete")
+    except DRIVE_ERRORS as error:
+        logging.error("Could not roll back folders %s: %s", folder_ids, error)
+
+def _create_folders(service, folders: list) -> list:
+    """Create sibling folders of one tree level in a single round trip.
+    Args: List of (name, parent folder id) tuples. The parent folder id may be None.
+    Returns: IDs of the created folders in the same order
+    :raises:
+    HttpError: if a folder could not be created. The other folders are deleted again,
+    also after a connection error.
+    """
+    folder_ids = [None] * len(folders)
 
-    # pylint: disable=maybe-no-member
-    ticker_biene_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    ticker_biene_folder_id = ticker_biene_folder.get('id')
-    logging.debug('ticker biene folder ID: "%s".', ticker_biene_folder_id)
-
-    #create subfolder Tickerbienen/Bilder
-    file_metadata = {
-        'name': 'Bilder',
-        'parents': [ticker_biene_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    # pylint: disable=maybe-no-member
-    ticker_image_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    ticker_image_folder_id = ticker_image_folder.get('id')
-    logging.debug('ticker image folder ID: "%s".', ticker_image_folder_id)
-
-    #create subfolder Tickerbienen/Videos
-    file_metadata = {
-        'name': 'Videos',
-        'parents': [ticker_biene_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    # pylint: disable=maybe-no-member
-    ticker_videos_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    ticker_videos_folder_id = ticker_videos_folder.get('id')
-    logging.debug('ticker videos folder ID: "%s".', ticker_videos_folder_id)
+    def execute_batch():
+        errors = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors.append(exception)
+            else:
+                folder_ids[int(request_id)] = response.get('id')
+
+        batch = service.new_batch_http_request(callback=callback)
+        for index, (name, parent_id) in enumerate(folders):
+            # Folders created by an earlier attempt are not created again.
+            if folder_ids[index] is not None:
+                continue
+            file_metadata = {
+                'name': name,
+                'mimeType': 'application/vnd.google-apps.folder'
+            }
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            # pylint: disable=maybe-no-member
+            batch.add(
+                service.files().create(body=file_metadata, fields='id', supportsAllDrives=True),
+                request_id=str(index)
+            )
+        batch.execute()
+        if errors:
+            raise errors[0]
+
+    try:
+        retry.call(execute_batch, cost=len(folders), method="batch.drive.files.create")
+    except DRIVE_ERRORS:
+        created_folder_ids = [folder_id for folder_id in folder_ids if folder_id]
+        if created_folder_ids:
+            _delete_folders(service, created_folder_ids)
+        raise
+    for (name, _), folder_id in zip(folders, folder_ids):
+        logging.debug('%s folder ID: "%s".', name, folder_id)
+    return folder_ids
+
+def _create_tickerbiene_folder(username: str, ticker_folder_id):
+    """Create the folder of a Tickerbiene with its subfolders Bilder and Videos.
+    Returns: IDs of the Tickerbiene, Bilder and Videos folder
+    :raises:
+    HttpError: if a connection error occured. Created folders are deleted again.
+    """
+    service = drive_client.service()
+
+    #create subfolder for Tickerbiene
+    ticker_biene_folder_id, = _create_folders(service, [(username, ticker_folder_id)])
+    try:
+        #create subfolders Tickerbienen/Bilder and Tickerbienen/Videos
+        ticker_image_folder_id, ticker_videos_folder_id = _create_folders(service, [
+            (BILDER, ticker_biene_folder_id),
+            (VIDEOS, ticker_biene_folder_id)
+        ])
+    except DRIVE_ERRORS:
+        _delete_folders(service, [ticker_biene_folder_id])
+        raise
 
     return ticker_biene_folder_id, ticker_image_folder_id, ticker_videos_folder_id
 
+@tracing.traced("create_parent_folder")
 def create_parent_folder(name: str, username: str) -> ProtestFolder:
     """ Create the parent folder and prints the folder ID.
     This folder is used for the protest of a day on a location.
     The location is dependend on the telegram channel the message was posted,
+    The subfolders of each tree level are created with one batch request.
     Returns : Folder Id
     :raises:
-    HttpError: if a connection error occured.
+    HttpError: if a connection error occured. Created folders are deleted again.
     """
-    creds = _get_credentials()
-
-    # create drive api client
-    service = build('drive', 'v3', credentials=creds)
+    # get the shared drive api client
+    service = drive_client.service()
     # create parent folder
-    if config["PROTEST_FOLDER_ID"]:
-        file_metadata = {
-            'name': name,
-            'parents': [f"{config['PROTEST_FOLDER_ID']}"],
-            'mimeType': 'application/vnd.google-apps.folder'
-        }
-    else:
-        file_metadata = {
-            'name': name,
-            'mimeType': 'application/vnd.google-apps.folder'
-        }
-
+    parent_folder_id, = _create_folders(service, [(name, config["PROTEST_FOLDER_ID"])])
 
-    # pylint: disable=maybe-no-member
-    parent_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    parent_folder_id = parent_folder.get('id')
-    logging.debug('parent folder ID: "%s".' , parent_folder_id)
-
-    #create subfolder Bilder
-    file_metadata = {
-        'name': BILDER,
-        'parents': [parent_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    # pylint: disable=maybe-no-member
-    image_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    image_folder_id = image_folder.get('id')
-    logging.debug('image folder ID: "%s".', image_folder_id)
-
-    #create subfolder Videos
-    file_metadata = {
-        'name': VIDEOS,
-        'parents': [parent_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    # pylint: disable=maybe-no-member
-    videos_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    videos_folder_id = videos_folder.get('id')
-    logging.debug('videos folder ID: "%s".', videos_folder_id)
-
-    #create subfolder Tickerbienen
-    file_metadata = {
-        'name': 'Tickerbienen',
-        'parents': [parent_folder_id],
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    # pylint: disable=maybe-no-member
-    ticker_folder = service.files().create(
-        body=file_metadata,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    ticker_folder_id = ticker_folder.get('id')
-    logging.debug('ticker folder ID: "%s".', ticker_folder_id)
-
-    tb_folder_id, ti_folder_id, tv_folder_id =_create_tickerbiene_folder(
-        username, 
-        ticker_folder_id
-    )
+    try:
+        #create subfolders Bilder, Videos and Tickerbienen
+        image_folder_id, videos_folder_id, ticker_folder_id = _create_folders(service, [
+            (BILDER, parent_folder_id),
+            (VIDEOS, parent_folder_id),
+            (TICKERBIENEN, parent_folder_id)
+        ])
+
+        tb_folder_id, ti_folder_id, tv_folder_id =_create_tickerbiene_folder(
+            username,
+            ticker_folder_id
+        )
+    except DRIVE_ERRORS:
+        _delete_folders(service, [parent_folder_id])
+        raise
 
     return ProtestFolder(
         parent_folder_id,
@@ -350,83 +611,103 @@ def create_parent_folder(name: str, username: str) -> ProtestFolder:
         tv_folder_id
     )
 
-def search_protest_folder(parent_id, username: str)-> ProtestFolder:
+def _list_child_folders(parent_ids: list) -> dict:
     """
-    Search for the protest folder's subfolders of the current date.
+    Get the subfolders of several folders with one paginated query.
+    Returns: Dictionary of parent folder id to a dictionary of folder name to folder id
     """
-
-    protest_folder = ProtestFolder(parent_id)
-
+    parents_query = " or ".join(f"('{parent_id}' in parents)" for parent_id in parent_ids)
     query = f"mimeType='application/vnd.google-apps.folder' and \
-            ('{parent_id}' in parents) and \
+            ({parents_query}) and \
             trashed=false"
-    folders = _loop_query(query)
-    
-    for folder in folders:
+    children = {parent_id: {} for parent_id in parent_ids}
+    for folder in _loop_query(query, fields="id, name, parents"):
         logging.debug("%s (%s)", folder['name'],folder['id'])
-        if folder['name'] == BILDER:
-            protest_folder.bilder_folder_id = folder['id']
-        if folder['name'] == VIDEOS:
-            protest_folder.videos_folder_id = folder['id']
-        if folder['name'] == TICKERBIENEN:
-            protest_folder.tickerbienen_folder_id = folder['id']
+        for parent_id in folder.get('parents', []):
+            if parent_id in children:
+                # Keep the first folder if a name exists twice.
+                children[parent_id].setdefault(folder['name'], folder['id'])
+    return children
 
-    query = f"mimeType='application/vnd.google-apps.folder' and \
-            ('{protest_folder.tickerbienen_folder_id}' in parents) and \
-            trashed=false"
-    folders = _loop_query(query)
+def _ensure_child_folders(service, parent_id: str, names: list, children: dict) -> dict:
+    """
+    Create the folders of the names which are missing in the children of the parent folder.
+    Returns: Dictionary of folder name to folder id
+    """
+    missing_names = [name for name in names if name not in children]
+    if missing_names:
+        logging.warning("Create missing folders %s in %s", missing_names, parent_id)
+        folder_ids = _create_folders(service, [(name, parent_id) for name in missing_names])
+        children.update(zip(missing_names, folder_ids))
+    return children
+
+@tracing.traced("search_protest_folder")
+def search_protest_folder(parent_id, username: str)-> ProtestFolder:
+    """
+    Search for the protest folder's subfolders of the current date.
+    Each level of the folder tree is fetched with one query and the protest folder
+    is assembled from the folder names. Missing subfolders are created.
+    """
+    service = drive_client.service()
+
+    children = _list_child_folders([parent_id])[parent_id]
+    tickerbienen_exists = TICKERBIENEN in children
+    children = _ensure_child_folders(service, parent_id, [BILDER, VIDEOS, TICKERBIENEN], children)
+    protest_folder = ProtestFolder(
+        parent_id,
+        children[BILDER],
+        children[VIDEOS],
+        children[TICKERBIENEN]
+    )
 
-    for folder in folders:
-        logging.debug("%s (%s)", folder['name'],folder['id'])
-        if folder['name'] == username:
-            protest_folder.tickerbiene_folder_id = folder['id']
-    if protest_folder.tickerbiene_folder_id  == "":
+    tickerbiene_folder_id = None
+    # A Tickerbienen folder which was just created has no subfolders yet.
+    if tickerbienen_exists:
+        ticker_children = _list_child_folders([protest_folder.tickerbienen_folder_id])
+        tickerbiene_folder_id = ticker_children[protest_folder.tickerbienen_folder_id].get(username)
+    if tickerbiene_folder_id is None:
         tb_folder_id, ti_folder_id, tv_folder_id = _create_tickerbiene_folder(
-            username, 
+            username,
             protest_folder.tickerbienen_folder_id
         )
         protest_folder.tickerbiene_folder_id = tb_folder_id
         protest_folder.tickerbiene_bilder_folder_id = ti_folder_id
         protest_folder.tickerbiene_videos_folder_id = tv_folder_id
-    else:
-        query = f"mimeType='application/vnd.google-apps.folder' and \
-                ('{protest_folder.tickerbiene_folder_id}' in parents) and \
-                trashed=false"
-        folders = _loop_query(query)
+        return protest_folder
 
-        for folder in folders:
-            logging.debug("%s (%s)", folder['name'],folder['id'])
-            if folder['name'] == BILDER:
-                protest_folder.tickerbiene_bilder_folder_id = folder['id']
-            if folder['name'] == VIDEOS:
-                protest_folder.tickerbiene_videos_folder_id = folder['id']
+    protest_folder.tickerbiene_folder_id = tickerbiene_folder_id
+    children = _list_child_folders([tickerbiene_folder_id])[tickerbiene_folder_id]
+    children = _ensure_child_folders(service, tickerbiene_folder_id, [BILDER, VIDEOS], children)
+    protest_folder.tickerbiene_bilder_folder_id = children[BILDER]
+    protest_folder.tickerbiene_videos_folder_id = children[VIDEOS]
 
     return protest_folder
 
-def manage_folder(date: datetime, username: str, channel_name: str = None, location: str = None) -> ProtestFolder:
+def _find_parent_folder(date_iso: str, target_name: str) -> str:
     """
-    Get a list for all folders in the shared drive of the Presse Ag 
-    in the Subfolder ./Pressemitteilungen/Protest
-    Returns : Folder Id
-    :raises:
-    HttpError: if a connection error occured.
+    Search the parent folder of the protest of a day on a channel or location.
+    Returns: Folder Id or None if there is no such folder
     """
+    # Only ask drive for the folders of this date and channel or location,
+    # so the lookup does not grow with the number of protest folders.
+    folder_name_prefix = f"{date_iso} Bot"
+    if target_name is not None:
+        name_query = f"name = '{_escape_query(f'{folder_name_prefix} {target_name}')}'"
+    else:
+        name_query = f"name contains '{_escape_query(folder_name_prefix)}'"
     # pylint: disable=maybe-no-member
     if config["PROTEST_FOLDER_ID"]:
         query = f"mimeType='application/vnd.google-apps.folder' and \
+            {name_query} and \
             ('{config['PROTEST_FOLDER_ID']}' in parents) and \
             trashed=false"
     else:
-        query = "mimeType='application/vnd.google-apps.folder' and trashed=false"
+        query = f"mimeType='application/vnd.google-apps.folder' and \
+            {name_query} and \
+            trashed=false"
 
     folders = _loop_query(query)
 
-
-    tz_date = date.replace(tzinfo=pytz.timezone(config["TIMEZONE"])).astimezone()
-    date = date + timedelta(minutes=5)
-    if helper.is_dst(pytz.timezone(config["TIMEZONE"])):
-        tz_date = tz_date + timedelta(hours=1)
-
     logging.debug('Files:')
     for folder in folders:
         logging.debug("%s (%s)", folder['name'], folder['id'])
@@ -443,22 +724,73 @@ def manage_folder(date: datetime, username: str, channel_name: str = None, locat
         if len(folder_name_split) > 2:
             folder_name_channel_name = ' '.join(folder_name_split[2:])
         else:
-            folder_name_bot = ""
-        logging.debug("channel_name %s", folder_name_channel_name)
+            folder_name_channel_name = ""
+        logging.debug("channel_name %s", target_name)
         logging.debug("folder name channel name %s", folder_name_channel_name)
-        if fodler_name_date == tz_date.date().isoformat() \
+        if fodler_name_date == date_iso \
         and folder_name_bot == "Bot" \
-        and (channel_name is None or folder_name_channel_name == channel_name):
-            return search_protest_folder(folder['id'], username)
-    if location is not None:
-        parent_folder_name = f"{tz_date.date().isoformat()} Bot {location}"
-    elif channel_name is not None: 
-        parent_folder_name = f"{tz_date.date().isoformat()} Bot {channel_name}"
+        and (target_name is None or folder_name_channel_name == target_name):
+            return folder['id']
+    return None
+
+def _find_or_create_parent_folder(date_iso: str, target_name: str, username: str) -> tuple:
+    """
+    Search the parent folder and create the folder tree if it does not exist.
+    Returns: The protest folder and the username of its Tickerbiene folder.
+    If the parent folder existed only its id is set and the username is None.
+    """
+    parent_folder_id = _find_parent_folder(date_iso, target_name)
+    if parent_folder_id is not None:
+        return ProtestFolder(parent_folder_id), None
+    if target_name is not None:
+        parent_folder_name = f"{date_iso} Bot {target_name}"
     else:
-        parent_folder_name = f"{tz_date.date().isoformat()} Bot  "
-    parent_folder = create_parent_folder(parent_folder_name, username)
+        parent_folder_name = f"{date_iso} Bot  "
+    return create_parent_folder(parent_folder_name, username), username
+
+def _resolve_protest_folder(cache_key: tuple, username: str, target_name: str) -> ProtestFolder:
+    # Another flight may have finished while this one waited for its turn.
+    cached_folder = folder_cache.get(*cache_key)
+    if cached_folder is not None:
+        return ProtestFolder(**cached_folder)
+    # Messages of several Tickerbienen may arrive at the same time,
+    # only one of them may create the parent folder.
+    protest_folder, tickerbiene = folder_flight.do(
+        ("parent", cache_key[0], target_name),
+        _find_or_create_parent_folder, cache_key[0], target_name, username
+    )
+    if tickerbiene != username:
+        protest_folder = search_protest_folder(protest_folder.parent_folder_id, username)
+    folder_cache.put(*cache_key, vars(protest_folder))
+    return protest_folder
 
-    return parent_folder
+@metrics.MANAGE_FOLDER_SECONDS.time()
+@tracing.traced("manage_folder")
+def manage_folder(date: datetime, username: str, channel_name: str = None, location: str = None) -> ProtestFolder:
+    """
+    Get a list for all folders in the shared drive of the Presse Ag 
+    in the Subfolder ./Pressemitteilungen/Protest
+    Concurrent calls for the same folders wait for the first call,
+    so a folder tree is not created twice.
+    Returns : Folder Id
+    :raises:
+    HttpError: if a connection error occured.
+    """
+    tz_date = date.replace(tzinfo=pytz.timezone(config["TIMEZONE"])).astimezone()
+    date = date + timedelta(minutes=5)
+    if helper.is_dst(pytz.timezone(config["TIMEZONE"])):
+        tz_date = tz_date + timedelta(hours=1)
+
+    target_name = location if location is not None else channel_name
+    cache_key = (tz_date.date().isoformat(), target_name, username)
+    cached_folder = folder_cache.get(*cache_key)
+    if cached_folder is not None:
+        logging.debug("Use cached protest folder %s", cached_folder["parent_folder_id"])
+        return ProtestFolder(**cached_folder)
+
+    return folder_flight.do(
+        ("tree", *cache_key), _resolve_protest_folder, cache_key, username, target_name
+    )
 
 QUERRY_MAIN = "mimeType='application/vnd.google-apps.folder' and trashed=false"
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""
+Shared Google Drive API client.
+"""
+import datetime
+import json
+import logging
+import threading
+from typing import Callable
+
+# pylint: disable=import-error
+import httplib2
+import google_auth_httplib2
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+# Refresh the access token this long before it expires.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+class DriveClient:
+    """
+    Hold one set of credentials for the whole process and one drive service per thread.
+    The credentials are loaded once. The access token is refreshed before it expires.
+    Each thread gets its own http connection, since httplib2 is not thread-safe,
+    which is reused for every call of that thread.
+    An api endpoint replaces https://www.googleapis.com/ for every request,
+    including uploads and batch requests, e.g. to run against a fake drive.
+    """
+    def __init__(
+            self,
+            credentials_loader: Callable[[], Credentials],
+            timeout: int = 600,
+            api_endpoint: str = None
+        ):
+        self._credentials_loader = credentials_loader
+        self._credentials = None
+        self._timeout = timeout
+        self._api_endpoint = api_endpoint
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        """
+        Load the credentials and build the service of the calling thread.
+        Call once at startup, so the first upload does not pay for it.
+        """
+        self.service()
+
+    def _fresh_credentials(self) -> Credentials:
+        with self._lock:
+            if self._credentials is None:
+                logging.info("Load drive credentials")
+                self._credentials = self._credentials_loader()
+            credentials = self._credentials
+            expiry = credentials.expiry
+            if not credentials.token or (
+                expiry is not None
+                and expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
+            ):
+                logging.info("Refresh drive access token")
+                credentials.refresh(Request())
+        return credentials
+
+    def service(self):
+        """
+        Get the drive service of the calling thread.
+        Returns: Drive v3 service
+        """
+        credentials = self._fresh_credentials()
+        service = getattr(self._local, "service", None)
+        if service is None:
+            logging.debug("Build drive service for thread %s", threading.current_thread().name)
+            connection = httplib2.Http(timeout=self._timeout)
+            # Resumable uploads answer 308 without a Location header,
+            # it must not be followed as redirect.
+            connection.redirect_codes = connection.redirect_codes - {308}
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=connection)
+            if self._api_endpoint:
+                # The batch and upload urls are taken from the root url of the
+                # discovery document, not from the api_endpoint client option.
+                document = json.loads(get_static_doc('drive', 'v3'))
+                document['rootUrl'] = self._api_endpoint
+                document['baseUrl'] = self._api_endpoint + document['servicePath']
+                service = build_from_document(document, http=http)
+            else:
+                service = build('drive', 'v3', http=http, cache_discovery=False)
+            self._local.service = service
+        return service
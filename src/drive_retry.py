@@ -0,0 +1,109 @@
+"""
+Retry calls to the google drive api with exponential backoff.
+"""
+import json
+import logging
+import random
+import time
+from typing import Callable
+
+# pylint: disable=import-error
+import httplib2
+from googleapiclient.errors import HttpError
+
+from ratelimit import TokenBucket
+import metrics
+import tracing
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Errors of a drive call which are retried, or raised once the retries are used up.
+DRIVE_ERRORS = (HttpError, httplib2.HttpLib2Error, ConnectionError, TimeoutError)
+RATE_LIMIT_REASONS = {"userRateLimitExceeded", "rateLimitExceeded"}
+
+
+class Retry:
+    """
+    Call drive with jittered exponential backoff on rate limit and server errors.
+    A Retry-After header of the response is honoured. All calls take a token
+    from a shared bucket first, so the bot stays below the request quota.
+    """
+    def __init__(
+            self,
+            max_retries: int,
+            base_delay: float,
+            max_delay: float,
+            requests_per_second: float
+        ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_limit = TokenBucket(requests_per_second, requests_per_second)
+
+    @staticmethod
+    def _reasons(error: HttpError) -> set:
+        try:
+            content = json.loads(error.content)
+            return {detail.get("reason") for detail in content["error"].get("errors", [])}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return set()
+
+    @classmethod
+    def is_retryable(cls, error: Exception) -> bool:
+        """
+        Returns: True if the call may succeed when it is repeated
+        """
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            return status in RETRY_STATUS \
+                or (status == 403 and bool(cls._reasons(error) & RATE_LIMIT_REASONS))
+        return isinstance(error, (httplib2.HttpLib2Error, ConnectionError, TimeoutError))
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.base_delay * 2 ** attempt, self.max_delay))
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get("retry-after")
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        return delay
+
+    @staticmethod
+    def _method(function: Callable) -> str:
+        # Bound methods of api requests know the name of the api method.
+        request = getattr(function, "__self__", None)
+        return getattr(request, "methodId", None) or function.__name__
+
+    def call(self, function: Callable, *args, cost: int = 1, method: str = None, **kwargs):
+        """
+        Call the function and retry it while it raises retryable errors.
+        Args: The function, its arguments, the number of drive requests it makes
+        and the api method counted in the metrics if the function is no api request
+        Returns: Result of the function
+        :raises:
+        HttpError: if the error is not retryable or the retries are used up.
+        """
+        method = method or self._method(function)
+        requests = metrics.DRIVE_REQUESTS.labels(method)
+        attempt = 0
+        with tracing.span(method, cost=cost) as call_span:
+            while True:
+                if call_span is not None:
+                    call_span.set(attempts=attempt + 1)
+                self.request_limit.acquire(cost)
+                requests.inc(cost)
+                try:
+                    return function(*args, **kwargs)
+                except DRIVE_ERRORS as error:
+                    if attempt >= self.max_retries or not self.is_retryable(error):
+                        raise
+                    delay = self._delay(attempt, error)
+                    logging.warning("Drive call failed, retry %d in %.1f seconds: %s",
+                        attempt + 1, delay, error)
+                    time.sleep(delay)
+                    attempt += 1
+
+    def execute(self, request):
+        """
+        Execute a drive api request with retries.
+        Returns: The response of the request
+        """
+        return self.call(request.execute)
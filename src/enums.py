@@ -9,3 +9,27 @@ class Media(Enum):
     """
     IMAGE = 1
     VIDEO = 2
+
+class TickerbieneMode(Enum):
+    """
+    How a file is placed into the Tickerbiene folder after the upload
+    """
+    UPLOAD = "upload"
+    COPY = "copy"
+    SHORTCUT = "shortcut"
+    RENDITION = "rendition"
+
+class FileCleanup(Enum):
+    """
+    What happens to the file on the telegram-bot-api volume after its upload
+    """
+    KEEP = "keep"
+    DELETE = "delete"
+    MOVE = "move"
+
+class UpdateMode(Enum):
+    """
+    How the bot receives updates from the telegram-bot-api server
+    """
+    POLLING = "polling"
+    WEBHOOK = "webhook"
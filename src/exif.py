@@ -1,27 +1,421 @@
 """
-Read the exif data from an image.
+Read the capture time and the GPS position from the headers of images and videos.
+Only the metadata blocks of a file are read, the image or video data is never decoded.
+JPEG, PNG and TIFF carry EXIF and XMP blocks, HEIC and MP4/MOV are ISO base media
+files whose boxes are walked without reading the media data.
 """
-import PIL.Image
-import PIL.ExifTags
-import io
+from datetime import datetime, timedelta, timezone
+import os
+import re
+import struct
 
-def get_location_tags(image_path: str):
-    """Read the exif data from an image into a dicrionary.
-    Args: Image as bytes
-    Returns: Exif data as dictionary
+# A metadata block larger than this is skipped, an EXIF segment of a JPEG is at most 64 KiB.
+MAX_BLOCK_SIZE = 1024 * 1024
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATE_TIME = 0x0132
+DATE_TIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+# Size in bytes of the TIFF field types byte, ascii, short, long, rational,
+# undefined, signed long and signed rational
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+XMP_NAMESPACE = b"http://ns.adobe.com/xap/1.0/\0"
+XMP_DATES = ("exif:DateTimeOriginal", "photoshop:DateCreated", "xmp:CreateDate")
+HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1", b"avif")
+QUICKTIME_LOCATION = b"com.apple.quicktime.location.ISO6709"
+QUICKTIME_CREATION_DATE = b"com.apple.quicktime.creationdate"
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+# Seconds after MP4_EPOCH which still give a valid date.
+MP4_MAX_SECONDS = int((datetime.max.replace(tzinfo=timezone.utc) - MP4_EPOCH).total_seconds())
+ISO6709 = re.compile(rb"([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)")
+
+
+def _parse_date(text: str) -> str:
     """
-    img = PIL.Image.open(image_path)
-    exif_data = img._getexif()
+    Parse an EXIF date like 2024:02:14 08:15:30 or an ISO 8601 date.
+    Returns: The date in ISO format or None if it is not a valid date
+    """
+    text = text.strip()
+    try:
+        if re.match(r"\d{4}:\d\d:\d\d", text):
+            return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S").isoformat()
+        # Normalise the forms fromisoformat of Python 3.10 does not know.
+        text = re.sub(r"\.\d+", "", text)
+        text = re.sub(r"Z$", "+00:00", text)
+        text = re.sub(r"([+-]\d\d)(\d\d)$", r"\1:\2", text)
+        return datetime.fromisoformat(text).isoformat()
+    except ValueError:
+        return None
 
-    if exif_data == None:
+def _degrees(values, ref: str) -> float:
+    """
+    Returns: Degrees of GPS degrees, minutes and seconds, negative in the south and west
+    """
+    if not isinstance(values, list) or len(values) != 3 or not isinstance(ref, str):
         return None
-    else:
-        return exif_data['location']
+    degrees = values[0] + values[1] / 60 + values[2] / 3600
+    return round(-degrees if ref in ("S", "W") else degrees, 6)
 
-    # exif = {
-    #     PIL.ExifTags.TAGS[k]: v
-    #     for k, v in img._getexif().items()
-    #     if k in PIL.ExifTags.TAGS
-    # }
+def _read_ifd(data: bytes, byte_order: str, offset: int) -> dict:
+    """
+    Read the ascii, integer and rational fields of an image file directory.
+    Returns: Field values by tag
+    """
+    count, = struct.unpack_from(byte_order + "H", data, offset)
+    values = {}
+    for index in range(count):
+        tag, field_type, number, value = struct.unpack_from(
+            byte_order + "HHI4s", data, offset + 2 + index * 12
+        )
+        size = TYPE_SIZES.get(field_type, 0) * number
+        if size > 4:
+            start, = struct.unpack(byte_order + "I", value)
+            value = data[start:start + size]
+        if len(value) < size:
+            continue
+        if field_type == 2:
+            values[tag] = value[:size].split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        elif field_type in (3, 4) and number == 1:
+            values[tag], = struct.unpack_from(byte_order + ("H" if field_type == 3 else "I"), value)
+        elif field_type == 5:
+            numbers = struct.unpack_from(f"{byte_order}{2 * number}I", value)
+            values[tag] = [
+                numerator / denominator if denominator else 0.0
+                for numerator, denominator in zip(numbers[::2], numbers[1::2])
+            ]
+    return values
 
-    return exif_data 
+def _ifd_offset(tags: dict, tag: int) -> int:
+    """
+    Returns: Offset of the sub directory of the tag, or None if the tag is missing
+    or is not an integer field
+    """
+    offset = tags.get(tag)
+    return offset if isinstance(offset, int) else None
+
+def _parse_tiff(data: bytes) -> dict:
+    """
+    Read capture time and GPS position from an EXIF block, which is a TIFF structure.
+    """
+    byte_order = {b"II": "<", b"MM": ">"}.get(data[:2])
+    if byte_order is None:
+        return {}
+    offset, = struct.unpack_from(byte_order + "I", data, 4)
+    tags = _read_ifd(data, byte_order, offset)
+    metadata = {}
+    exif_offset = _ifd_offset(tags, EXIF_IFD)
+    exif_tags = _read_ifd(data, byte_order, exif_offset) if exif_offset is not None else {}
+    captured = exif_tags.get(DATE_TIME_ORIGINAL) or tags.get(DATE_TIME)
+    if isinstance(captured, str) and _parse_date(captured):
+        metadata["captured"] = _parse_date(captured)
+    gps_offset = _ifd_offset(tags, GPS_IFD)
+    if gps_offset is not None:
+        gps = _read_ifd(data, byte_order, gps_offset)
+        latitude = _degrees(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF))
+        longitude = _degrees(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF))
+        if latitude is not None and longitude is not None:
+            metadata["latitude"], metadata["longitude"] = latitude, longitude
+    return metadata
+
+def _xmp_value(xmp: str, name: str) -> str:
+    # Properties are written as attribute or as element.
+    match = re.search(re.escape(name) + r'(?:="|>)([^"<]+)', xmp)
+    return match.group(1) if match else None
+
+def _xmp_degrees(value: str) -> float:
+    # XMP writes GPS coordinates as 48,12.492N or 48,12,29.52N
+    if not value or value[-1] not in "NSEW":
+        return None
+    parts = [float(part) for part in value[:-1].split(",")]
+    parts += [0.0] * (3 - len(parts))
+    return _degrees(parts[:3], value[-1])
+
+def _parse_xmp(data: bytes) -> dict:
+    """
+    Read capture time and GPS position from an XMP packet.
+    """
+    xmp = data.decode("utf-8", "replace")
+    metadata = {}
+    for name in XMP_DATES:
+        captured = _xmp_value(xmp, name)
+        if captured and _parse_date(captured):
+            metadata["captured"] = _parse_date(captured)
+            break
+    latitude = _xmp_degrees(_xmp_value(xmp, "exif:GPSLatitude"))
+    longitude = _xmp_degrees(_xmp_value(xmp, "exif:GPSLongitude"))
+    if latitude is not None and longitude is not None:
+        metadata["latitude"], metadata["longitude"] = latitude, longitude
+    return metadata
+
+def _read_jpeg(file) -> dict:
+    """
+    Read the APP1 segments of a JPEG up to the start of the image data.
+    """
+    exif, xmp = {}, {}
+    file.seek(2)
+    while True:
+        marker = file.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+            # End of file, garbage or start of scan, the image data follows.
+            break
+        length, = struct.unpack(">H", marker[2:])
+        if length < 2:
+            # The length counts its own two bytes, a smaller one would loop forever.
+            break
+        if marker[1] == 0xE1:
+            segment = file.read(length - 2)
+            if segment.startswith(b"Exif\0\0"):
+                exif = _parse_tiff(segment[6:])
+            elif segment.startswith(XMP_NAMESPACE):
+                xmp = _parse_xmp(segment[len(XMP_NAMESPACE):])
+        else:
+            file.seek(length - 2, os.SEEK_CUR)
+    return {**xmp, **exif}
+
+def _read_png(file) -> dict:
+    """
+    Read the eXIf and XMP chunks of a PNG up to the image data.
+    """
+    exif, xmp = {}, {}
+    offset = 8
+    while True:
+        file.seek(offset)
+        header = file.read(8)
+        if len(header) < 8:
+            break
+        length, kind = struct.unpack(">I4s", header)
+        if kind in (b"IDAT", b"IEND"):
+            break
+        if length <= MAX_BLOCK_SIZE:
+            if kind == b"eXIf":
+                exif = _parse_tiff(file.read(length))
+            elif kind == b"iTXt":
+                chunk = file.read(length)
+                if chunk.startswith(b"XML:com.adobe.xmp\0"):
+                    xmp = _parse_xmp(chunk)
+        # Length, type, data and CRC
+        offset += 12 + length
+    return {**xmp, **exif}
+
+def _boxes(file, start: int, end: int):
+    """
+    Iterate over the boxes of an ISO base media file between start and end.
+    Returns: Iterator of the box type and the start and end of its payload
+    """
+    offset = start
+    while offset + 8 <= end:
+        file.seek(offset)
+        size, kind = struct.unpack(">I4s", file.read(8))
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack(">Q", file.read(8))
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield kind, offset + header_size, min(offset + size, end)
+        offset += size
+
+def _children(file, start: int, end: int) -> dict:
+    return {kind: (child_start, child_end) for kind, child_start, child_end in _boxes(file, start, end)}
+
+def _read_block(file, start: int, end: int) -> bytes:
+    if end - start > MAX_BLOCK_SIZE:
+        return b""
+    file.seek(start)
+    return file.read(end - start)
+
+def _meta_start(file, start: int) -> int:
+    # The meta box is a full box with version and flags in MP4 and HEIF, but not in QuickTime.
+    file.seek(start + 4)
+    return start if file.read(4) == b"hdlr" else start + 4
+
+def _uint(data: bytes, position: int, size: int) -> tuple:
+    return int.from_bytes(data[position:position + size], "big"), position + size
+
+def _heif_exif_location(iinf: bytes, iloc: bytes) -> tuple:
+    """
+    Find the EXIF item of a HEIF file in the item information and location boxes.
+    Returns: Offset and length of the EXIF item in the file or None
+    """
+    version = iinf[0]
+    position = 6 if version == 0 else 8
+    exif_item = None
+    while position + 8 <= len(iinf):
+        size, = struct.unpack_from(">I", iinf, position)
+        if iinf[position + 4:position + 8] == b"infe" and iinf[position + 8] >= 2:
+            item_id, item_position = _uint(iinf, position + 12, 2 if iinf[position + 8] == 2 else 4)
+            if iinf[item_position + 2:item_position + 6] == b"Exif":
+                exif_item = item_id
+                break
+        if size < 8:
+            break
+        position += size
+    if exif_item is None:
+        return None
+
+    version = iloc[0]
+    offset_size, length_size = iloc[4] >> 4, iloc[4] & 0x0F
+    base_offset_size = iloc[5] >> 4
+    index_size = iloc[5] & 0x0F if version in (1, 2) else 0
+    item_count, position = _uint(iloc, 6, 2 if version < 2 else 4)
+    for _ in range(item_count):
+        if position >= len(iloc):
+            # The count is larger than the box, the rest would read zeros.
+            break
+        item_id, position = _uint(iloc, position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method, position = _uint(iloc, position, 2)
+            construction_method &= 0x0F
+        position += 2  # data reference index
+        base_offset, position = _uint(iloc, position, base_offset_size)
+        extent_count, position = _uint(iloc, position, 2)
+        extents = []
+        for _ in range(extent_count):
+            position += index_size
+            extent_offset, position = _uint(iloc, position, offset_size)
+            extent_length, position = _uint(iloc, position, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        if item_id == exif_item:
+            # Only items stored at an offset in the file are supported.
+            return extents[0] if construction_method == 0 and extents else None
+    return None
+
+def _read_heif(file, meta_start: int, meta_end: int) -> dict:
+    boxes = _children(file, meta_start + 4, meta_end)
+    if b"iinf" not in boxes or b"iloc" not in boxes:
+        return {}
+    location = _heif_exif_location(_read_block(file, *boxes[b"iinf"]), _read_block(file, *boxes[b"iloc"]))
+    if location is None or location[1] > MAX_BLOCK_SIZE \
+            or location[0] + location[1] > os.fstat(file.fileno()).st_size:
+        return {}
+    file.seek(location[0])
+    item = file.read(location[1])
+    # The EXIF item starts with the offset of the TIFF header.
+    tiff_offset, = struct.unpack_from(">I", item)
+    return _parse_tiff(item[4 + tiff_offset:])
+
+def _parse_iso6709(value: bytes) -> dict:
+    match = ISO6709.match(value)
+    if match is None:
+        return {}
+    return {"latitude": round(float(match.group(1)), 6), "longitude": round(float(match.group(2)), 6)}
+
+def _read_quicktime_keys(file, meta_start: int, meta_end: int) -> dict:
+    """
+    Read location and creation date from the keys and item list of a QuickTime meta box.
+    """
+    boxes = _children(file, _meta_start(file, meta_start), meta_end)
+    if b"keys" not in boxes or b"ilst" not in boxes:
+        return {}
+    keys_data = _read_block(file, *boxes[b"keys"])
+    count, = struct.unpack_from(">I", keys_data, 4)
+    keys, position = {}, 8
+    for index in range(1, count + 1):
+        size, = struct.unpack_from(">I", keys_data, position)
+        if size < 8:
+            break
+        keys[index] = keys_data[position + 8:position + size]
+        position += size
+    metadata = {}
+    for kind, start, end in _boxes(file, *boxes[b"ilst"]):
+        key = keys.get(int.from_bytes(kind, "big"))
+        if key not in (QUICKTIME_LOCATION, QUICKTIME_CREATION_DATE):
+            continue
+        data = _children(file, start, end).get(b"data")
+        if data is None:
+            continue
+        # Type indicator and locale precede the value.
+        value = _read_block(file, data[0] + 8, data[1])
+        if key == QUICKTIME_LOCATION:
+            metadata.update(_parse_iso6709(value))
+        elif _parse_date(value.decode("utf-8", "replace")):
+            metadata["captured"] = _parse_date(value.decode("utf-8", "replace"))
+    return metadata
+
+def _read_movie(file, moov_start: int, moov_end: int) -> dict:
+    """
+    Read creation time and location from the movie box of an MP4 or MOV.
+    """
+    metadata = {}
+    boxes = _children(file, moov_start, moov_end)
+    if b"mvhd" in boxes:
+        file.seek(boxes[b"mvhd"][0])
+        version = file.read(4)[0]
+        seconds, = struct.unpack(">Q" if version == 1 else ">I", file.read(8 if version == 1 else 4))
+        if 0 < seconds <= MP4_MAX_SECONDS:
+            metadata["captured"] = (MP4_EPOCH + timedelta(seconds=seconds)).isoformat()
+    if b"udta" in boxes:
+        location = _children(file, *boxes[b"udta"]).get(b"\xa9xyz")
+        if location is not None:
+            # Length and language precede the ISO 6709 string.
+            metadata.update(_parse_iso6709(_read_block(file, location[0] + 4, location[1])))
+    if b"meta" in boxes:
+        metadata.update(_read_quicktime_keys(file, *boxes[b"meta"]))
+    return metadata
+
+def _read_iso_media(file) -> dict:
+    end = os.fstat(file.fileno()).st_size
+    boxes = _children(file, 0, end)
+    file.seek(8)
+    if file.read(4) in HEIF_BRANDS and b"meta" in boxes:
+        return _read_heif(file, *boxes[b"meta"])
+    if b"moov" in boxes:
+        return _read_movie(file, *boxes[b"moov"])
+    return {}
+
+def read_metadata(file_path: str) -> dict:
+    """
+    Read the capture time and GPS position from the headers of an image or video.
+    The type of the file is detected from its first bytes, not from its name.
+    Args: Path of a JPEG, PNG, TIFF, HEIC, MP4 or MOV file
+    Returns: Dictionary with the captured date in ISO format and the latitude and
+    longitude in degrees, keys without a value in the file are missing
+    :raises:
+    OSError: if the file can not be read.
+    """
+    with open(file_path, "rb") as file:
+        magic = file.read(12)
+        try:
+            if magic.startswith(b"\xff\xd8"):
+                return _read_jpeg(file)
+            if magic.startswith(b"\x89PNG\r\n\x1a\n"):
+                return _read_png(file)
+            if magic[:4] in (b"II*\0", b"MM\0*"):
+                file.seek(0)
+                return _parse_tiff(file.read(MAX_BLOCK_SIZE))
+            if magic[4:8] == b"ftyp":
+                return _read_iso_media(file)
+        except (struct.error, IndexError, ValueError):
+            # Broken metadata is ignored, the file is uploaded without it.
+            return {}
+    return {}
+
+def app_properties(metadata: dict) -> dict:
+    """
+    Returns: The metadata as appProperties of a drive file, which only hold strings
+    """
+    properties = {}
+    if "captured" in metadata:
+        properties["captured"] = metadata["captured"]
+    if "latitude" in metadata:
+        properties["latitude"] = f"{metadata['latitude']:.6f}"
+        properties["longitude"] = f"{metadata['longitude']:.6f}"
+    return properties
+
+def get_location_tags(image_path: str) -> dict:
+    """Read the GPS position of an image or video from its headers.
+    Args: Path of the file
+    Returns: Dictionary with latitude and longitude or None if the file has no position
+    """
+    metadata = read_metadata(image_path)
+    if "latitude" not in metadata:
+        return None
+    return {"latitude": metadata["latitude"], "longitude": metadata["longitude"]}
@@ -0,0 +1,99 @@
+"""
+Cache the folder ids of the protest folders in memory and on disk.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class FolderCache:
+    """
+    Cache of protest folder ids keyed by date, channel and username.
+    Entries are kept in memory and in a SQLite database, so the cache
+    survives restarts of the bot. Entries expire after the ttl in seconds.
+    """
+    def __init__(self, db_path: str, ttl: float):
+        self.ttl = ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS protest_folders (
+                    date TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    parent_folder_id TEXT NOT NULL,
+                    folders TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (date, channel, username)
+                )"""
+            )
+
+    @staticmethod
+    def _key(date: str, channel: str, username: str) -> tuple:
+        # SQLite treats NULL values in a primary key as distinct.
+        return (date, channel or "", username or "")
+
+    def get(self, date: str, channel: str, username: str) -> dict:
+        """
+        Get the cached folder ids or None if the entry is missing or expired.
+        Returns: Folder ids as dictionary
+        """
+        key = self._key(date, channel, username)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    return dict(entry[1])
+                del self._memory[key]
+            row = self._connection.execute(
+                "SELECT folders, expires FROM protest_folders \
+                    WHERE date=? AND channel=? AND username=?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                with self._connection:
+                    self._connection.execute(
+                        "DELETE FROM protest_folders WHERE date=? AND channel=? AND username=?",
+                        key
+                    )
+                return None
+            folders = json.loads(row[0])
+            self._memory[key] = (row[1], folders)
+            return dict(folders)
+
+    def put(self, date: str, channel: str, username: str, folders: dict):
+        """
+        Store the folder ids of a protest folder.
+        """
+        key = self._key(date, channel, username)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._memory[key] = (expires, dict(folders))
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO protest_folders VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, folders["parent_folder_id"], json.dumps(folders), expires)
+                )
+
+    def invalidate(self, parent_folder_id: str):
+        """
+        Remove every entry of the protest folder with the given parent folder id.
+        """
+        logging.info("Invalidate cached protest folder %s", parent_folder_id)
+        with self._lock:
+            self._memory = {
+                key: entry for key, entry in self._memory.items()
+                if entry[1]["parent_folder_id"] != parent_folder_id
+            }
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM protest_folders WHERE parent_folder_id=?",
+                    (parent_folder_id,)
+                )
@@ -0,0 +1,74 @@
+"""
+Cache the names of reverse geocoded places in memory and on disk.
+"""
+from collections import OrderedDict
+import sqlite3
+import threading
+import time
+
+
+class GeocodeCache:
+    """
+    Cache of place names keyed by geohash cell. Entries are kept in memory and in
+    a SQLite database, so the cache survives restarts of the bot. Places do not
+    move, so entries do not expire. Above max_entries the least recently used
+    entries are evicted.
+    """
+    def __init__(self, db_path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS places (
+                    cell TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    used REAL NOT NULL
+                )"""
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS places_used ON places (used)")
+
+    def _remember(self, cell: str, name: str):
+        self._memory[cell] = name
+        self._memory.move_to_end(cell)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, cell: str) -> str:
+        """
+        Get the cached name of the cell or None if the cell is not cached.
+        Returns: Name of the place
+        """
+        with self._lock:
+            if cell in self._memory:
+                self._memory.move_to_end(cell)
+                return self._memory[cell]
+            row = self._connection.execute(
+                "SELECT name FROM places WHERE cell=?", (cell,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Hits from memory are not written back, only loading an entry counts as use.
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE places SET used=? WHERE cell=?", (time.time(), cell)
+                )
+            self._remember(cell, row[0])
+            return row[0]
+
+    def put(self, cell: str, name: str):
+        """
+        Store the name of the place in the cell and evict the least recently used entries.
+        """
+        with self._lock:
+            self._remember(cell, name)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO places VALUES (?, ?, ?)", (cell, name, time.time())
+                )
+                self._connection.execute(
+                    "DELETE FROM places WHERE cell IN (SELECT cell FROM places \
+                        ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
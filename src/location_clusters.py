@@ -0,0 +1,74 @@
+"""
+Cluster the GPS positions of the files of a day into protest locations.
+"""
+import math
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320
+
+
+class LocationCluster:
+    """
+    Location of a protest. The first position names the location,
+    seen is the time of its latest file and name the name of its folder.
+    """
+    def __init__(self, latitude: float, longitude: float, seen: float):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.seen = seen
+        self.name = None
+
+
+class LocationClusters:
+    """
+    Incremental clustering of positions on a grid of square cells of cell_metres.
+    A file joins the cluster of its cell or of a neighbouring cell if that cluster
+    got a file within window seconds, otherwise it starts a new cluster. Its cell then
+    points to the cluster, so a cluster follows a march through the grid. An assignment
+    looks at nine cells, so it costs the same for the first and the thousandth file
+    of a day. The grid starts empty every day.
+    """
+    def __init__(self, cell_metres: float, window: float):
+        self.cell_metres = cell_metres
+        self.window = window
+        self._day = None
+        self._cells = {}
+
+    def _cell(self, latitude: float, longitude: float) -> tuple:
+        row = math.floor(latitude * METRES_PER_DEGREE / self.cell_metres)
+        # The width of a degree of longitude shrinks towards the poles,
+        # the cells of a row use the width at the middle of the row.
+        row_latitude = (row + 0.5) * self.cell_metres / METRES_PER_DEGREE
+        metres_per_longitude = METRES_PER_DEGREE * max(math.cos(math.radians(row_latitude)), 0.01)
+        return row, math.floor(longitude * metres_per_longitude / self.cell_metres)
+
+    def _active(self, cell: tuple, timestamp: float) -> LocationCluster:
+        cluster = self._cells.get(cell)
+        if cluster is not None and timestamp - cluster.seen <= self.window:
+            return cluster
+        return None
+
+    def assign(self, day: str, timestamp: float, latitude: float, longitude: float) -> LocationCluster:
+        """
+        Assign a file to the cluster of its position.
+        Args: The day of the file, its time as timestamp and its position
+        Returns: The cluster of the file
+        """
+        if day != self._day:
+            self._day = day
+            self._cells = {}
+        row, column = self._cell(latitude, longitude)
+        cluster = self._active((row, column), timestamp)
+        if cluster is None:
+            neighbours = [
+                self._active((row + row_offset, column + column_offset), timestamp)
+                for row_offset in (-1, 0, 1) for column_offset in (-1, 0, 1)
+            ]
+            neighbours = [neighbour for neighbour in neighbours if neighbour is not None]
+            # The most recently active neighbour is most likely the same protest.
+            cluster = max(neighbours, key=lambda neighbour: neighbour.seen, default=None)
+        if cluster is None:
+            cluster = LocationCluster(latitude, longitude, timestamp)
+        cluster.seen = max(cluster.seen, timestamp)
+        self._cells[(row, column)] = cluster
+        return cluster
@@ -1,7 +1,22 @@
-import googlemaps
-from datetime import datetime
-import requests
+"""
+Reverse geocoding of GPS positions to place names.
+"""
+import asyncio
+import logging
 import os
+from typing import Awaitable, Callable
+
+# pylint: disable=import-error
+import httpx
+import requests
+
+from geocode_cache import GeocodeCache
+from ratelimit import TokenBucket
+import drive
+
+GEOCODE_CACHE_FILE_PATH = "var/geocode_cache.db"
+LOCATION_IQ_ENDPOINT = "https://us1.locationiq.com/"
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
 
 # gmaps = googlemaps.Client(key='Add Your Key here')
 
@@ -11,6 +26,135 @@ import os
 # # Look up an address with reverse geocoding
 # reverse_geocode_result = gmaps.reverse_geocode((40.714224, -73.961452))
 
-def get_location(lat:str, lon:str):
-    resp = requests.get(f"https://us1.locationiq.com/v1/reverse?key={os.environ['LOCATION_IQ_API_TOKEN']}&lat={lat}&lon={lon}&format=json")
-    return f"{resp.json()['address']['city']}_{resp.json()['address']['road']}"
\ No newline at end of file
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """
+    Encode a position as geohash. Positions in the same cell share the hash,
+    7 characters are a cell of about 150 by 150 metres.
+    Returns: Geohash with precision characters
+    """
+    ranges = {False: [-90.0, 90.0], True: [-180.0, 180.0]}
+    code = []
+    bits = bit_count = 0
+    is_longitude = True
+    while len(code) < precision:
+        value_range = ranges[is_longitude]
+        value = longitude if is_longitude else latitude
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        is_longitude = not is_longitude
+        bit_count += 1
+        if bit_count == 5:
+            code.append(GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return "".join(code)
+
+def format_address(address: dict) -> str:
+    """
+    Returns: Name of the place of an address, e.g. Wien_Ringstraße
+    """
+    city = address.get("city") or address.get("town") or address.get("village") \
+        or address.get("municipality")
+    road = address.get("road") or address.get("pedestrian") or address.get("suburb")
+    return "_".join(part for part in (city, road) if part)
+
+
+class LocationIqProvider:
+    """
+    Reverse geocoding with the LocationIQ API.
+    Args: The API token, the root url of the API and the timeout of a request
+    """
+    def __init__(self, token: str, api_endpoint: str = LOCATION_IQ_ENDPOINT, timeout: float = 10):
+        self.token = token
+        self.api_endpoint = api_endpoint
+        self.timeout = timeout
+
+    async def __call__(self, latitude: float, longitude: float) -> str:
+        """
+        Returns: Name of the place at the position
+        :raises:
+        httpx.HTTPError: if the request failed.
+        """
+        # Lookups are rate limited, a client per lookup costs nothing noticeable.
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.get(f"{self.api_endpoint}v1/reverse", params={
+                "key": self.token, "lat": latitude, "lon": longitude, "format": "json"
+            })
+        response.raise_for_status()
+        return format_address(response.json().get("address", {}))
+
+
+class Geocoder:
+    """
+    Reverse geocoding with a persistent cache per geohash cell. Positions in the
+    same cell share one lookup, e.g. the photos of a protest in one street.
+    Concurrent lookups of a cell wait for the first one, and the lookups of the
+    provider are rate limited.
+    Args: Coroutine function returning the place name of a latitude and longitude,
+    the cache, the geohash precision of a cell and the rate limit of the provider
+    """
+    def __init__(
+            self,
+            provider: Callable[[float, float], Awaitable[str]],
+            cache: GeocodeCache,
+            precision: int,
+            rate_limit: TokenBucket
+        ):
+        self.provider = provider
+        self.cache = cache
+        self.precision = precision
+        self.rate_limit = rate_limit
+        self._in_flight = {}
+
+    async def _lookup(self, cell: str, latitude: float, longitude: float) -> str:
+        await self.rate_limit.acquire_async()
+        logging.info("Reverse geocode cell %s", cell)
+        name = await self.provider(latitude, longitude)
+        self.cache.put(cell, name)
+        return name
+
+    async def reverse(self, latitude: float, longitude: float) -> str:
+        """
+        Get the name of the place at the position.
+        Returns: Name of the place, empty if the provider knows no city or road
+        :raises:
+        httpx.HTTPError: if the lookup of the provider failed. Failures are not cached.
+        """
+        cell = geohash(latitude, longitude, self.precision)
+        name = self.cache.get(cell)
+        if name is not None:
+            return name
+        lookup = self._in_flight.get(cell)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._lookup(cell, latitude, longitude))
+            self._in_flight[cell] = lookup
+            lookup.add_done_callback(lambda _: self._in_flight.pop(cell, None))
+        # A cancelled caller does not cancel the lookup the other callers wait for.
+        return await asyncio.shield(lookup)
+
+
+geocoder = Geocoder(
+    LocationIqProvider(
+        os.environ.get("LOCATION_IQ_API_TOKEN"),
+        drive.config.get("GEOCODE_API_ENDPOINT") or LOCATION_IQ_ENDPOINT
+    ),
+    GeocodeCache(GEOCODE_CACHE_FILE_PATH, drive.config.get("GEOCODE_CACHE_SIZE", 10000)),
+    drive.config.get("GEOCODE_PRECISION", 7),
+    TokenBucket(drive.config.get("GEOCODE_REQUESTS_PER_SECOND", 1), 1)
+)
+
+def get_location(lat: str, lon: str) -> str:
+    """
+    Look up the name of the place at the position without cache, e.g. in scripts.
+    The bot uses geocoder.reverse, which does not block the event loop.
+    Returns: Name of the place
+    """
+    resp = requests.get(f"{LOCATION_IQ_ENDPOINT}v1/reverse", params={
+        "key": os.environ['LOCATION_IQ_API_TOKEN'], "lat": lat, "lon": lon, "format": "json"
+    }, timeout=10)
+    resp.raise_for_status()
+    return format_address(resp.json().get("address", {}))
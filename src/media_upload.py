@@ -0,0 +1,86 @@
+"""
+Read local files for uploads and hashing without allocating a buffer per chunk.
+"""
+import os
+from typing import Iterator
+
+# pylint: disable=import-error
+from googleapiclient.http import MediaUpload
+
+
+def _read_into(file, view: memoryview, offset: int) -> int:
+    """
+    Fill the view with the file content at the offset.
+    Returns: Number of bytes read, less than the view only at the end of the file
+    """
+    file.seek(offset)
+    read = 0
+    while read < len(view):
+        count = file.readinto(view[read:])
+        if not count:
+            break
+        read += count
+    return read
+
+def read_chunks(file_path: str, chunk_size: int) -> Iterator[memoryview]:
+    """
+    Read a file in chunks into one reused buffer.
+    A chunk is only valid until the next chunk is read.
+    Returns: Iterator of views of the buffer
+    """
+    buffer = memoryview(bytearray(chunk_size))
+    with open(file_path, "rb", buffering=0) as file:
+        offset = 0
+        while True:
+            count = _read_into(file, buffer, offset)
+            if not count:
+                break
+            yield buffer[:count]
+            offset += count
+
+
+class FileMediaUpload(MediaUpload):
+    """
+    Resumable upload of an open file, read chunk by chunk into one reused buffer.
+    The chunks are passed to the connection as views of the buffer, so neither
+    the file nor a chunk is copied into new bytes objects. Open the file unbuffered,
+    so the chunks are read directly from the file into the buffer.
+    """
+    def __init__(self, file, mimetype: str, chunksize: int):
+        super().__init__()
+        self._file = file
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._size = os.fstat(file.fileno()).st_size
+        self._buffer = memoryview(bytearray(min(chunksize, max(self._size, 1))))
+
+    def chunksize(self) -> int:
+        return self._chunksize
+
+    def mimetype(self) -> str:
+        return self._mimetype
+
+    def size(self) -> int:
+        return self._size
+
+    def resumable(self) -> bool:
+        return True
+
+    def has_stream(self) -> bool:
+        return False
+
+    def getbytes(self, begin: int, end: int) -> memoryview:
+        """
+        The second argument is named end like in MediaUpload, but it is the number of
+        bytes to read, as googleapiclient passes it.
+        Returns: View of the buffer with up to end bytes of the file from begin on
+        """
+        length = min(end, len(self._buffer))
+        return self._buffer[:_read_into(self._file, self._buffer[:length], begin)]
+
+    def to_json(self):
+        """
+        This upload type is not serializable, like MediaIoBaseUpload, because it holds
+        an open file. An interrupted upload is started again from the upload queue.
+        """
+        raise NotImplementedError("FileMediaUpload is not serializable.")
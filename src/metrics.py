@@ -0,0 +1,68 @@
+"""
+Prometheus metrics of the bot, served on /metrics.
+The default process collector adds the memory and cpu usage of the bot.
+"""
+import logging
+
+# pylint: disable=import-error
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from enums import Media
+
+TIME_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+THROUGHPUT_BUCKETS = tuple(mbit * 1000 * 1000 / 8 for mbit in (1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+FILES_RECEIVED = Counter(
+    "bot_files_received", "Files received from telegram", ["media", "channel"]
+)
+FILES_DOWNLOADED = Counter(
+    "bot_files_downloaded", "Files downloaded from telegram", ["media", "channel"]
+)
+FILES_UPLOADED = Counter(
+    "bot_files_uploaded", "Files uploaded to google drive", ["media", "channel"]
+)
+FILES_FAILED = Counter(
+    "bot_files_failed", "Files which could not be downloaded or uploaded", ["media", "channel"]
+)
+DOWNLOAD_SECONDS = Histogram(
+    "bot_download_seconds", "Time to download a file from telegram", ["media"],
+    buckets=TIME_BUCKETS
+)
+MANAGE_FOLDER_SECONDS = Histogram(
+    "bot_manage_folder_seconds", "Time to search or create the protest folder",
+    buckets=TIME_BUCKETS
+)
+UPLOAD_SECONDS = Histogram(
+    "bot_upload_seconds", "Time to upload a file to google drive", ["media"],
+    buckets=TIME_BUCKETS
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "bot_upload_throughput_bytes_per_second", "Bytes per second of an upload", ["media"],
+    buckets=THROUGHPUT_BUCKETS
+)
+DRIVE_REQUESTS = Counter(
+    "bot_drive_requests", "Requests sent to the google drive api", ["method"]
+)
+RENDITION_SAVED_BYTES = Counter(
+    "bot_rendition_saved_bytes", "Bytes saved by Tickerbiene renditions", ["media"]
+)
+RENDITION_CPU_SECONDS = Histogram(
+    "bot_rendition_cpu_seconds", "CPU time to render a Tickerbiene rendition", ["media"],
+    buckets=TIME_BUCKETS
+)
+UPLOADS_IN_FLIGHT = Gauge("bot_uploads_in_flight", "Upload jobs being uploaded")
+UPLOAD_QUEUE_DEPTH = Gauge("bot_upload_queue_depth", "Upload jobs waiting in the queue")
+
+
+def labels(media_type: Media, channel: str) -> dict:
+    """
+    Returns: Label values of the file counters
+    """
+    return {"media": Media(media_type).name.lower(), "channel": channel or ""}
+
+def start(port: int, address: str):
+    """
+    Serve the metrics on http://address:port/metrics in a background thread.
+    """
+    start_http_server(port, addr=address)
+    logging.info("Serve metrics on %s port %d", address, port)
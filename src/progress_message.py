@@ -0,0 +1,82 @@
+"""
+Status message which shows the progress of a large file and is edited in place.
+"""
+import asyncio
+import logging
+import time
+
+# pylint: disable=import-error
+from telegram import Bot
+from telegram.error import BadRequest, TelegramError
+
+# Telegram limits how often a message may be edited.
+EDIT_INTERVAL = 5
+
+
+class ProgressMessage:
+    """
+    Message in a chat showing what happens to a file. The message is sent on
+    the first report and edited on later reports, at most every EDIT_INTERVAL seconds
+    unless the phase changes.
+    """
+    def __init__(self, bot: Bot, chat_id, title: str, message_id: int = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.title = title
+        self.message_id = message_id
+        self._text = None
+        self._phase = None
+        self._edited = 0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _megabytes(size: int) -> str:
+        return f"{size / 1024 / 1024:.0f} MB"
+
+    def _is_due(self, phase: str, done: int, total: int) -> bool:
+        now = time.monotonic()
+        if phase == self._phase and now - self._edited < EDIT_INTERVAL \
+                and (total is None or done < total):
+            return False
+        self._phase = phase
+        self._edited = now
+        return True
+
+    def _format(self, phase: str, done: int, total: int) -> str:
+        text = f"{self.title}: {phase}"
+        if done is not None and total:
+            text += f" {done * 100 // total}% ({self._megabytes(done)} of {self._megabytes(total)})"
+        return text
+
+    async def _send(self, text: str):
+        async with self._lock:
+            if text == self._text:
+                return
+            self._text = text
+            try:
+                if self.message_id is None:
+                    message = await self.bot.send_message(chat_id=self.chat_id, text=text)
+                    self.message_id = message.message_id
+                else:
+                    await self.bot.edit_message_text(
+                        text=text, chat_id=self.chat_id, message_id=self.message_id
+                    )
+            except BadRequest as error:
+                # e.g. the message was deleted or is not modified
+                logging.debug("Could not edit progress message: %s", error)
+            except TelegramError as error:
+                logging.warning("Could not show progress of %s: %s", self.title, error)
+
+    async def show(self, phase: str, done: int = None, total: int = None):
+        """
+        Show the phase and the progress, e.g. downloading 45% (450 of 1000 MB).
+        """
+        if self._is_due(phase, done, total):
+            await self._send(self._format(phase, done, total))
+
+    def report(self, phase: str, done: int = None, total: int = None):
+        """
+        Show the progress from synchronous code running in the event loop.
+        """
+        if self._is_due(phase, done, total):
+            asyncio.get_running_loop().create_task(self._send(self._format(phase, done, total)))
@@ -0,0 +1,51 @@
+"""
+Rate limiting for calls to google drive and other APIs.
+"""
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens are refilled with rate tokens per second
+    up to the capacity. Taking more tokens than available blocks the caller
+    until the bucket has refilled, so concurrent callers share the rate.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """
+        Take the tokens from the bucket.
+        Returns: Seconds to wait until the tokens are covered by the rate
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # The bucket may go into debt, later callers wait until it is paid off.
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """
+        Take tokens from the bucket and block until they are available.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        """
+        Take tokens from the bucket and wait in the event loop until they are available.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
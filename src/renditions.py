@@ -0,0 +1,103 @@
+"""
+Reduced-size renditions of images and videos for the Tickerbiene folders.
+The functions run in the rendition processes of the uploader.
+"""
+import logging
+import os
+import resource
+import subprocess
+import tempfile
+
+# pylint: disable=import-error
+from PIL import Image, ImageOps
+
+from enums import Media
+
+IMAGE_EXTENSION = ".jpg"
+VIDEO_EXTENSION = ".mp4"
+
+
+def _cpu_seconds() -> float:
+    """
+    Returns: CPU time of this process and its finished child processes, e.g. ffmpeg
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def render_image(file_path: str, target_path: str, max_size: int, quality: int):
+    """
+    Downscale an image to max_size pixels on its long edge and encode it as JPEG.
+    :raises:
+    OSError: if Pillow cannot read the image.
+    """
+    with Image.open(file_path) as image:
+        # A JPEG is decoded at the smallest scale which is still larger than the
+        # rendition, which saves most of the decoding of a large photo.
+        image.draft("RGB", (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(target_path, "JPEG", quality=quality, optimize=True)
+
+def render_video(file_path: str, target_path: str, max_size: int, crf: int):
+    """
+    Transcode a video to a H.264 proxy with max_size pixels on its long edge.
+    Both edges are even, which yuv420p requires, e.g. an 853 pixels wide video is scaled
+    to 852 pixels. ffmpeg uses one thread, the number of rendition processes is the CPU budget.
+    :raises:
+    OSError: if ffmpeg is not installed.
+    subprocess.CalledProcessError: if ffmpeg failed.
+    """
+    scale = (f"scale='if(gte(iw,ih),trunc(min(iw,{max_size})/2)*2,-2)'"
+        f":'if(gte(iw,ih),-2,trunc(min(ih,{max_size})/2)*2)'")
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-threads", "1", "-i", file_path,
+        "-vf", scale, "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+        "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart",
+        "-threads", "1", "-filter_threads", "1", target_path
+    ], check=True, capture_output=True)
+
+def render(
+        file_path: str,
+        media_type: int,
+        directory: str,
+        max_size: int,
+        image_quality: int,
+        video_crf: int
+    ) -> dict:
+    """
+    Create the rendition of a file in the directory.
+    Returns: The path, mimetype and size of the rendition, the size of the original and
+    the CPU seconds it took, or None if the file could not be rendered or the rendition
+    is not smaller than the original
+    """
+    start_cpu = _cpu_seconds()
+    media_type = Media(media_type)
+    extension = IMAGE_EXTENSION if media_type is Media.IMAGE else VIDEO_EXTENSION
+    handle, target_path = tempfile.mkstemp(suffix=extension, dir=directory)
+    os.close(handle)
+    try:
+        if media_type is Media.IMAGE:
+            render_image(file_path, target_path, max_size, image_quality)
+        else:
+            render_video(file_path, target_path, max_size, video_crf)
+    except (OSError, Image.DecompressionBombError, subprocess.CalledProcessError) as error:
+        stderr = getattr(error, "stderr", None)
+        logging.warning("Could not render %s: %s %s", file_path, error,
+            stderr.decode("utf-8", "replace").strip() if stderr else "")
+        os.remove(target_path)
+        return None
+    original_size = os.path.getsize(file_path)
+    size = os.path.getsize(target_path)
+    if size >= original_size:
+        os.remove(target_path)
+        return None
+    return {
+        "file_path": target_path,
+        "mimetype": "image/jpeg" if media_type is Media.IMAGE else "video/mp4",
+        "size": size,
+        "original_size": original_size,
+        "cpu_seconds": _cpu_seconds() - start_cpu,
+    }
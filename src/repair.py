@@ -0,0 +1,122 @@
+"""
+Merge protest folder trees which were created twice for the same day and channel.
+
+Run from the repository root:
+    python src/repair.py --dry-run
+
+The oldest tree of each name is kept. The contents of the other trees are moved
+into it, subfolders with the same name are merged, then the duplicates are trashed.
+
+Stop the bot before the repair. A running bot keeps the ids of the trashed trees
+in its memory and uploads into the trash until its cache entries expire.
+"""
+import argparse
+from collections import defaultdict
+import logging
+
+# pylint: disable=import-error
+import drive
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+def _list_children(folder_id: str) -> list:
+    query = f"('{folder_id}' in parents) and trashed=false"
+    return drive._loop_query(  # pylint: disable=protected-access
+        query, fields="id, name, mimeType, createdTime"
+    )
+
+def find_duplicates() -> dict:
+    """
+    Group the bot's protest folders by name.
+    Returns: Dictionary of folder name to folders, oldest first, for names used more than once
+    """
+    folders = defaultdict(list)
+    for folder in _list_children(drive.config["PROTEST_FOLDER_ID"]):
+        name_split = folder["name"].split(" ")
+        if folder["mimeType"] == FOLDER_MIME_TYPE and len(name_split) > 1 and name_split[1] == "Bot":
+            folders[folder["name"]].append(folder)
+    return {
+        name: sorted(group, key=lambda folder: folder["createdTime"])
+        for name, group in folders.items() if len(group) > 1
+    }
+
+def _move(service, file: dict, from_folder_id: str, to_folder_id: str, dry_run: bool):
+    logging.info("Move %s (%s) to %s", file["name"], file["id"], to_folder_id)
+    print(f"  move {file['name']} ({file['id']}) from {from_folder_id} to {to_folder_id}")
+    if not dry_run:
+        # pylint: disable=maybe-no-member
+        drive.retry.execute(service.files().update(
+            fileId=file["id"],
+            addParents=to_folder_id,
+            removeParents=from_folder_id,
+            fields="id",
+            supportsAllDrives=True
+        ))
+
+def _trash(service, folder: dict, dry_run: bool):
+    logging.info("Trash duplicate folder %s (%s)", folder["name"], folder["id"])
+    print(f"  trash {folder['name']} ({folder['id']})")
+    if not dry_run:
+        # pylint: disable=maybe-no-member
+        drive.retry.execute(service.files().update(
+            fileId=folder["id"],
+            body={"trashed": True},
+            fields="id",
+            supportsAllDrives=True
+        ))
+
+def merge_folder(service, folder: dict, keep_folder_id: str, dry_run: bool):
+    """
+    Move the contents of a folder into the kept folder and trash the folder.
+    Subfolders which exist in both folders are merged recursively.
+    """
+    kept_folders = {
+        child["name"]: child["id"] for child in _list_children(keep_folder_id)
+        if child["mimeType"] == FOLDER_MIME_TYPE
+    }
+    for child in _list_children(folder["id"]):
+        if child["mimeType"] == FOLDER_MIME_TYPE and child["name"] in kept_folders:
+            merge_folder(service, child, kept_folders[child["name"]], dry_run)
+        else:
+            _move(service, child, folder["id"], keep_folder_id, dry_run)
+    _trash(service, folder, dry_run)
+
+def repair(dry_run: bool) -> int:
+    """
+    Merge every duplicate protest folder tree into the oldest tree of the same name.
+    Returns: Number of merged duplicate trees
+    """
+    service = drive.drive_client.service()
+    merged = 0
+    for name, folders in find_duplicates().items():
+        keep, duplicates = folders[0], folders[1:]
+        print(f"{name}: keep {keep['id']}, merge {[folder['id'] for folder in duplicates]}")
+        for duplicate in duplicates:
+            merge_folder(service, duplicate, keep["id"], dry_run)
+            if not dry_run:
+                drive.folder_cache.invalidate(duplicate["id"])
+            merged += 1
+    return merged
+
+def main():
+    """
+    Run the repair.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true",
+        help="only print the folders which would be moved and trashed")
+    args = parser.parse_args()
+    if not drive.config["PROTEST_FOLDER_ID"]:
+        parser.error("PROTEST_FOLDER_ID is not configured")
+
+    merged = repair(args.dry_run)
+    if args.dry_run:
+        print(f"{merged} duplicate folder trees would be merged")
+    else:
+        print(f"Merged {merged} duplicate folder trees")
+
+
+if __name__ == '__main__':
+    main()
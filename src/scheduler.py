@@ -0,0 +1,54 @@
+"""
+Choose which upload job runs next.
+"""
+from collections import Counter
+import time
+
+from enums import Media
+
+
+class UploadScheduler:
+    """
+    Order the due upload jobs. Small files go before large files, so images are
+    not stuck behind multi-GB videos. Within the same size class the channel
+    with the fewest running uploads goes first, so one busy group does not
+    starve the others. Ties go to the channel which waited longest, then to
+    the smaller and older job.
+    """
+    def __init__(self, small_file_size: int):
+        self.small_file_size = small_file_size
+        self.in_flight = Counter()
+        self._last_started = {}
+
+    def _priority(self, job: dict) -> tuple:
+        channel = job["channel"]
+        is_large = job["media_type"] == Media.VIDEO.value \
+            and job["file_size"] > self.small_file_size
+        return (
+            is_large,
+            self.in_flight[channel],
+            self._last_started.get(channel, 0),
+            job["file_size"],
+            job["id"]
+        )
+
+    def choose(self, jobs: list) -> dict:
+        """
+        Returns: The job to run next
+        """
+        return min(jobs, key=self._priority)
+
+    def started(self, job: dict):
+        """
+        Count a job as running.
+        """
+        self.in_flight[job["channel"]] += 1
+        self._last_started[job["channel"]] = time.monotonic()
+
+    def finished(self, job: dict):
+        """
+        Count a job as no longer running.
+        """
+        self.in_flight[job["channel"]] -= 1
+        if self.in_flight[job["channel"]] <= 0:
+            del self.in_flight[job["channel"]]
@@ -0,0 +1,49 @@
+"""
+Coalesce concurrent calls which would do the same work.
+"""
+import threading
+from typing import Callable, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run only one call per key at a time. Threads calling with a key which is
+    already in flight wait for that call and get its result or its exception.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, function: Callable, *args, **kwargs):
+        """
+        Call the function or wait for the call in flight with the same key.
+        Returns: Result of the function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,43 @@
+"""
+Tests of the index of uploaded file contents.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import hashlib
+
+from dedup import DedupIndex, file_md5
+import dedup
+
+CONTENT = b"photo" * 1000
+
+
+def test_file_md5_hashes_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "HASH_CHUNK_SIZE", 7)
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(CONTENT)
+    assert file_md5(str(path)) == hashlib.md5(CONTENT).hexdigest()
+
+def test_content_hash_is_remembered_per_unique_id(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(CONTENT)
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    md5 = index.content_hash(str(path), "unique")
+    assert md5 == hashlib.md5(CONTENT).hexdigest()
+    # A forwarded file is not hashed again, even if the file is gone already.
+    path.unlink()
+    assert DedupIndex(str(tmp_path / "dedup.db")).content_hash(str(path), "unique") == md5
+
+def test_find_add_and_remove(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    index = DedupIndex(path)
+    index.add("md5", "wien", "file in wien")
+    index.add("md5", "graz", "file in graz")
+    # The newer file replaces the older file with the same content in a folder.
+    index.add("md5", "wien", "newer file in wien")
+    assert sorted(DedupIndex(path).find("md5")) == [
+        ("file in graz", "graz"), ("newer file in wien", "wien")
+    ]
+    index.remove("file in graz")
+    assert index.find("md5") == [("newer file in wien", "wien")]
+    assert index.find("other") == []
@@ -0,0 +1,72 @@
+"""
+Tests of the roll back of partially created folder trees with a stubbed drive service.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import pytest
+
+from drive_retry import Retry
+import drive
+
+
+class _Batch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        method, _ = self.requests[0][0]
+        if method == "create":
+            # The first folder is created, then the connection breaks.
+            self.service.created.append("folder-0")
+            self.callback(self.requests[0][1], {"id": "folder-0"}, None)
+            raise ConnectionError("connection reset")
+        self.service.deleted.extend(request_id for _, request_id in self.requests)
+        if self.service.delete_error is not None:
+            raise self.service.delete_error
+
+
+class _Files:
+    @staticmethod
+    def create(**_):
+        return ("create", None)
+
+    @staticmethod
+    def delete(fileId, **_):  # pylint: disable=invalid-name
+        return ("delete", fileId)
+
+
+class _Service:
+    def __init__(self, delete_error: Exception = None):
+        self.created = []
+        self.deleted = []
+        self.delete_error = delete_error
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+    @staticmethod
+    def files():
+        return _Files()
+
+
+@pytest.fixture(autouse=True)
+def _no_retries(monkeypatch):
+    monkeypatch.setattr(drive, "retry", Retry(0, 0, 0, 1000))
+
+def test_connection_error_rolls_back_created_folders():
+    service = _Service()
+    with pytest.raises(ConnectionError):
+        drive._create_folders(service, [("a", "root"), ("b", "root")])  # pylint: disable=protected-access
+    assert service.deleted == service.created == ["folder-0"]
+
+def test_failed_roll_back_keeps_the_original_error():
+    service = _Service(delete_error=TimeoutError("delete timed out"))
+    with pytest.raises(ConnectionError):
+        drive._create_folders(service, [("a", "root"), ("b", "root")])  # pylint: disable=protected-access
+    assert service.deleted == ["folder-0"]
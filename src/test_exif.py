@@ -0,0 +1,110 @@
+"""
+Tests of the header parser with malformed JPEG, MP4 and HEIF files.
+Broken metadata must give an empty result instead of an error.
+
+Run from the repository root:
+    python -m pytest src
+"""
+from datetime import datetime
+import struct
+
+import exif
+
+DATE = b"2024:02:14 08:15:30\0"
+
+
+def _tiff(entries: list, extra: bytes = b"") -> bytes:
+    """
+    Returns: Little endian TIFF with one IFD of (tag, type, count, value) entries,
+    followed by the extra data at offset 8 + 2 + 12 * len(entries) + 4
+    """
+    ifd = struct.pack("<H", len(entries)) + b"".join(
+        struct.pack("<HHI", tag, field_type, count) + value.ljust(4, b"\0")
+        for tag, field_type, count, value in entries
+    ) + struct.pack("<I", 0)
+    return b"II*\0" + struct.pack("<I", 8) + ifd + extra
+
+def _jpeg(tiff: bytes) -> bytes:
+    segment = b"Exif\0\0" + tiff
+    return b"\xff\xd8\xff\xe1" + struct.pack(">H", len(segment) + 2) + segment + b"\xff\xda"
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def _full_box(kind: bytes, payload: bytes, version: int = 0) -> bytes:
+    return _box(kind, bytes([version, 0, 0, 0]) + payload)
+
+def _mp4(mvhd_payload: bytes, version: int = 0) -> bytes:
+    return _box(b"ftyp", b"isom\0\0\0\0isommp42") + \
+        _box(b"moov", _full_box(b"mvhd", mvhd_payload, version))
+
+def _heif(iloc_payload: bytes, iloc_version: int = 0) -> bytes:
+    infe = _full_box(b"infe", struct.pack(">HH4s", 1, 0, b"Exif") + b"\0", version=2)
+    iinf = _full_box(b"iinf", struct.pack(">H", 1) + infe)
+    hdlr = _full_box(b"hdlr", b"\0\0\0\0pict" + b"\0" * 13)
+    meta = _full_box(b"meta", hdlr + iinf + _full_box(b"iloc", iloc_payload, iloc_version))
+    return _box(b"ftyp", b"heic\0\0\0\0mif1heic") + meta
+
+def _read(tmp_path, data: bytes) -> dict:
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    return exif.read_metadata(str(path))
+
+def test_jpeg_date(tmp_path):
+    tiff = _tiff([(exif.DATE_TIME, 2, len(DATE), struct.pack("<I", 26))], DATE)
+    assert _read(tmp_path, _jpeg(tiff)) == {"captured": "2024-02-14T08:15:30"}
+
+def test_jpeg_gps_pointer_of_ascii_type(tmp_path):
+    tiff = _tiff([
+        (exif.DATE_TIME, 2, len(DATE), struct.pack("<I", 38)),
+        (exif.GPS_IFD, 2, 4, b"abc\0"),
+    ], DATE)
+    assert _read(tmp_path, _jpeg(tiff)) == {"captured": "2024-02-14T08:15:30"}
+
+def test_jpeg_exif_pointer_out_of_range(tmp_path):
+    tiff = _tiff([(exif.EXIF_IFD, 4, 1, struct.pack("<I", 0xFFFFFFF0))])
+    assert _read(tmp_path, _jpeg(tiff)) == {}
+
+def test_jpeg_gps_of_wrong_types(tmp_path):
+    gps_offset = 8 + 2 + 12 + 4
+    gps = _tiff([
+        (exif.GPS_LATITUDE_REF, 3, 1, struct.pack("<H", 78)),
+        (exif.GPS_LATITUDE, 2, 4, b"48\0\0"),
+    ])[8:]
+    tiff = _tiff([(exif.GPS_IFD, 4, 1, struct.pack("<I", gps_offset))], gps)
+    assert _read(tmp_path, _jpeg(tiff)) == {}
+
+def test_jpeg_segment_length_too_small(tmp_path):
+    assert _read(tmp_path, b"\xff\xd8\xff\xe0\x00\x00" + b"\0" * 16) == {}
+
+def test_jpeg_truncated(tmp_path):
+    tiff = _tiff([(exif.DATE_TIME, 2, len(DATE), struct.pack("<I", 26))], DATE)
+    assert _read(tmp_path, _jpeg(tiff)[:30]) == {}
+
+def test_mp4_creation_time(tmp_path):
+    seconds = int((datetime(2024, 2, 14, 8, 15, 30) - datetime(1904, 1, 1)).total_seconds())
+    data = _mp4(struct.pack(">IIII", seconds, seconds, 1000, 0) + b"\0" * 80)
+    assert _read(tmp_path, data) == {"captured": "2024-02-14T08:15:30+00:00"}
+
+def test_mp4_creation_time_out_of_range(tmp_path):
+    data = _mp4(struct.pack(">QQIQ", 2 ** 62, 2 ** 62, 1000, 0) + b"\0" * 80, version=1)
+    assert _read(tmp_path, data) == {}
+
+def test_mp4_truncated_movie_box(tmp_path):
+    data = _box(b"ftyp", b"isom\0\0\0\0isommp42") + struct.pack(">I4s", 1000, b"moov") + b"\0\0"
+    assert _read(tmp_path, data) == {}
+
+def test_mp4_box_of_invalid_size(tmp_path):
+    data = _box(b"ftyp", b"isom\0\0\0\0isommp42") + struct.pack(">I4s", 3, b"moov") + b"\0" * 16
+    assert _read(tmp_path, data) == {}
+
+def test_heif_exif_item_outside_file(tmp_path):
+    iloc = bytes([0x88, 0x00]) + struct.pack(">HHHHQQ", 1, 1, 0, 1, 2 ** 63, 64)
+    assert _read(tmp_path, _heif(iloc)) == {}
+
+def test_heif_item_count_larger_than_box(tmp_path):
+    iloc = bytes([0x44, 0x00]) + struct.pack(">I", 0xFFFFFFFF)
+    assert _read(tmp_path, _heif(iloc, iloc_version=2)) == {}
+
+def test_heif_without_item_data(tmp_path):
+    assert _read(tmp_path, _heif(b"")) == {}
@@ -0,0 +1,60 @@
+"""
+Tests of the protest folder cache in memory and on disk.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import pytest
+
+from folder_cache import FolderCache
+import folder_cache
+
+FOLDERS = {"parent_folder_id": "parent", "image_folder_id": "images"}
+OTHER_FOLDERS = {"parent_folder_id": "other", "image_folder_id": "other images"}
+
+
+@pytest.fixture(name="clock")
+def _clock(monkeypatch) -> list:
+    """
+    Returns: The current time of the cache, which the test can move
+    """
+    now = [1000.0]
+    monkeypatch.setattr(folder_cache.time, "time", lambda: now[0])
+    return now
+
+def test_get_returns_a_copy(tmp_path):
+    cache = FolderCache(str(tmp_path / "folders.db"), 60)
+    cache.put("2024-02-14", "Wien", "user", FOLDERS)
+    folders = cache.get("2024-02-14", "Wien", "user")
+    folders["image_folder_id"] = "changed"
+    assert cache.get("2024-02-14", "Wien", "user") == FOLDERS
+    assert cache.get("2024-02-14", "Graz", "user") is None
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "folders.db")
+    FolderCache(path, 60).put("2024-02-14", None, None, FOLDERS)
+    assert FolderCache(path, 60).get("2024-02-14", None, None) == FOLDERS
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    path = str(tmp_path / "folders.db")
+    cache = FolderCache(path, 60)
+    cache.put("2024-02-14", "Wien", "user", FOLDERS)
+    clock[0] += 59
+    assert cache.get("2024-02-14", "Wien", "user") == FOLDERS
+    clock[0] += 1
+    assert cache.get("2024-02-14", "Wien", "user") is None
+    # The expired entry was removed from the database, it is gone even before its expiry.
+    clock[0] -= 30
+    assert FolderCache(path, 60).get("2024-02-14", "Wien", "user") is None
+
+def test_invalidate_removes_every_entry_of_the_parent(tmp_path):
+    path = str(tmp_path / "folders.db")
+    cache = FolderCache(path, 60)
+    cache.put("2024-02-14", "Wien", "first", FOLDERS)
+    cache.put("2024-02-14", "Wien", "second", FOLDERS)
+    cache.put("2024-02-14", "Graz", "first", OTHER_FOLDERS)
+    cache.invalidate("parent")
+    for restarted in (cache, FolderCache(path, 60)):
+        assert restarted.get("2024-02-14", "Wien", "first") is None
+        assert restarted.get("2024-02-14", "Wien", "second") is None
+        assert restarted.get("2024-02-14", "Graz", "first") == OTHER_FOLDERS
@@ -0,0 +1,138 @@
+"""
+Tests of the reverse geocoding with a local stub provider.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from geocode_cache import GeocodeCache
+from ratelimit import TokenBucket
+import geocode_cache
+import maps
+
+VIENNA = (48.20820, 16.37380)
+# In the same 7 character geohash cell as VIENNA.
+VIENNA_NEARBY = (48.20821, 16.37381)
+GRAZ = (47.07070, 15.43950)
+
+
+class _Provider:
+    """
+    Stub of the place name provider which counts its lookups.
+    """
+    def __init__(self, errors: int = 0):
+        self.calls = []
+        self.errors = errors
+
+    async def __call__(self, latitude: float, longitude: float) -> str:
+        self.calls.append((latitude, longitude))
+        await asyncio.sleep(0.01)
+        if self.errors:
+            self.errors -= 1
+            raise httpx.ConnectError("provider is down")
+        return f"place_{latitude:.2f}_{longitude:.2f}"
+
+
+def _geocoder(tmp_path, provider: _Provider, rate: float = 1000) -> maps.Geocoder:
+    return maps.Geocoder(
+        provider, GeocodeCache(str(tmp_path / "geocode.db"), 100), 7, TokenBucket(rate, 1)
+    )
+
+def test_geohash_cells():
+    assert maps.geohash(*VIENNA, 7) == maps.geohash(*VIENNA_NEARBY, 7)
+    assert maps.geohash(*VIENNA, 7) != maps.geohash(*GRAZ, 7)
+
+def test_one_lookup_per_cell(tmp_path):
+    provider = _Provider()
+    geocoder = _geocoder(tmp_path, provider)
+
+    async def main():
+        return await asyncio.gather(
+            *(geocoder.reverse(*VIENNA) for _ in range(5)),
+            *(geocoder.reverse(*VIENNA_NEARBY) for _ in range(5)),
+            geocoder.reverse(*GRAZ)
+        )
+
+    names = asyncio.run(main())
+    assert names == ["place_48.21_16.37"] * 10 + ["place_47.07_15.44"]
+    assert len(provider.calls) == 2
+    # Later lookups of the cell are answered by the cache.
+    assert asyncio.run(geocoder.reverse(*VIENNA_NEARBY)) == "place_48.21_16.37"
+    assert len(provider.calls) == 2
+
+def test_failures_are_not_cached(tmp_path):
+    provider = _Provider(errors=1)
+    geocoder = _geocoder(tmp_path, provider)
+
+    async def main():
+        return await asyncio.gather(
+            *(geocoder.reverse(*VIENNA) for _ in range(3)), return_exceptions=True
+        )
+
+    errors = asyncio.run(main())
+    assert all(isinstance(error, httpx.ConnectError) for error in errors)
+    assert geocoder.cache.get(maps.geohash(*VIENNA, 7)) is None
+    assert asyncio.run(geocoder.reverse(*VIENNA)) == "place_48.21_16.37"
+    assert len(provider.calls) == 2
+
+def test_lookups_are_rate_limited(tmp_path):
+    provider = _Provider()
+    geocoder = _geocoder(tmp_path, provider, rate=20)
+    positions = [(48.0 + index / 10, 16.0) for index in range(4)]
+
+    async def main():
+        return await asyncio.gather(*(geocoder.reverse(*position) for position in positions))
+
+    start = time.monotonic()
+    asyncio.run(main())
+    # The first lookup uses the capacity of the bucket, the others wait 1 / 20 s each.
+    assert time.monotonic() - start >= 3 / 20 - 0.01
+    assert len(provider.calls) == 4
+
+def test_token_bucket_debt():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 4 / 50 - 0.01
+
+
+@pytest.fixture(name="clock")
+def _clock(monkeypatch):
+    """
+    Distinct use times for the SQLite entries, which are evicted by their use time.
+    """
+    now = [1000.0]
+
+    def tick() -> float:
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(geocode_cache.time, "time", tick)
+
+@pytest.mark.usefixtures("clock")
+def test_memory_evicts_the_least_recently_used_entry(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode.db"), 2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert list(cache._memory) == ["a", "c"]  # pylint: disable=protected-access
+
+@pytest.mark.usefixtures("clock")
+def test_database_evicts_the_least_recently_used_entry(tmp_path):
+    path = str(tmp_path / "geocode.db")
+    cache = GeocodeCache(path, 2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    # After a restart, loading a from the database counts as its use.
+    cache = GeocodeCache(path, 2)
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    restarted = GeocodeCache(path, 2)
+    assert [restarted.get(cell) for cell in ("a", "b", "c")] == ["A", None, "C"]
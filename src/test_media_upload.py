@@ -0,0 +1,32 @@
+"""
+Tests of the chunked reads of local files for uploads and hashing.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import pytest
+
+from media_upload import FileMediaUpload, read_chunks
+
+CONTENT = bytes(range(256)) * 40
+
+
+def test_read_chunks(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT)
+    chunks = [bytes(chunk) for chunk in read_chunks(str(path), 4000)]
+    assert [len(chunk) for chunk in chunks] == [4000, 4000, 2240]
+    assert b"".join(chunks) == CONTENT
+
+def test_getbytes_reads_the_length_from_begin(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT)
+    with open(path, "rb", buffering=0) as file:
+        upload = FileMediaUpload(file, "video/mp4", 4000)
+        assert upload.size() == len(CONTENT)
+        assert bytes(upload.getbytes(100, 50)) == CONTENT[100:150]
+        # The length is limited by the chunk size and the end of the file.
+        assert bytes(upload.getbytes(0, 5000)) == CONTENT[:4000]
+        assert bytes(upload.getbytes(8000, 4000)) == CONTENT[8000:]
+        with pytest.raises(NotImplementedError):
+            upload.to_json()
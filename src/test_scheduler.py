@@ -0,0 +1,51 @@
+"""
+Tests of the order of the due upload jobs.
+
+Run from the repository root:
+    python -m pytest src
+"""
+from enums import Media
+from scheduler import UploadScheduler
+
+SMALL_FILE_SIZE = 50
+
+
+def _job(job_id: int, channel: str, media_type: Media = Media.IMAGE, file_size: int = 10) -> dict:
+    return {"id": job_id, "channel": channel, "media_type": media_type.value,
+        "file_size": file_size}
+
+def test_small_files_go_first():
+    scheduler = UploadScheduler(SMALL_FILE_SIZE)
+    large_video = _job(1, "Wien", Media.VIDEO, 1000)
+    small_video = _job(2, "Wien", Media.VIDEO, SMALL_FILE_SIZE)
+    large_image = _job(3, "Wien", Media.IMAGE, 1000)
+    assert scheduler.choose([large_video, small_video]) is small_video
+    # Only videos count as large, images are never held back.
+    assert scheduler.choose([large_video, large_image]) is large_image
+
+def test_smaller_and_older_jobs_break_ties():
+    scheduler = UploadScheduler(SMALL_FILE_SIZE)
+    jobs = [_job(1, "Wien", file_size=20), _job(2, "Wien", file_size=10),
+        _job(3, "Wien", file_size=10)]
+    assert scheduler.choose(jobs) is jobs[1]
+
+def test_channel_with_fewest_running_uploads_goes_first():
+    scheduler = UploadScheduler(SMALL_FILE_SIZE)
+    busy = [_job(index, "Wien") for index in range(1, 4)]
+    quiet = _job(4, "Graz", file_size=40)
+    scheduler.started(busy[0])
+    assert scheduler.choose(busy[1:] + [quiet]) is quiet
+    scheduler.finished(busy[0])
+    assert not scheduler.in_flight
+    # Without running uploads the channel which waited longest goes first.
+    assert scheduler.choose(busy[1:] + [quiet]) is quiet
+    scheduler.started(quiet)
+    scheduler.finished(quiet)
+    assert scheduler.choose(busy[1:] + [_job(5, "Graz")]) is busy[1]
+
+def test_large_videos_wait_for_small_files_of_busy_channels():
+    scheduler = UploadScheduler(SMALL_FILE_SIZE)
+    scheduler.started(_job(1, "Wien"))
+    small = _job(2, "Wien")
+    large = _job(3, "Graz", Media.VIDEO, 1000)
+    assert scheduler.choose([large, small]) is small
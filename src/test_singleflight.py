@@ -0,0 +1,75 @@
+"""
+Tests of the coalescing of concurrent calls with the same key.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+THREADS = 8
+
+
+def _call_concurrently(flight: SingleFlight, function) -> list:
+    """
+    Call the function with the same key from several threads, while the first call
+    waits until every thread has started.
+    Returns: Result or exception of each thread
+    """
+    started = threading.Barrier(THREADS + 1)
+    results = [None] * THREADS
+
+    def run(index: int):
+        started.wait()
+        try:
+            results[index] = flight.do("key", function)
+        except ValueError as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def _slow(calls: list, release: threading.Event, error: Exception = None):
+    def function():
+        calls.append(threading.get_ident())
+        release.wait(5)
+        if error is not None:
+            raise error
+        return "folder"
+    return function
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+    threading.Timer(0.1, release.set).start()
+    results = _call_concurrently(flight, _slow(calls, release))
+    assert len(calls) == 1
+    assert results == ["folder"] * THREADS
+
+def test_exception_reaches_every_waiting_caller():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+    error = ValueError("drive is down")
+    threading.Timer(0.1, release.set).start()
+    results = _call_concurrently(flight, _slow(calls, release, error))
+    assert len(calls) == 1
+    assert results == [error] * THREADS
+
+def test_key_is_released_after_the_call():
+    flight = SingleFlight()
+    calls = []
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: calls.append(1) or int("not a number"))
+    assert flight.do("key", lambda: calls.append(2) or "folder") == "folder"
+    assert calls == [1, 2]
+    assert not flight._calls  # pylint: disable=protected-access
@@ -0,0 +1,51 @@
+"""
+Tests of the traces file, which is kept open and rotated at its maximum size.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def _close():
+    yield
+    tracing.close()
+
+def _names(path) -> list:
+    with open(path, "r", encoding="utf-8") as traces_file:
+        return [json.loads(line)["name"] for line in traces_file]
+
+def test_spans_are_written_on_close(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path))
+    with tracing.span("handle", trace_key="message"):
+        with tracing.span("upload"):
+            pass
+    tracing.close()
+    assert _names(path) == ["upload", "handle"]
+
+def test_file_is_rotated_at_max_bytes(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path), max_bytes=1000)
+    for index in range(20):
+        with tracing.span(f"span {index}"):
+            pass
+    tracing.close()
+    # Only the last rotated file is kept, it and the current file hold the latest spans.
+    names = _names(f"{path}.1") + _names(path)
+    assert names == [f"span {index}" for index in range(20 - len(names), 20)]
+    assert path.stat().st_size < 1000
+    assert not (tmp_path / "traces.jsonl.1.1").exists()
+
+def test_no_spans_after_close(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path))
+    tracing.close()
+    with tracing.span("late") as late_span:
+        assert late_span is None
+    assert _names(path) == []
@@ -0,0 +1,89 @@
+"""
+Tests of the persistent upload queue.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import time
+
+from upload_queue import DONE, FAILED, PENDING, RUNNING, UploadQueue
+
+
+def _job(job_key: str, media_group_id: str = None, **fields) -> dict:
+    return {
+        "job_key": job_key,
+        "file_path": f"/files/{job_key}",
+        "file_name": job_key,
+        "media_type": 1,
+        "date": "2024-02-14T08:15:30+00:00",
+        "channel": "Wien",
+        "username": "user",
+        "media_group_id": media_group_id,
+        **fields,
+    }
+
+def test_a_message_is_enqueued_once(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    assert queue.enqueue(_job("first"))
+    assert not queue.enqueue(_job("first"))
+    assert queue.depth() == 1
+
+def test_claim_takes_the_oldest_due_job(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(_job("held", next_attempt=time.time() + 60))
+    queue.enqueue(_job("first"))
+    queue.enqueue(_job("second"))
+    job = queue.claim()
+    assert (job["job_key"], job["attempts"]) == ("first", 1)
+    assert queue.claim(lambda jobs: jobs[-1])["job_key"] == "second"
+    assert queue.claim() is None
+    assert queue.depth() == 1
+    assert queue.next_attempt() > time.time()
+
+def test_retry_holds_the_job_back(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(_job("first"))
+    job = queue.claim()
+    queue.retry(job["id"], "timeout", 60)
+    assert queue.claim() is None
+    queue.retry(job["id"], "timeout", 0)
+    job = queue.claim()
+    assert (job["attempts"], job["error"]) == (2, "timeout")
+
+def test_recover_resets_running_jobs(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = UploadQueue(path)
+    queue.enqueue(_job("interrupted"))
+    queue.enqueue(_job("finished"))
+    queue.claim()
+    queue.complete(queue.claim()["id"])
+    assert queue.is_file_needed("/files/interrupted")
+    # The bot stopped during the upload of the first job.
+    restarted = UploadQueue(path)
+    assert restarted.claim() is None
+    restarted.recover()
+    job = restarted.claim()
+    assert (job["job_key"], job["attempts"]) == ("interrupted", 2)
+    assert not restarted.is_file_needed("/files/finished")
+
+def test_hold_album_only_moves_untried_jobs(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(_job("tried", "album"))
+    queue.retry(queue.claim()["id"], "timeout", 0)
+    queue.enqueue(_job("new", "album", next_attempt=time.time() + 60))
+    queue.hold_album("album", time.time() + 120)
+    assert queue.claim()["job_key"] == "tried"
+    queue.hold_album("album", 0)
+    assert queue.claim()["job_key"] == "new"
+    assert [job["status"] for job in queue.album("album")] == [RUNNING, RUNNING]
+
+def test_purge_keeps_unfinished_jobs(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    for job_key in ("done", "failed", "pending"):
+        queue.enqueue(_job(job_key, "album"))
+    queue.complete(queue.claim()["id"])
+    queue.fail(queue.claim()["id"], "not found")
+    queue.purge(60)
+    assert [job["status"] for job in queue.album("album")] == [DONE, FAILED, PENDING]
+    queue.purge(-1)
+    assert [job["job_key"] for job in queue.album("album")] == ["pending"]
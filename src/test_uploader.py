@@ -0,0 +1,116 @@
+"""
+Tests of the upload workers with a local upload queue and stubbed uploads.
+
+Run from the repository root:
+    python -m pytest src
+"""
+import asyncio
+from concurrent.futures import Future
+
+from telegram.error import TimedOut
+
+from upload_queue import DONE, FAILED, UploadQueue
+import uploader
+
+
+def _job(job_key: str, media_group_id: str = None) -> dict:
+    return {
+        "job_key": job_key,
+        "file_path": f"/nonexistent/{job_key}",
+        "file_name": job_key,
+        "media_type": 1,
+        "date": "2024-02-14T08:15:30+00:00",
+        "username": "user",
+        "media_group_id": media_group_id,
+    }
+
+def _statuses(queue: UploadQueue, job_keys: list) -> list:
+    with queue._lock:  # pylint: disable=protected-access
+        rows = queue._connection.execute(  # pylint: disable=protected-access
+            "SELECT job_key, status FROM jobs ORDER BY id"
+        ).fetchall()
+    statuses = dict(rows)
+    return [statuses.get(job_key) for job_key in job_keys]
+
+async def _run_workers(queue: UploadQueue, job_keys: list, count: int, on_failure,
+        on_album_failure, on_saved=None) -> list:
+    """
+    Run the workers until every job is finished.
+    Returns: The tasks of the workers, still running if the workers survived
+    """
+    workers = [
+        asyncio.create_task(uploader._work(  # pylint: disable=protected-access
+            on_failure, on_album_failure, None, on_saved))
+        for _ in range(count)
+    ]
+    for _ in range(200):
+        if any(worker.done() for worker in workers) or all(status in (DONE, FAILED)
+                for status in _statuses(queue, job_keys)):
+            break
+        await asyncio.sleep(0.01)
+    # Give the workers the chance to finish the reports of the last jobs.
+    await asyncio.sleep(0.1)
+    return workers
+
+def test_failing_report_does_not_end_the_worker(tmp_path, monkeypatch):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    monkeypatch.setattr(uploader, "upload_queue", queue)
+    reported = []
+
+    async def on_failure(job, _):
+        reported.append(job["job_key"])
+        raise TimedOut()
+
+    async def main():
+        queue.enqueue(_job("first"))
+        queue.enqueue(_job("second"))
+        worker, = await _run_workers(queue, ["first", "second"], 1, on_failure, None)
+        assert not worker.done()
+        worker.cancel()
+
+    asyncio.run(main())
+    assert _statuses(queue, ["first", "second"]) == [FAILED, FAILED]
+    assert reported == ["first", "second"]
+
+def test_rendition_timeout_copies_the_original(monkeypatch):
+    monkeypatch.setattr(uploader, "RENDITION_TIMEOUT", 0.01)
+    rendition = Future()
+    assert uploader._rendition_result(_job("slow"), rendition) is None  # pylint: disable=protected-access
+
+def test_rendition_error_copies_the_original():
+    rendition = Future()
+    rendition.set_exception(SyntaxError("not a JPEG file"))
+    assert uploader._rendition_result(_job("corrupt"), rendition) is None  # pylint: disable=protected-access
+
+def test_album_is_reported_once(tmp_path, monkeypatch):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    monkeypatch.setattr(uploader, "upload_queue", queue)
+    reports = []
+
+    async def upload(job, _):
+        if job["job_key"] == "failing":
+            await asyncio.sleep(0.01)
+            raise FileNotFoundError(job["file_path"])
+
+    async def on_album_failure(album, failed):
+        reports.append((len(album), len(failed)))
+
+    async def on_saved(_):
+        # The failing job finishes while the saved job updates its status message.
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(uploader, "_upload", upload)
+
+    async def main():
+        for job_key in ("failing", "saved"):
+            job = _job(job_key, media_group_id="album")
+            job["status_message_id"] = 1
+            queue.enqueue(job)
+        workers = await _run_workers(
+            queue, ["failing", "saved"], 2, None, on_album_failure, on_saved
+        )
+        for worker in workers:
+            worker.cancel()
+
+    asyncio.run(main())
+    assert reports == [(2, 1)]
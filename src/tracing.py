@@ -0,0 +1,248 @@
+"""
+Lightweight tracing of the phases of a message, from the update to the drive upload.
+
+Spans are written as JSON lines to var/traces.jsonl, which is rotated to
+var/traces.jsonl.1 when it reaches its maximum size. If TRACING_OTLP_ENDPOINT is
+configured and the opentelemetry sdk and otlp exporter are installed, the spans
+are exported to the collector as well.
+
+Print the duration percentiles per phase from the repository root:
+    python src/tracing.py var/traces.jsonl
+"""
+import argparse
+import atexit
+from collections import defaultdict
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+TRACES_FILE_PATH = "var/traces.jsonl"
+TRACES_MAX_BYTES = 100 * 1024 * 1024
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+_settings = {"file_path": None, "file": None, "max_bytes": TRACES_MAX_BYTES, "tracer": None}
+
+
+class Span:
+    """
+    A timed phase of a trace. Attributes may be added until the span ends.
+    """
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        """
+        Returns: The span as dictionary for the json lines file
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def configure(
+        file_path: str = TRACES_FILE_PATH,
+        otlp_endpoint: str = None,
+        max_bytes: int = TRACES_MAX_BYTES
+    ):
+    """
+    Enable tracing. Spans are only recorded after this was called.
+    Args: The json lines file, the optional OTLP collector endpoint and the size
+    at which the file is rotated
+    """
+    with _write_lock:
+        _settings["file_path"] = file_path
+        _settings["max_bytes"] = max_bytes
+        # One handle for all spans, the lines are buffered and flushed when the bot stops.
+        # pylint: disable-next=consider-using-with
+        _settings["file"] = open(file_path, "a", encoding="utf-8")
+    atexit.register(close)
+    if otlp_endpoint:
+        try:
+            # pylint: disable=import-error,import-outside-toplevel
+            from opentelemetry import trace
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError:
+            logging.warning("Install opentelemetry-sdk and opentelemetry-exporter-otlp \
+to export traces to %s", otlp_endpoint)
+        else:
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": "telegram-bot-google-drive"})
+            )
+            provider.add_span_processor(
+                BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True))
+            )
+            trace.set_tracer_provider(provider)
+            _settings["tracer"] = trace.get_tracer(__name__)
+    logging.info("Write traces to %s", file_path)
+
+def current_span() -> Span:
+    """
+    Returns: The span of the running phase or None
+    """
+    return _current_span.get()
+
+def _trace_id(trace_key: str) -> str:
+    if trace_key is None:
+        return os.urandom(16).hex()
+    return hashlib.sha256(trace_key.encode("utf-8")).hexdigest()[:32]
+
+def close():
+    """
+    Flush and close the traces file. Spans are not recorded afterwards.
+    """
+    with _write_lock:
+        if _settings["file"] is not None:
+            _settings["file"].close()
+        _settings["file_path"] = None
+        _settings["file"] = None
+
+def _rotate():
+    """
+    Replace the previous rotated file with the full traces file and start a new one.
+    """
+    file_path = _settings["file_path"]
+    _settings["file"].close()
+    try:
+        os.replace(file_path, file_path + ".1")
+    finally:
+        # pylint: disable-next=consider-using-with
+        _settings["file"] = open(file_path, "a", encoding="utf-8")
+
+def _write(span: Span):
+    line = json.dumps(span.to_dict(), default=str)
+    with _write_lock:
+        traces_file = _settings["file"]
+        if traces_file is None:
+            return
+        traces_file.write(line + "\n")
+        if traces_file.tell() >= _settings["max_bytes"]:
+            _rotate()
+
+@contextlib.contextmanager
+def span(name: str, trace_key: str = None, **attributes):
+    """
+    Record a phase as child of the running span or as a new trace.
+    Spans of a new trace with the same trace key get the same trace id,
+    so the handler and the upload workers of a message share one trace.
+    Yields: The span, or None if tracing is not configured
+    """
+    if _settings["file_path"] is None:
+        yield None
+        return
+    parent = _current_span.get()
+    if parent is not None:
+        new_span = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        new_span = Span(name, _trace_id(trace_key), attributes=attributes)
+    token = _current_span.set(new_span)
+    otel_span = contextlib.nullcontext()
+    if _settings["tracer"] is not None:
+        otel_span = _settings["tracer"].start_as_current_span(name)
+    try:
+        with otel_span as exported_span:
+            try:
+                yield new_span
+            except BaseException as error:
+                new_span.error = repr(error)
+                raise
+            finally:
+                if exported_span is not None:
+                    exported_span.set_attributes({
+                        key: value for key, value in new_span.attributes.items()
+                        if isinstance(value, (bool, int, float, str))
+                    })
+    finally:
+        new_span.duration = time.time() - new_span.start
+        _current_span.reset(token)
+        try:
+            _write(new_span)
+        except OSError as error:
+            logging.warning("Could not write span %s: %s", name, error)
+
+def traced(name: str) -> Callable:
+    """
+    Decorator recording every call of a function as span.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _percentile(durations: list, percent: float) -> float:
+    index = max(0, min(len(durations) - 1, round(percent / 100 * len(durations) + 0.5) - 1))
+    return durations[index]
+
+def summary(file_path: str) -> list:
+    """
+    Returns: Tuples of phase, count, p50, p95 and max duration in seconds, slowest p95 first
+    """
+    durations = defaultdict(list)
+    with open(file_path, "r", encoding="utf-8") as traces_file:
+        for line in traces_file:
+            try:
+                recorded_span = json.loads(line)
+            except ValueError:
+                continue
+            durations[recorded_span["name"]].append(recorded_span["duration"])
+    rows = []
+    for name, phase_durations in durations.items():
+        phase_durations.sort()
+        rows.append((
+            name,
+            len(phase_durations),
+            _percentile(phase_durations, 50),
+            _percentile(phase_durations, 95),
+            phase_durations[-1],
+        ))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+def main():
+    """
+    Print the duration percentiles per phase.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", default=TRACES_FILE_PATH)
+    args = parser.parse_args()
+
+    print(f"{'phase':<40} {'count':>7} {'p50 s':>9} {'p95 s':>9} {'max s':>9}")
+    for name, count, p50, p95, maximum in summary(args.file):
+        print(f"{name:<40} {count:>7} {p50:>9.3f} {p95:>9.3f} {maximum:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
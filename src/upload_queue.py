@@ -0,0 +1,223 @@
+"""
+Persistent queue of upload jobs.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_COLUMNS = (
+    "id", "job_key", "file_path", "file_name", "file_size", "media_type", "date",
+    "username", "first_name", "last_name", "channel", "file_unique_id", "media_group_id",
+    "status_message_id", "status", "attempts", "next_attempt", "error"
+)
+
+
+class UploadQueue:
+    """
+    Upload jobs stored in a SQLite database, so they survive restarts of the bot.
+    A job is identified by its job key, enqueueing the same message twice adds one job.
+    """
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_key TEXT NOT NULL UNIQUE,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_size INTEGER NOT NULL DEFAULT 0,
+                    media_type INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    channel TEXT,
+                    file_unique_id TEXT,
+                    media_group_id TEXT,
+                    status_message_id INTEGER,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated REAL NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_media_group ON jobs (media_group_id)"
+            )
+
+    def enqueue(self, job: dict) -> bool:
+        """
+        Add a job to the queue. A job with next_attempt is held back until that time.
+        Returns: False if a job with the same job key was already enqueued
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                """INSERT OR IGNORE INTO jobs (
+                    job_key, file_path, file_name, file_size, media_type, date,
+                    username, first_name, last_name, channel, file_unique_id, media_group_id,
+                    status_message_id, status, next_attempt, updated
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    job["job_key"], job["file_path"], job["file_name"], job.get("file_size", 0),
+                    job["media_type"], job["date"], job.get("username"), job.get("first_name"),
+                    job.get("last_name"), job.get("channel"), job.get("file_unique_id"),
+                    job.get("media_group_id"), job.get("status_message_id"), PENDING,
+                    job.get("next_attempt", 0), time.time()
+                )
+            )
+        if cursor.rowcount == 0:
+            logging.info("Upload job %s is already enqueued", job["job_key"])
+            return False
+        logging.info("Enqueued upload job %s", job["job_key"])
+        return True
+
+    def recover(self):
+        """
+        Reset jobs which were running when the bot stopped, so they are uploaded again.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status=?, updated=? WHERE status=?",
+                (PENDING, time.time(), RUNNING)
+            )
+        if cursor.rowcount:
+            logging.warning("Recovered %d interrupted upload jobs", cursor.rowcount)
+
+    def claim(self, choose: Callable[[list], dict] = None) -> dict:
+        """
+        Mark a due job as running.
+        Args: Function choosing the job from the list of due jobs, defaults to the oldest job
+        Returns: The job as dictionary or None if no job is due
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs \
+                    WHERE status=? AND next_attempt<=? ORDER BY id",
+                (PENDING, time.time())
+            ).fetchall()
+            if not rows:
+                return None
+            jobs = [dict(zip(_COLUMNS, row)) for row in rows]
+            job = jobs[0] if choose is None else choose(jobs)
+            self._connection.execute(
+                "UPDATE jobs SET status=?, attempts=attempts+1, updated=? WHERE id=?",
+                (RUNNING, time.time(), job["id"])
+            )
+        job["attempts"] += 1
+        return job
+
+    def depth(self) -> int:
+        """
+        Returns: Number of jobs waiting to be uploaded
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status=?", (PENDING,)
+            ).fetchone()[0]
+
+    def next_attempt(self) -> float:
+        """
+        Returns: Time of the next pending job or None if there are no pending jobs
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MIN(next_attempt) FROM jobs WHERE status=?", (PENDING,)
+            ).fetchone()
+        return row[0]
+
+    def album(self, media_group_id: str) -> list:
+        """
+        Returns: All jobs of the album with the media group id
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE media_group_id=? ORDER BY id",
+                (media_group_id,)
+            ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def hold_album(self, media_group_id: str, until: float):
+        """
+        Hold back the jobs of an album which were not tried yet until the time.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET next_attempt=? WHERE media_group_id=? AND status=? AND attempts=0",
+                (until, media_group_id, PENDING)
+            )
+
+    def is_file_needed(self, file_path: str) -> bool:
+        """
+        Returns: True if a job which is not finished uploads the file
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM jobs WHERE file_path=? AND status IN (?, ?) LIMIT 1",
+                (file_path, PENDING, RUNNING)
+            ).fetchone()
+        return row is not None
+
+    def recent_senders(self, since: float) -> list:
+        """
+        Returns: Distinct channel and username pairs of the jobs enqueued or updated since
+        the time, limited by the age of the purged jobs
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT DISTINCT channel, username FROM jobs \
+                    WHERE updated>=? AND channel IS NOT NULL AND username IS NOT NULL \
+                    ORDER BY channel, username",
+                (since,)
+            ).fetchall()
+
+    def complete(self, job_id: int):
+        """
+        Mark a job as uploaded.
+        """
+        self._set_status(job_id, DONE, None)
+
+    def retry(self, job_id: int, error: str, delay: float):
+        """
+        Put a job back into the queue to be tried again after the delay in seconds.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status=?, error=?, next_attempt=?, updated=? WHERE id=?",
+                (PENDING, error, time.time() + delay, time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str):
+        """
+        Mark a job as failed. It is not tried again.
+        """
+        self._set_status(job_id, FAILED, error)
+
+    def _set_status(self, job_id: int, status: str, error: str):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status=?, error=?, updated=? WHERE id=?",
+                (status, error, time.time(), job_id)
+            )
+
+    def purge(self, max_age: float):
+        """
+        Delete finished jobs older than max_age seconds.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated<?",
+                (DONE, FAILED, time.time() - max_age)
+            )
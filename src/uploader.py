@@ -0,0 +1,439 @@
+"""
+Workers which upload the jobs of the upload queue to google drive.
+"""
+import asyncio
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from typing import Awaitable, Callable
+
+# pylint: disable=import-error
+import httplib2
+import httpx
+from googleapiclient.errors import HttpError
+import pytz
+from telegram.error import TelegramError
+
+from enums import FileCleanup, Media, TickerbieneMode
+from location_clusters import LocationClusters
+from scheduler import UploadScheduler
+from upload_queue import DONE, FAILED, UploadQueue
+import async_drive
+import drive
+import exif
+import maps
+import metrics
+import renditions
+import tracing
+
+UPLOAD_QUEUE_FILE_PATH = "var/upload_queue.db"
+UPLOAD_WORKERS = drive.config.get("UPLOAD_WORKERS", 2)
+MAX_ATTEMPTS = drive.config.get("UPLOAD_MAX_ATTEMPTS", 5)
+RETRY_DELAY = drive.config.get("UPLOAD_RETRY_DELAY_SECONDS", 30)
+MAX_RETRY_DELAY = 60 * 60
+# Finished jobs are kept, so a message delivered again is not uploaded twice.
+FINISHED_JOB_MAX_AGE = 7 * 24 * 60 * 60
+# Videos up to this size are uploaded with the same priority as images.
+SMALL_FILE_SIZE = drive.config.get("UPLOAD_SMALL_FILE_SIZE_MB", 50) * 1024 * 1024
+# Idle workers look for due jobs at least this often.
+IDLE_INTERVAL = 5
+# Uploaded files are removed from the telegram-bot-api volume, so it does not fill the disk.
+FILE_CLEANUP = FileCleanup(drive.config.get("BOT_API_FILE_CLEANUP", FileCleanup.KEEP.value))
+FILE_ARCHIVE_PATH = drive.config.get("BOT_API_FILE_ARCHIVE_PATH", "var/uploaded")
+# Capture time and GPS position are read from the file headers in this many processes,
+# 0 uploads the files without them.
+METADATA_WORKERS = drive.config.get("METADATA_WORKERS", 1)
+# Files with a GPS position go to the folder of their location cluster instead of the channel.
+LOCATION_ROUTING = drive.config.get("LOCATION_ROUTING", False) and METADATA_WORKERS > 0
+# Renditions for the Tickerbiene folders are rendered in this many processes,
+# each using one CPU core.
+RENDITION_CPUS = drive.config.get("RENDITION_CPUS", 1)
+RENDITION_PATH = "var/renditions"
+RENDITION_MAX_SIZE = drive.config.get("RENDITION_MAX_SIZE", 1280)
+RENDITION_IMAGE_QUALITY = drive.config.get("RENDITION_IMAGE_QUALITY", 80)
+RENDITION_VIDEO_CRF = drive.config.get("RENDITION_VIDEO_CRF", 28)
+# The upload waits this long for the rendition once the original is stored, then copies
+# the original, so a small file does not wait behind the transcodes of earlier videos.
+RENDITION_TIMEOUT = drive.config.get("RENDITION_TIMEOUT_SECONDS", 30)
+# Renditions run with a lower priority than the bot and the uploads.
+RENDITION_NICENESS = 10
+
+upload_queue = UploadQueue(UPLOAD_QUEUE_FILE_PATH)
+upload_scheduler = UploadScheduler(SMALL_FILE_SIZE)
+metrics.UPLOADS_IN_FLIGHT.set_function(lambda: sum(upload_scheduler.in_flight.values()))
+metrics.UPLOAD_QUEUE_DEPTH.set_function(upload_queue.depth)
+_wakeup = asyncio.Event()
+_workers = []
+_metadata_executor = None
+_rendition_executor = None
+location_clusters = LocationClusters(
+    drive.config.get("LOCATION_CLUSTER_METRES", 500),
+    drive.config.get("LOCATION_CLUSTER_WINDOW_HOURS", 3) * 60 * 60
+)
+
+def wake():
+    """
+    Wake up idle workers after a job was enqueued.
+    """
+    _wakeup.set()
+
+def stats() -> dict:
+    """
+    Returns: Number of queued jobs, running jobs and running jobs per channel
+    """
+    return {
+        "queued": upload_queue.depth(),
+        "in_flight": sum(upload_scheduler.in_flight.values()),
+        "in_flight_per_channel": dict(upload_scheduler.in_flight),
+    }
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    # Jitter, so failed jobs do not all retry at the same moment.
+    return delay * random.uniform(0.5, 1)
+
+async def _wait_for_job():
+    next_attempt = upload_queue.next_attempt()
+    timeout = IDLE_INTERVAL
+    if next_attempt is not None:
+        timeout = min(max(next_attempt - time.time(), 0), IDLE_INTERVAL)
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+async def _upload(job: dict, on_progress: Callable[[dict, int, int], None]):
+    with tracing.span(
+            "upload_job", trace_key=job["job_key"], job_key=job["job_key"],
+            attempt=job["attempts"], file_size=job["file_size"], media_type=job["media_type"]
+        ):
+        await _upload_job(job, on_progress)
+
+async def _read_metadata(file_path: str) -> dict:
+    """
+    Read the capture time and GPS position of a file in the metadata processes.
+    Returns: The metadata, see exif.read_metadata, empty if the file has none
+    """
+    if _metadata_executor is None:
+        return {}
+    with tracing.span("read_metadata"):
+        try:
+            metadata = await asyncio.get_running_loop().run_in_executor(
+                _metadata_executor, exif.read_metadata, file_path
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            # The metadata is optional, it never fails the upload. A missing
+            # file is reported by the upload itself.
+            logging.warning("Could not read the metadata of %s: %r", file_path, error)
+            return {}
+    return metadata
+
+def _start_rendition(job: dict) -> Future:
+    """
+    Start rendering the Tickerbiene rendition of a file in the rendition processes,
+    so it is rendered while the original is uploaded.
+    Returns: Future of the rendition, see renditions.render, or None without renditions
+    """
+    if _rendition_executor is None:
+        return None
+    try:
+        return _rendition_executor.submit(
+            renditions.render, job["file_path"], job["media_type"], RENDITION_PATH,
+            RENDITION_MAX_SIZE, RENDITION_IMAGE_QUALITY, RENDITION_VIDEO_CRF
+        )
+    except (RuntimeError, BrokenProcessPool) as error:
+        logging.warning("Could not start the rendition of %s: %s", job["job_key"], error)
+        return None
+
+def _rendition_result(job: dict, rendition: Future) -> dict:
+    """
+    Wait for the rendition of a file in a drive thread and report the bytes saved
+    and the CPU time. The original is already stored, so any error of the rendition
+    only falls back to the copy.
+    Returns: The rendition or None if the file is copied instead
+    """
+    try:
+        result = rendition.result(timeout=RENDITION_TIMEOUT)
+    except FutureTimeoutError:
+        logging.warning("Rendition of %s is not finished after %d seconds, copy the original",
+            job["job_key"], RENDITION_TIMEOUT)
+        return None
+    except Exception as error:  # pylint: disable=broad-except
+        logging.warning("Could not render %s: %r", job["job_key"], error)
+        return None
+    if result is not None:
+        media = metrics.labels(job["media_type"], job["channel"])["media"]
+        saved_bytes = result["original_size"] - result["size"]
+        logging.info("Rendition of %s has %d of %d bytes, saved %d bytes in %.2f CPU seconds",
+            job["job_key"], result["size"], result["original_size"], saved_bytes,
+            result["cpu_seconds"])
+        metrics.RENDITION_SAVED_BYTES.labels(media).inc(saved_bytes)
+        metrics.RENDITION_CPU_SECONDS.labels(media).observe(result["cpu_seconds"])
+    return result
+
+def _remove_rendition(rendition: Future):
+    """
+    Remove the file of a finished rendition after the upload.
+    """
+    if rendition.cancelled() or rendition.exception() is not None:
+        return
+    result = rendition.result()
+    if result is not None:
+        try:
+            os.remove(result["file_path"])
+        except OSError as error:
+            logging.warning("Could not remove rendition %s: %s", result["file_path"], error)
+
+async def _name_location(job: dict, metadata: dict) -> str:
+    """
+    Assign a file with a GPS position to its location cluster.
+    The cluster is named after the place of its first position, or after the channel
+    and the geohash of the position if the place is unknown.
+    Returns: The name of the location folder or None for the channel folder
+    """
+    if "latitude" not in metadata:
+        return None
+    date = datetime.fromisoformat(job["date"])
+    day = date.astimezone(pytz.timezone(drive.config["TIMEZONE"])).date().isoformat()
+    cluster = location_clusters.assign(
+        day, date.timestamp(), metadata["latitude"], metadata["longitude"]
+    )
+    if cluster.name is None:
+        try:
+            name = await maps.geocoder.reverse(cluster.latitude, cluster.longitude)
+        except httpx.HTTPError as error:
+            logging.warning("Could not geocode the location of %s: %s", job["job_key"], error)
+            name = ""
+        name = name or f"{job['channel']} {maps.geohash(cluster.latitude, cluster.longitude, 6)}"
+        # Another worker may have named the cluster in the meantime.
+        cluster.name = cluster.name or name
+    return cluster.name
+
+async def _upload_job(job: dict, on_progress: Callable[[dict, int, int], None]):
+    progress = None
+    if on_progress is not None and job["status_message_id"] is not None:
+        loop = asyncio.get_running_loop()
+
+        def report_progress(bytes_sent: int, total_bytes: int):
+            # Called in a drive thread, the report runs in the event loop.
+            loop.call_soon_threadsafe(on_progress, job, bytes_sent, total_bytes)
+        progress = report_progress
+    date = datetime.fromisoformat(job["date"])
+    rendition = _start_rendition(job)
+    try:
+        await _store_job(job, date, progress, rendition)
+    finally:
+        if rendition is not None:
+            # A rendition which is still running is removed once it is finished.
+            rendition.cancel()
+            rendition.add_done_callback(_remove_rendition)
+
+async def _store_job(
+        job: dict,
+        date: datetime,
+        progress: Callable[[int, int], None],
+        rendition: Future
+    ):
+    if LOCATION_ROUTING:
+        metadata = await _read_metadata(job["file_path"])
+        protest_folders = await async_drive.manage_folder(
+            date, job["username"], job["channel"], await _name_location(job, metadata)
+        )
+    else:
+        # The headers are parsed while the folder is resolved.
+        protest_folders, metadata = await asyncio.gather(
+            async_drive.manage_folder(date, job["username"], job["channel"]),
+            _read_metadata(job["file_path"])
+        )
+    media = metrics.labels(job["media_type"], job["channel"])["media"]
+    start_time = time.perf_counter()
+    await async_drive.upload_file_to_folder(
+        job["file_name"], job["file_path"], protest_folders, Media(job["media_type"]),
+        progress=progress, job_key=job["job_key"], check_uploaded=job["attempts"] > 1,
+        file_unique_id=job["file_unique_id"], app_properties=exif.app_properties(metadata),
+        rendition=functools.partial(_rendition_result, job, rendition)
+            if rendition is not None else None
+    )
+    duration = time.perf_counter() - start_time
+    metrics.UPLOAD_SECONDS.labels(media).observe(duration)
+    if duration > 0:
+        metrics.UPLOAD_THROUGHPUT.labels(media).observe(job["file_size"] / duration)
+
+def _clean_up_file(job: dict):
+    """
+    Delete or move the file of an uploaded job, unless another job still uploads it.
+    Failed jobs keep their file.
+    """
+    file_path = job["file_path"]
+    if FILE_CLEANUP is FileCleanup.KEEP or upload_queue.is_file_needed(file_path):
+        return
+    try:
+        if FILE_CLEANUP is FileCleanup.DELETE:
+            os.remove(file_path)
+            logging.info("Deleted uploaded file %s", file_path)
+        else:
+            os.makedirs(FILE_ARCHIVE_PATH, exist_ok=True)
+            archive_path = os.path.join(
+                FILE_ARCHIVE_PATH,
+                f"{job['job_key'].replace(':', '_')}_{os.path.basename(file_path)}"
+            )
+            shutil.move(file_path, archive_path)
+            logging.info("Moved uploaded file %s to %s", file_path, archive_path)
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        logging.warning("Could not clean up uploaded file %s: %s", file_path, error)
+
+async def _report(
+        job: dict,
+        error: Exception,
+        on_failure: Callable[[dict, Exception], Awaitable[None]],
+        on_album_failure: Callable[[list, list], Awaitable[None]]
+    ):
+    """
+    Report a job which failed for good. Jobs of an album are reported together
+    once every job of the album is finished. A report which cannot be sent is only
+    logged, so it does not end the worker.
+    """
+    if job["media_group_id"] is None:
+        if error is not None:
+            try:
+                await on_failure(job, error)
+            except TelegramError as report_error:
+                logging.error("Could not report the failed upload job %s: %s",
+                    job["job_key"], report_error)
+        return
+    # No await before this check, so only the worker finishing the last job reports.
+    album = upload_queue.album(job["media_group_id"])
+    if any(member["status"] not in (DONE, FAILED) for member in album):
+        return
+    failed = [member for member in album if member["status"] == FAILED]
+    logging.info("Finished album %s, %d of %d files failed",
+        job["media_group_id"], len(failed), len(album))
+    if failed:
+        try:
+            await on_album_failure(album, failed)
+        except TelegramError as report_error:
+            logging.error("Could not report the failed album %s: %s",
+                job["media_group_id"], report_error)
+
+async def _retry_or_fail(
+        job: dict,
+        error: Exception,
+        on_failure: Callable[[dict, Exception], Awaitable[None]],
+        on_album_failure: Callable[[list, list], Awaitable[None]]
+    ):
+    """
+    Retry a failed job later with backoff, or fail it for good after MAX_ATTEMPTS.
+    """
+    if job["attempts"] >= MAX_ATTEMPTS:
+        logging.error("Upload job %s failed after %d attempts: %s",
+            job["job_key"], job["attempts"], error)
+        upload_queue.fail(job["id"], str(error))
+        metrics.FILES_FAILED.labels(**metrics.labels(job["media_type"], job["channel"])).inc()
+        await _report(job, error, on_failure, on_album_failure)
+    else:
+        delay = _retry_delay(job["attempts"])
+        logging.warning("Upload job %s failed, retry in %.0f seconds: %s",
+            job["job_key"], delay, error)
+        upload_queue.retry(job["id"], str(error), delay)
+
+async def _work(
+        on_failure: Callable[[dict, Exception], Awaitable[None]],
+        on_album_failure: Callable[[list, list], Awaitable[None]],
+        on_progress: Callable[[dict, int, int], None],
+        on_saved: Callable[[dict], Awaitable[None]]
+    ):
+    while True:
+        _wakeup.clear()
+        job = upload_queue.claim(upload_scheduler.choose)
+        if job is None:
+            await _wait_for_job()
+            continue
+        upload_scheduler.started(job)
+        logging.info("Start upload job %s attempt %d, %s",
+            job["job_key"], job["attempts"], stats())
+        try:
+            await _upload(job, on_progress)
+        except (FileNotFoundError, TypeError) as error:
+            logging.error("Upload job %s failed: %s", job["job_key"], error)
+            upload_queue.fail(job["id"], str(error))
+            metrics.FILES_FAILED.labels(**metrics.labels(job["media_type"], job["channel"])).inc()
+            await _report(job, error, on_failure, on_album_failure)
+        except (HttpError, httplib2.HttpLib2Error, OSError) as error:
+            await _retry_or_fail(job, error, on_failure, on_album_failure)
+        except Exception as error:  # pylint: disable=broad-except
+            # An unexpected error must not end the worker, the job counts an attempt.
+            logging.exception("Upload job %s failed unexpectedly", job["job_key"])
+            await _retry_or_fail(job, error, on_failure, on_album_failure)
+        else:
+            logging.info("Finished upload job %s", job["job_key"])
+            upload_queue.complete(job["id"])
+            _clean_up_file(job)
+            # Before any other await, so only one worker sees its album as finished.
+            await _report(job, None, on_failure, on_album_failure)
+            # Also reused or copied content and files of an earlier attempt, which
+            # report no upload progress, finish their status message.
+            if on_saved is not None and job["status_message_id"] is not None:
+                await on_saved(job)
+            metrics.FILES_UPLOADED.labels(**metrics.labels(job["media_type"], job["channel"])).inc()
+        finally:
+            upload_scheduler.finished(job)
+
+def start(
+        on_failure: Callable[[dict, Exception], Awaitable[None]],
+        on_album_failure: Callable[[list, list], Awaitable[None]],
+        on_progress: Callable[[dict, int, int], None] = None,
+        on_saved: Callable[[dict], Awaitable[None]] = None
+    ):
+    """
+    Recover interrupted jobs and start the upload workers.
+    Args: Coroutine function called with the job and the error if a job failed for good,
+    coroutine function called with the jobs and the failed jobs of an album once it is finished,
+    function called with the job, the bytes sent and the total bytes during uploads of
+    jobs with a status message and coroutine function called with an uploaded job
+    which has a status message
+    """
+    global _metadata_executor, _rendition_executor  # pylint: disable=global-statement
+    upload_queue.recover()
+    upload_queue.purge(FINISHED_JOB_MAX_AGE)
+    if METADATA_WORKERS and _metadata_executor is None:
+        _metadata_executor = ProcessPoolExecutor(
+            METADATA_WORKERS, mp_context=multiprocessing.get_context("fork")
+        )
+        # Fork the processes now, before the drive threads are running.
+        _metadata_executor.submit(int)
+    if drive.TICKERBIENE_MODE is TickerbieneMode.RENDITION and RENDITION_CPUS \
+            and _rendition_executor is None:
+        os.makedirs(RENDITION_PATH, exist_ok=True)
+        _rendition_executor = ProcessPoolExecutor(
+            RENDITION_CPUS, mp_context=multiprocessing.get_context("fork"),
+            initializer=os.nice, initargs=(RENDITION_NICENESS,)
+        )
+        _rendition_executor.submit(int)
+    for _ in range(UPLOAD_WORKERS):
+        _workers.append(asyncio.create_task(_work(on_failure, on_album_failure, on_progress, on_saved)))
+    logging.info("Started %d upload workers", UPLOAD_WORKERS)
+
+async def stop():
+    """
+    Stop the upload workers. Running jobs are uploaded again after the next start.
+    """
+    global _metadata_executor, _rendition_executor  # pylint: disable=global-statement
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if _metadata_executor is not None:
+        _metadata_executor.shutdown(cancel_futures=True)
+        _metadata_executor = None
+    if _rendition_executor is not None:
+        _rendition_executor.shutdown(cancel_futures=True)
+        _rendition_executor = None